@@ -1,5 +1,104 @@
 from django.contrib import admin
-from .models import User, Product, CartItem, Order, OrderItem, Payment
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .analytics import reverse_sale, sync_order_sales
+from .models import User, Product, CartItem, Order, OrderItem, Payment, StockReservation, Task
+
+
+# ============================
+# Admin performance mode
+# ============================
+# The marketplace tables grow to millions of rows, so every changelist:
+# - joins the foreign keys it displays (list_select_related),
+# - never runs an exact COUNT(*) over a whole table (EstimatedCountPaginator,
+#   show_full_result_count = False),
+# - narrows by date with date_hierarchy instead of paging deep,
+# - searches only through indexes (see MarketplaceAdmin.get_search_results),
+# - edits foreign keys with raw-id widgets instead of <select>s of every row.
+ESTIMATE_CAP = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts a filtered changelist only up to ESTIMATE_CAP rows past the page
+    being viewed, and an unfiltered one from the table's statistics
+    (PostgreSQL) or its highest primary key (elsewhere), so a page load never
+    counts millions of rows but the last page link always leads on while
+    there are more.
+    """
+
+    def __init__(self, *args, current_page=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.current_page = current_page
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = self.current_page * self.per_page + ESTIMATE_CAP
+        if not queryset.query.where:
+            estimate = self._table_estimate(queryset)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return queryset.order_by()[:limit].count()
+
+    @staticmethod
+    def _table_estimate(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            # -1 until the table was first analyzed
+            if row and row[0] >= 0:
+                return row[0]
+            return None
+        return queryset.aggregate(highest=Max('pk'))['highest'] or 0
+
+
+class MarketplaceAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    # get_search_results() picks one indexed lookup for the search term: an
+    # email is matched exactly against search_user_fields, a number against
+    # search_pk_field, and anything else as a prefix of search_prefix_field
+    # (a range on its index). search_fields only switches the search box on
+    # and describes what it matches.
+    search_user_fields = ()
+    search_pk_field = 'pk'
+    search_prefix_field = None
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        try:
+            current_page = max(int(request.GET.get(PAGE_VAR, 1)), 1)
+        except ValueError:
+            current_page = 1
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page,
+                              current_page=current_page)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if '@' in term and self.search_user_fields:
+            users = User.objects.filter(email=User.objects.normalize_email(term)).values('pk')
+            matches = Q()
+            for field in self.search_user_fields:
+                matches |= Q(**{f'{field}__in': users})
+            return queryset.filter(matches), False
+        if term.isdigit() and self.search_pk_field:
+            return queryset.filter(**{self.search_pk_field: int(term)}), False
+        if self.search_prefix_field:
+            field = self.search_prefix_field
+            # Case-sensitive, but a plain b-tree range scan on every backend
+            return queryset.filter(**{f'{field}__gte': term, f'{field}__lt': term + '\U0010ffff'}), False
+        return queryset.none(), False
 
 
 @admin.register(User)
@@ -10,39 +109,109 @@ class UserAdmin(admin.ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(MarketplaceAdmin):
     list_display = ('name', 'farmer', 'price', 'quantity', 'location', 'created_at')
-    search_fields = ('name', 'farmer__email', 'location')
-    list_filter = ('location', 'created_at')
+    list_select_related = ('farmer',)
+    search_fields = ('^name', '=farmer__email')
+    search_user_fields = ('farmer',)
+    search_prefix_field = 'name'
+    date_hierarchy = 'created_at'
+    raw_id_fields = ('farmer',)
 
 
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(MarketplaceAdmin):
     list_display = ('user', 'product', 'quantity', 'added_at')
-    search_fields = ('user__email', 'product__name')
+    # Product.__str__ shows the farmer's email
+    list_select_related = ('user', 'product__farmer')
+    search_fields = ('=user__email', '^product__name')
+    search_user_fields = ('user',)
+    search_prefix_field = 'product__name'
+    date_hierarchy = 'added_at'
+    raw_id_fields = ('user', 'product')
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(MarketplaceAdmin):
+    list_display = ('user', 'product', 'quantity', 'expires_at')
+    list_select_related = ('user', 'product__farmer')
+    search_fields = ('=user__email', '^product__name')
+    search_user_fields = ('user',)
+    search_prefix_field = 'product__name'
+    raw_id_fields = ('user', 'product')
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(MarketplaceAdmin):
     list_display = ('transaction_id', 'buyer', 'amount', 'status', 'created_at')
-    list_filter = ('status', 'created_at')
-    search_fields = ('transaction_id', 'buyer__email')
+    list_filter = ('status',)
+    list_select_related = ('buyer',)
+    search_fields = ('^transaction_id', '=buyer__email')
+    search_user_fields = ('buyer',)
+    search_prefix_field = 'transaction_id'
+    date_hierarchy = 'created_at'
+    raw_id_fields = ('buyer',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # A payment marked paid (or no longer paid) changes its orders' sales
+        for order in obj.order_set.select_related('payment'):
+            sync_order_sales(order)
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    raw_id_fields = ('product',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product__farmer')
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(MarketplaceAdmin):
     list_display = ('id', 'consumer', 'total_amount', 'status', 'created_at')
-    list_filter = ('status', 'created_at')
-    search_fields = ('consumer__email',)
+    list_filter = ('status',)
+    list_select_related = ('consumer',)
+    search_fields = ('=id', '=consumer__email')
+    search_user_fields = ('consumer',)
+    date_hierarchy = 'created_at'
+    raw_id_fields = ('consumer', 'payment')
     inlines = [OrderItemInline]
 
+    def save_model(self, request, obj, form, change):
+        # Take the order out of the sales rollups with its old items; it is
+        # added back with the saved ones in save_related()
+        if change:
+            reverse_sale(obj)
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        sync_order_sales(form.instance)
+
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(MarketplaceAdmin):
     list_display = ('order', 'product', 'quantity', 'price')
-    search_fields = ('order__id', 'product__name')
+    list_select_related = ('order__consumer', 'product__farmer')
+    search_fields = ('=order__id', '^product__name')
+    search_pk_field = 'order_id'
+    search_prefix_field = 'product__name'
+    date_hierarchy = 'order__created_at'
+    raw_id_fields = ('order', 'product')
+
+
+@admin.register(Task)
+class TaskAdmin(MarketplaceAdmin):
+    list_display = ('name', 'status', 'priority', 'attempts', 'max_attempts', 'run_at', 'locked_by')
+    list_filter = ('status', 'name')
+    search_fields = ('^name',)
+    search_prefix_field = 'name'
+    readonly_fields = ('attempts', 'locked_by', 'last_error', 'created_at')
+    actions = ['retry_now']
+
+    @admin.action(description="Retry selected tasks now")
+    def retry_now(self, request, queryset):
+        retried = queryset.update(status='queued', run_at=timezone.now(), attempts=0, locked_by='')
+        self.message_user(request, f"{retried} task(s) queued again.")
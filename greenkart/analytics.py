@@ -0,0 +1,167 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import FarmerSalesDaily, Order, OrderItem, ProductSalesDaily
+from .taskqueue import task
+
+
+# ============================
+# Sales rollups
+# ============================
+# An order counts as a sale once its payment is paid (or an order without
+# online payment is marked completed), and stops counting when it is
+# cancelled or deleted. Each change is applied to the daily rollups as a
+# delta: two statements per rollup table, however many lines the order has.
+# Order.counted_in_sales records whether the order is currently included, so
+# applying the same change twice is a no-op.
+def is_sale(order):
+    if order.status == 'cancelled':
+        return False
+    return order.status == 'completed' or (order.payment_id is not None and order.payment.status == 'paid')
+
+
+SALE_Q = ~Q(status='cancelled') & (Q(status='completed') | Q(payment__status='paid'))
+
+
+def sync_order_sales(order):
+    """Add ``order`` to, or remove it from, the rollups to match its status."""
+    if is_sale(order):
+        return record_sale(order)
+    return reverse_sale(order)
+
+
+@task()
+def update_sales(order_id):
+    """Background version of sync_order_sales(), queued after checkout."""
+    order = Order.objects.select_related('payment').filter(pk=order_id).first()
+    if order is not None:
+        sync_order_sales(order)
+
+
+def record_sale(order):
+    with transaction.atomic():
+        flipped = Order.objects.filter(pk=order.pk, counted_in_sales=False).update(counted_in_sales=True)
+        if flipped:
+            _apply(order, sign=1)
+    order.counted_in_sales = True
+    return bool(flipped)
+
+
+def reverse_sale(order):
+    with transaction.atomic():
+        flipped = Order.objects.filter(pk=order.pk, counted_in_sales=True).update(counted_in_sales=False)
+        if flipped:
+            _apply(order, sign=-1)
+    order.counted_in_sales = False
+    return bool(flipped)
+
+
+def _apply(order, sign):
+    # The stored date: the admin may be saving a new one
+    day = timezone.localdate(Order.objects.values_list('created_at', flat=True).get(pk=order.pk))
+    lines = OrderItem.objects.filter(order=order).values_list('product_id', 'product__farmer_id', 'quantity', 'price')
+
+    by_product = {}
+    by_farmer = defaultdict(lambda: [0, Decimal('0.00')])
+    for product_id, farmer_id, quantity, price in lines:
+        by_product[product_id] = (farmer_id, quantity, price * quantity)
+        by_farmer[farmer_id][0] += quantity
+        by_farmer[farmer_id][1] += price * quantity
+    if not by_product:
+        return
+
+    # Make sure every row exists, then add the deltas in one UPDATE
+    ProductSalesDaily.objects.bulk_create(
+        [ProductSalesDaily(product_id=pk, farmer_id=farmer_id, day=day) for pk, (farmer_id, _, _) in by_product.items()],
+        ignore_conflicts=True,
+    )
+    ProductSalesDaily.objects.filter(day=day, product_id__in=by_product).update(
+        units_sold=F('units_sold') + _per('product_id', {pk: sign * row[1] for pk, row in by_product.items()}),
+        revenue=F('revenue') + _per('product_id', {pk: sign * row[2] for pk, row in by_product.items()}, money=True),
+        order_count=F('order_count') + sign,
+    )
+
+    FarmerSalesDaily.objects.bulk_create(
+        [FarmerSalesDaily(farmer_id=farmer_id, day=day) for farmer_id in by_farmer],
+        ignore_conflicts=True,
+    )
+    FarmerSalesDaily.objects.filter(day=day, farmer_id__in=by_farmer).update(
+        units_sold=F('units_sold') + _per('farmer_id', {pk: sign * row[0] for pk, row in by_farmer.items()}),
+        revenue=F('revenue') + _per('farmer_id', {pk: sign * row[1] for pk, row in by_farmer.items()}, money=True),
+        order_count=F('order_count') + sign,
+    )
+
+    if sign < 0:
+        # Days whose last order was cancelled
+        ProductSalesDaily.objects.filter(day=day, product_id__in=by_product, order_count=0).delete()
+        FarmerSalesDaily.objects.filter(day=day, farmer_id__in=by_farmer, order_count=0).delete()
+
+
+def _per(field, values, money=False):
+    output_field = DecimalField(max_digits=12, decimal_places=2) if money else IntegerField()
+    return Case(*[When(**{field: key}, then=value) for key, value in values.items()], output_field=output_field)
+
+
+def rebuild_rollups():
+    """
+    Recompute both rollup tables and every order's counted_in_sales flag
+    from the order history. Returns (product rows, farmer rows).
+    """
+    with transaction.atomic():
+        Order.objects.filter(SALE_Q, counted_in_sales=False).update(counted_in_sales=True)
+        Order.objects.exclude(SALE_Q).filter(counted_in_sales=True).update(counted_in_sales=False)
+        ProductSalesDaily.objects.all().delete()
+        FarmerSalesDaily.objects.all().delete()
+
+        # TruncDate uses the current time zone, like timezone.localdate()
+        sold = OrderItem.objects.filter(order__counted_in_sales=True).annotate(day=TruncDate('order__created_at'))
+        totals = {
+            'units': Sum('quantity'),
+            'amount': Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            'orders': Count('order', distinct=True),
+        }
+        daily = list(sold.values('product_id', 'product__farmer_id', 'day').annotate(**totals).order_by())
+        farmers = list(sold.values('product__farmer_id', 'day').annotate(**totals).order_by())
+
+        ProductSalesDaily.objects.bulk_create([
+            ProductSalesDaily(product_id=row['product_id'], farmer_id=row['product__farmer_id'], day=row['day'],
+                              units_sold=row['units'], revenue=row['amount'], order_count=row['orders'])
+            for row in daily
+        ], batch_size=1000)
+        FarmerSalesDaily.objects.bulk_create([
+            FarmerSalesDaily(farmer_id=row['product__farmer_id'], day=row['day'],
+                             units_sold=row['units'], revenue=row['amount'], order_count=row['orders'])
+            for row in farmers
+        ], batch_size=1000)
+    return len(daily), len(farmers)
+
+
+# ============================
+# Farmer analytics
+# ============================
+def farmer_sales(farmer, days=30):
+    """Totals, per-day series and per-product totals for the last ``days`` days."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    daily = list(
+        FarmerSalesDaily.objects.filter(farmer=farmer, day__gte=since).order_by('-day')
+    )
+    products = list(
+        ProductSalesDaily.objects.filter(farmer=farmer, day__gte=since)
+        .values('product_id', 'product__name')
+        .annotate(units=Sum('units_sold'), revenue=Sum('revenue'), orders=Sum('order_count'))
+        .order_by('-revenue')
+    )
+    return {
+        'since': since,
+        'daily': daily,
+        'products': products,
+        'units_sold': sum(day.units_sold for day in daily),
+        'revenue': sum((day.revenue for day in daily), Decimal('0.00')),
+        'order_count': sum(day.order_count for day in daily),
+    }
@@ -0,0 +1,335 @@
+import json
+from decimal import Decimal
+from functools import wraps
+
+from django.contrib.auth import authenticate, login, logout
+from django.db.models import ExpressionWrapper, F, IntegerField, Sum
+from django.http import JsonResponse
+from django.views.decorators.csrf import ensure_csrf_cookie
+
+from .cart import CENT, LINE_TOTAL, add_item, cart_lines, flush_cart, remove_item
+from .checkout import pay_and_place_order
+from .exceptions import CheckoutError, InsufficientStockError
+from .facets import filter_products, parse_filters
+from .models import CartItem, Order, OrderItem, Product
+from .pagination import clamp_page_size, keyset_paginate
+from .reservations import release
+from .routers import read_from_replica
+from .search import filter_matching, next_search_cursor, search_offset, search_product_ids
+from .storage import get_product_image_storage
+
+
+# ============================
+# JSON API (v1)
+# ============================
+# Compact JSON for the mobile app. No templates are rendered and only the
+# columns a response needs are read, with values(): each resource lists its
+# fields as {name: values() lookup or expression}, and ?fields=name,price
+# picks a subset of them (sparse fieldsets). Lists are keyset pages,
+#   {"results": [...], "next": "<cursor>"}  ->  ?cursor=<cursor>
+# Authentication is the site's session: GET session/ sets the CSRF cookie,
+# POST session/ logs in, and unsafe requests send the token back in an
+# X-CSRFToken header. Request bodies may be JSON or form encoded.
+AVAILABLE = ExpressionWrapper(F('quantity') - F('reserved_quantity'), output_field=IntegerField())
+
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'price': 'price',
+    'available': AVAILABLE,
+    'location': 'location',
+    'place': 'place__name',
+    'farmer_id': 'farmer_id',
+    'farmer': 'farmer__name',
+    'image': 'image',
+    'thumbnail': 'image_variants',
+    'created_at': 'created_at',
+}
+# Listed products leave out the long and rarely shown fields by default
+PRODUCT_LIST_FIELDS = ('id', 'name', 'price', 'available', 'location', 'farmer', 'thumbnail')
+
+CART_FIELDS = {
+    'product_id': 'product_id',
+    'name': 'product__name',
+    'price': 'product__price',
+    'quantity': 'quantity',
+    'line_total': 'line_total',
+}
+
+ORDER_FIELDS = {
+    'id': 'id',
+    'status': 'status',
+    'total_amount': 'total_amount',
+    'created_at': 'created_at',
+    'transaction_id': 'payment__transaction_id',
+    'payment_status': 'payment__status',
+}
+
+ORDER_ITEM_FIELDS = {
+    'product_id': 'product_id',
+    'name': 'product__name',
+    'quantity': 'quantity',
+    'price': 'price',
+}
+
+USER_FIELDS = ('id', 'email', 'name', 'role')
+CARD_FIELDS = ('card_name', 'card_number', 'expiry', 'cvv')
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def respond(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def api_view(*methods, auth_required=True):
+    """Allow only ``methods``, require a logged-in user and turn ApiError into a JSON error."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = respond({'error': f"Method {request.method} not allowed."}, status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+            if auth_required and not request.user.is_authenticated:
+                return respond({'error': "Authentication required."}, status=401)
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as exc:
+                return respond({'error': str(exc), **exc.details}, status=exc.status)
+        return wrapper
+    return decorator
+
+
+# ---------------------------
+# Serialisation
+# ---------------------------
+def image_url(name):
+    return get_product_image_storage().url(name) if name else None
+
+
+def thumbnail_url(variants):
+    card = (variants or {}).get('card') or {}
+    return image_url(card.get('webp') or card.get('jpeg'))
+
+
+def money(value):
+    return (value or Decimal('0.00')).quantize(CENT)
+
+
+# Fields whose stored value is not what the client gets
+CONVERTERS = {
+    'image': image_url,
+    'thumbnail': thumbnail_url,
+    'line_total': money,
+}
+
+
+def requested_fields(request, spec, default=None):
+    """The field names asked for with ?fields=, or ``default`` (all of ``spec`` if None)."""
+    names = [name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()]
+    if not names:
+        return list(default or spec)
+    unknown = sorted(set(names) - set(spec))
+    if unknown:
+        raise ApiError(400, f"Unknown field(s): {', '.join(unknown)}.", fields=list(spec))
+    return list(dict.fromkeys(names))
+
+
+def select(queryset, spec, names, extra=()):
+    """queryset.values() reading just the columns behind ``names``, plus the ``extra`` lookups."""
+    lookups = [spec[name] for name in names if isinstance(spec[name], str)]
+    expressions = {name: spec[name] for name in names if not isinstance(spec[name], str)}
+    return queryset.values(*dict.fromkeys([*lookups, *extra]), **expressions)
+
+
+def shape(rows, spec, names):
+    """values() rows as {field name: JSON value} for ``names``."""
+    shaped = []
+    for row in rows:
+        item = {}
+        for name in names:
+            value = row[spec[name] if isinstance(spec[name], str) else name]
+            item[name] = CONVERTERS[name](value) if name in CONVERTERS else value
+        shaped.append(item)
+    return shaped
+
+
+def payload(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise ApiError(400, "Malformed JSON body.")
+        if not isinstance(data, dict):
+            raise ApiError(400, "Expected a JSON object.")
+        return data
+    return request.POST
+
+
+def _integer(data, name):
+    try:
+        return int(data.get(name))
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{name} must be an integer.")
+
+
+def _one(queryset):
+    # [:1] rather than first(), which would add an ORDER BY
+    rows = list(queryset[:1])
+    return rows[0] if rows else None
+
+
+# ---------------------------
+# Session
+# ---------------------------
+@ensure_csrf_cookie
+@api_view('GET', 'POST', 'DELETE', auth_required=False)
+def session(request):
+    if request.method == 'POST':
+        data = payload(request)
+        user = authenticate(request, email=data.get('email'), password=data.get('password'))
+        if user is None:
+            raise ApiError(400, "Invalid email or password.")
+        login(request, user)
+    elif request.method == 'DELETE':
+        logout(request)
+
+    user = request.user
+    return respond({'user': {field: getattr(user, field) for field in USER_FIELDS} if user.is_authenticated else None})
+
+
+# ---------------------------
+# Catalogue
+# ---------------------------
+@read_from_replica
+@api_view('GET')
+def products(request):
+    """Newest first, narrowed by the dashboard's filters; ?q= searches by relevance instead."""
+    names = requested_fields(request, PRODUCT_FIELDS, PRODUCT_LIST_FIELDS)
+    query = request.GET.get('q', '').strip()
+    filters = parse_filters(request.GET)
+    cursor = request.GET.get('cursor')
+    page_size = clamp_page_size(request.GET.get('page_size'))
+    queryset = filter_products(Product.objects.all(), filters)
+
+    if query and not filters:
+        # Ranked, so the cursor is a result offset as on the dashboard
+        offset = search_offset(cursor)
+        ids = search_product_ids(query, limit=page_size + 1, offset=offset, using=queryset.db)
+        found = {row['id']: row for row in select(queryset.filter(pk__in=ids[:page_size]), PRODUCT_FIELDS, names,
+                                                   extra=['id'])}
+        rows = [found[pk] for pk in ids[:page_size] if pk in found]
+        next_cursor = next_search_cursor(offset, page_size, len(ids))
+    else:
+        if query:
+            queryset = filter_matching(queryset, query)
+        page = keyset_paginate(select(queryset, PRODUCT_FIELDS, names, extra=['id', 'created_at']),
+                               cursor=cursor, page_size=page_size)
+        rows, next_cursor = page.items, page.next_cursor
+
+    return respond({'results': shape(rows, PRODUCT_FIELDS, names), 'next': next_cursor})
+
+
+@read_from_replica
+@api_view('GET')
+def product_detail(request, product_id):
+    names = requested_fields(request, PRODUCT_FIELDS)
+    row = _one(select(Product.objects.filter(pk=product_id), PRODUCT_FIELDS, names))
+    if row is None:
+        raise ApiError(404, "Product not found.")
+    return respond(shape([row], PRODUCT_FIELDS, names)[0])
+
+
+# ---------------------------
+# Cart
+# ---------------------------
+def cart_body(request):
+    names = requested_fields(request, CART_FIELDS)
+    flush_cart(request.user.pk)
+    rows = list(select(cart_lines(request.user), CART_FIELDS, names))
+    total = None
+    if rows:
+        total = CartItem.objects.filter(user=request.user).aggregate(total=Sum(LINE_TOTAL))['total']
+    return {'items': shape(rows, CART_FIELDS, names), 'count': len(rows), 'total': money(total)}
+
+
+@api_view('GET', 'POST')
+def cart(request):
+    """GET the cart; POST {"product_id": ...} adds one unit, like the shop's "Add to cart"."""
+    if request.method == 'POST':
+        product_id = _integer(payload(request), 'product_id')
+        product = Product.objects.filter(pk=product_id).values('id', 'quantity').first()
+        if product is None:
+            raise ApiError(404, "Product not found.")
+        add_item(request.user, product['id'], max_quantity=product['quantity'])
+    return respond(cart_body(request))
+
+
+@api_view('DELETE')
+def cart_item(request, product_id):
+    remove_item(request.user, product_id)
+    release(request.user, product_ids=[product_id])
+    return respond(cart_body(request))
+
+
+# ---------------------------
+# Checkout and orders
+# ---------------------------
+@api_view('POST')
+def checkout(request):
+    """Pay (dummy card) for the cart and place the order, as the checkout form does."""
+    data = payload(request)
+    card = {name: str(data.get(name, '')).strip() for name in CARD_FIELDS}
+    missing = [name for name, value in card.items() if not value]
+    if missing:
+        raise ApiError(400, "Card details are missing.", fields=missing)
+
+    flush_cart(request.user.pk)
+    total = CartItem.objects.filter(user=request.user).aggregate(total=Sum(LINE_TOTAL))['total']
+    if total is None:
+        raise ApiError(400, "Cart is empty.")
+
+    try:
+        order, payment = pay_and_place_order(request.user, money(total), card['card_number'])
+    except CheckoutError as exc:
+        if isinstance(exc, InsufficientStockError):
+            raise ApiError(409, "Not enough stock.", product_ids=sorted(exc.product_ids))
+        raise ApiError(409, str(exc))
+
+    return respond({
+        'order': order.pk,
+        'status': order.status,
+        'total_amount': order.total_amount,
+        'transaction_id': payment.transaction_id,
+    }, status=201)
+
+
+@read_from_replica
+@api_view('GET')
+def orders(request):
+    names = requested_fields(request, ORDER_FIELDS)
+    page = keyset_paginate(select(Order.objects.filter(consumer=request.user), ORDER_FIELDS, names,
+                                  extra=['id', 'created_at']),
+                           cursor=request.GET.get('cursor'), page_size=clamp_page_size(request.GET.get('page_size')))
+    return respond({'results': shape(page.items, ORDER_FIELDS, names), 'next': page.next_cursor})
+
+
+@read_from_replica
+@api_view('GET')
+def order_detail(request, order_id):
+    names = requested_fields(request, ORDER_FIELDS)
+    row = _one(select(Order.objects.filter(pk=order_id, consumer=request.user), ORDER_FIELDS, names))
+    if row is None:
+        raise ApiError(404, "Order not found.")
+    items = OrderItem.objects.filter(order_id=order_id).order_by('id').values(*ORDER_ITEM_FIELDS.values())
+    return respond({
+        **shape([row], ORDER_FIELDS, names)[0],
+        'items': shape(items, ORDER_ITEM_FIELDS, list(ORDER_ITEM_FIELDS)),
+    })
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class GreenkartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'greenkart'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import metrics, signals
+
+        post_migrate.connect(signals.restore_search_triggers, sender=self)
+        # Count every request's ORM queries (see greenkart.metrics)
+        connection_created.connect(metrics.install_query_counter)
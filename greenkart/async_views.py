@@ -0,0 +1,107 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.views.decorators.cache import cache_control
+
+from . import conditional
+from .cart import acart_count, add_item, aprice_cart
+from .facets import facet_options, filter_products, parse_filters
+from .geo import NEAR_RADII_KM, clamp_radius, products_near
+from .models import Order, Product
+from .pagination import akeyset_paginate, clamp_page_size, page_query
+from .routers import read_from_replica, writes_to_primary
+from .search import filter_matching, search_page
+
+
+# ============================
+# Async views
+# ============================
+# ASGI versions of the busiest shopper views. Under uvicorn they wait for the
+# database without holding a worker thread for the whole request. They
+# behave exactly like their namesakes in views.py, which stay in use under
+# WSGI; urls.py picks one set or the other (GREENKART_ASYNC_VIEWS).
+#
+# Always use ``await request.auser()`` here: ``request.user`` loads the user
+# synchronously and fails inside the event loop.
+
+
+# ---------------------------
+# CONSUMER DASHBOARD
+# ---------------------------
+@read_from_replica
+@login_required
+@cache_control(private=True, no_cache=True)
+@conditional.acondition(etag_func=conditional.aconsumer_dashboard_etag)
+async def consumer_dashboard(request):
+    user = await request.auser()
+    query = request.GET.get('q', '').strip()
+    cursor = request.GET.get('cursor')
+    page_size = clamp_page_size(request.GET.get('page_size'))
+    near = request.GET.get('near', '').strip()
+    radius = clamp_radius(request.GET.get('radius'))
+    filters = parse_filters(request.GET)
+    products = filter_products(Product.objects.all(), filters)
+    place = None
+
+    if near:
+        # one keyset query per nearby place, all in one thread hop
+        place, page = await sync_to_async(products_near)(near, radius, query=query, cursor=cursor,
+                                                         page_size=page_size, queryset=products)
+    elif query and filters:
+        page = await akeyset_paginate(filter_matching(products, query), cursor=cursor, page_size=page_size)
+    elif query:
+        # raw FTS query; the database API it uses has no async form
+        page = await sync_to_async(search_page)(query, cursor=cursor, page_size=page_size)
+    else:
+        page = await akeyset_paginate(products, cursor=cursor, page_size=page_size)
+
+    context = {
+        'page': page, 'query': query, 'near': near, 'radius': radius, 'place': place, 'filters': filters,
+        'page_query': page_query(request.GET),
+    }
+    if request.GET.get('fragment'):
+        return render(request, 'greenkart/_product_cards.html', context)
+
+    return render(request, 'greenkart/consumer_dashboard.html', {
+        **context,
+        'products': page.items,
+        'radii': NEAR_RADII_KM,
+        'facets': await sync_to_async(facet_options)(filters),
+        'cart_count': await acart_count(user)
+    })
+
+
+# ---------------------------
+# CART OPERATIONS
+# ---------------------------
+@writes_to_primary
+@login_required
+async def add_to_cart(request, product_id):
+    user = await request.auser()
+    product = await aget_object_or_404(Product.objects.only('id', 'quantity'), id=product_id)
+    await sync_to_async(add_item)(user, product.id, max_quantity=product.quantity)
+
+    return redirect(request.META.get('HTTP_REFERER', 'consumer_dashboard'))
+
+
+@login_required
+async def view_cart(request):
+    cart = await aprice_cart(await request.auser())
+    return render(request, 'greenkart/cart.html', {
+        'cart_items': cart.items,
+        'total': cart.total
+    })
+
+
+# ---------------------------
+# ORDERS
+# ---------------------------
+@read_from_replica
+@login_required
+@cache_control(private=True, no_cache=True)
+@conditional.acondition(etag_func=conditional.aconsumer_orders_etag,
+                        last_modified_func=conditional.aconsumer_orders_last_modified)
+async def consumer_orders(request):
+    user = await request.auser()
+    orders = Order.objects.filter(consumer=user).select_related('payment').order_by('-created_at')
+    return render(request, 'greenkart/orders.html', {'orders': [order async for order in orders]})
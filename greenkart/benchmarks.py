@@ -0,0 +1,336 @@
+import math
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import urls as greenkart_urls
+from .analytics import rebuild_rollups
+from .facets import rebuild_facets
+from .geo import geocode
+from .models import CartItem, Order, OrderItem, Payment, Product, User
+from .pagination import DEFAULT_PAGE_SIZE, encode_cursor
+
+
+# ============================
+# View calls
+# ============================
+# How to call each view in greenkart.urls: (user, method, url kwargs, POST
+# data, extra query strings). Strings in the url kwargs and query strings
+# are filled in from a sample (see view_requests). Shared by the benchmark
+# runner and the audit_query_plans command.
+VIEW_CALLS = {
+    'signup': (None, 'get', {}, None, ()),
+    'login': (None, 'get', {}, None, ()),
+    'consumer_dashboard': ('consumer', 'get', {}, None, (
+        'q=fresh', 'cursor={cursor}', 'near={near}', 'farmer={farmer_id}', 'price=2&in_stock=1', 'place={place_id}',
+        'farmer={farmer_id}&q=fresh', 'near={near}&q=fresh',
+    )),
+    'view_cart': ('consumer', 'get', {}, None, ()),
+    'add_to_cart': ('consumer', 'get', {'product_id': '{product}'}, None, ()),
+    'remove_from_cart': ('consumer', 'get', {'item_id': '{cart_item}'}, None, ()),
+    'place_order': ('consumer', 'get', {}, None, ()),
+    'farmer_dashboard': ('farmer', 'get', {}, None, ()),
+    'farmer_analytics': ('farmer', 'get', {}, None, ()),
+    'edit_product': ('farmer', 'get', {'product_id': '{product}'}, None, ()),
+    'add_product': ('farmer', 'get', {}, None, ()),
+    'import_products': ('farmer', 'get', {}, None, ()),
+    'delete_product': ('farmer', 'get', {'product_id': '{product}'}, None, ()),
+    'checkout': ('consumer', 'get', {}, None, ()),
+    'process_payment': ('consumer', 'post', {}, {
+        'card_name': 'Benchmark', 'card_number': '4242424242424242', 'expiry': '12/30', 'cvv': '123',
+    }, ()),
+    'payment_success': ('consumer', 'get', {'txid': '{payment}'}, None, ()),
+    'export_ledger': ('staff', 'get', {'kind': 'items', 'fmt': 'csv'}, None,
+                      ('since=2020-01-01', 'status=pending', 'farmer={farmer_email}')),
+    'consumer_orders': ('consumer', 'get', {}, None, ()),
+    'logout': ('consumer', 'get', {}, None, ()),
+    'api_session': ('consumer', 'get', {}, None, ()),
+    'api_products': ('consumer', 'get', {}, None, ('q=fresh', 'cursor={cursor}', 'fields=id,name,price',
+                                                   'farmer={farmer_id}', 'farmer={farmer_id}&q=fresh')),
+    'api_product': ('consumer', 'get', {'product_id': '{product}'}, None, ()),
+    'api_cart': ('consumer', 'get', {}, None, ()),
+    'api_cart_item': ('consumer', 'delete', {'product_id': '{product}'}, None, ()),
+    'api_checkout': ('consumer', 'post', {}, {
+        'card_name': 'Benchmark', 'card_number': '4242424242424242', 'expiry': '12/30', 'cvv': '123',
+    }, ()),
+    'api_orders': ('consumer', 'get', {}, None, ('cursor={cursor}',)),
+    'api_order': ('consumer', 'get', {'order_id': '{order}'}, None, ()),
+}
+
+
+def view_requests(sample):
+    """
+    Yield (label, user, method, url, data) for every view in greenkart.urls
+    and each of its query string variants, e.g. "consumer_dashboard?q".
+    ``sample`` holds the users by role ('users') and the values the url
+    kwargs and query strings refer to.
+    """
+    for pattern in greenkart_urls.urlpatterns:
+        if pattern.name not in VIEW_CALLS:
+            continue
+        role, method, kwargs, data, variants = VIEW_CALLS[pattern.name]
+        user = sample['users'][role] if role else None
+        url = reverse(pattern.name, kwargs={key: value.format(**sample) for key, value in kwargs.items()})
+        yield pattern.name, user, method, url, data
+        for variant in variants:
+            label = f"{pattern.name}?{variant.split('=')[0]}"
+            yield label, user, method, f"{url}?{variant.format(**sample)}", data
+
+
+def unlisted_views():
+    """URL names in greenkart.urls that VIEW_CALLS does not know how to call."""
+    return [pattern.name for pattern in greenkart_urls.urlpatterns if pattern.name not in VIEW_CALLS]
+
+
+def call_view(client, method, url, data):
+    response = getattr(client, method)(url, data or {})
+    if response.streaming:
+        # Read the whole export without holding on to it
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+# ============================
+# Synthetic marketplace
+# ============================
+# Benchmark accounts all live under BENCHMARK_DOMAIN and share
+# BENCHMARK_PASSWORD. Generate them into a database of their own
+# (GREENKART_SQLITE_PATH, or a separate PGDATABASE).
+BENCHMARK_DOMAIN = 'bench.greenkart.test'
+BENCHMARK_PASSWORD = 'benchmark'
+BENCHMARK_DAYS = 90
+
+PRODUCE = (
+    'Tomatoes', 'Potatoes', 'Onions', 'Carrots', 'Spinach', 'Cabbage', 'Cauliflower', 'Brinjal',
+    'Okra', 'Peas', 'Mangoes', 'Bananas', 'Apples', 'Guavas', 'Papayas', 'Oranges', 'Rice',
+    'Wheat', 'Lentils', 'Chickpeas', 'Honey', 'Ginger', 'Garlic', 'Chillies', 'Coriander',
+)
+QUALITIES = ('Fresh', 'Organic', 'Farm', 'Heirloom', 'Local', 'Seasonal', 'Premium', 'Hand-picked')
+LOCATIONS = ('Pune', 'Nashik', 'Nagpur', 'Indore', 'Jaipur', 'Lucknow', 'Mysuru', 'Guntur', 'Ludhiana', 'Kochi')
+
+
+def generate_marketplace(farmers=20, consumers=200, products_per_farmer=25, cart_items=3,
+                         orders_per_consumer=3, seed=1, batch_size=1000):
+    """
+    Bulk-insert a reproducible marketplace (the same ``seed`` gives the same
+    rows) and build its sales rollups. Returns the number of rows per model.
+    """
+    if User.objects.filter(email__endswith=f'@{BENCHMARK_DOMAIN}').exists():
+        raise ValueError("This database already has a benchmark marketplace; use an empty one.")
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(BENCHMARK_PASSWORD)
+
+    def moment():
+        return now - timedelta(seconds=rng.randrange(BENCHMARK_DAYS * 24 * 60 * 60))
+
+    with transaction.atomic():
+        users = [
+            User(email=f'farmer-{n}@{BENCHMARK_DOMAIN}', name=f'Farmer {n}', role='farmer', password=password)
+            for n in range(farmers)
+        ] + [
+            User(email=f'consumer-{n}@{BENCHMARK_DOMAIN}', name=f'Consumer {n}', role='consumer', password=password)
+            for n in range(consumers)
+        ] + [
+            User(email=f'staff@{BENCHMARK_DOMAIN}', name='Staff', role='consumer', password=password, is_staff=True),
+        ]
+        users = User.objects.bulk_create(users, batch_size=batch_size)
+        farmer_users, consumer_users = users[:farmers], users[farmers:farmers + consumers]
+
+        places = {location: geocode(location) for location in LOCATIONS}
+        products = []
+        for farmer in farmer_users:
+            location = rng.choice(LOCATIONS)
+            products += [
+                Product(farmer=farmer, name=f'{rng.choice(QUALITIES)} {rng.choice(PRODUCE)} {n}',
+                        description=f'Grown by {farmer.name}.', quantity=rng.randint(50, 500),
+                        price=Decimal(rng.randint(2000, 50000)) / 100, location=location,
+                        place_id=places[location], created_at=moment())
+                for n in range(products_per_farmer)
+            ]
+        products = Product.objects.bulk_create(products, batch_size=batch_size)
+
+        CartItem.objects.bulk_create([
+            CartItem(user=consumer, product=product, quantity=rng.randint(1, 5))
+            for consumer in consumer_users
+            for product in rng.sample(products, min(cart_items, len(products)))
+        ], batch_size=batch_size)
+
+        # One payment per order. Most are paid (then pending delivery or
+        # completed); the rest are still pending or were cancelled.
+        baskets = []
+        for consumer in consumer_users:
+            for _ in range(orders_per_consumer):
+                picked = rng.sample(products, min(rng.randint(1, 4), len(products)))
+                lines = [(product, rng.randint(1, 5)) for product in picked]
+                total = sum((product.price * quantity for product, quantity in lines), Decimal('0.00'))
+                paid = rng.random() < 0.85
+                status = rng.choice(('pending', 'completed') if paid else ('pending', 'cancelled'))
+                baskets.append((consumer, lines, total, paid, status, moment()))
+        payments = Payment.objects.bulk_create([
+            Payment(buyer=consumer, amount=total, status='paid' if paid else 'pending',
+                    method='dummy-card', created_at=created_at)
+            for consumer, _, total, paid, _, created_at in baskets
+        ], batch_size=batch_size)
+        orders = Order.objects.bulk_create([
+            Order(consumer=consumer, payment=payment, total_amount=total, status=status, created_at=created_at)
+            for payment, (consumer, _, total, _, status, created_at) in zip(payments, baskets)
+        ], batch_size=batch_size)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+            for order, (_, lines, _, _, _, _) in zip(orders, baskets)
+            for product, quantity in lines
+        ], batch_size=batch_size)
+
+        rebuild_rollups()
+        # Also sets the price bands bulk_create left at 0
+        rebuild_facets()
+
+    return {model.__name__: model.objects.count() for model in (User, Product, CartItem, Payment, Order, OrderItem)}
+
+
+def benchmark_sample():
+    """Pick the generated users and rows the view calls refer to."""
+    users = User.objects.filter(email__endswith=f'@{BENCHMARK_DOMAIN}')
+    consumer = users.filter(role='consumer', is_staff=False, cart_items__isnull=False).order_by('pk').first()
+    farmer = users.filter(role='farmer').order_by('pk').first()
+    staff = users.filter(is_staff=True).first()
+    if not (consumer and farmer and staff):
+        raise ValueError("No benchmark marketplace in this database; run generate_marketplace first.")
+
+    # The first row of the second catalogue page
+    second_page = Product.objects.order_by('-created_at', '-id')[DEFAULT_PAGE_SIZE - 1:DEFAULT_PAGE_SIZE].first()
+    if second_page is None:
+        second_page = Product.objects.order_by('created_at', 'id').first()
+    return {
+        'users': {'consumer': consumer, 'farmer': farmer, 'staff': staff},
+        'product': farmer.product_set.order_by('pk').values_list('pk', flat=True).first(),
+        'cart_item': consumer.cart_items.order_by('pk').values_list('pk', flat=True).first(),
+        'payment': consumer.payments.order_by('pk').values_list('transaction_id', flat=True).first(),
+        'cursor': encode_cursor(second_page.created_at, second_page.pk),
+        'farmer_email': farmer.email,
+        'near': farmer.product_set.values_list('location', flat=True).first(),
+        'farmer_id': farmer.pk,
+        'order': consumer.orders.order_by('pk').values_list('pk', flat=True).first(),
+        'place_id': farmer.product_set.values_list('place', flat=True).first(),
+    }
+
+
+# ============================
+# Benchmark runner
+# ============================
+# Every request runs in a transaction that is rolled back, so views that
+# write (placing an order, deleting a product) see the same rows on every
+# iteration; commit time is therefore not included. Each view gets an empty
+# private cache and is requested ``warmup`` times before it is timed, so
+# the timings are of a warm cache.
+LATENCY_NOISE_MS = 2.0
+
+
+def run_benchmarks(sample, iterations=20, warmup=2, views=None):
+    """
+    Return {label: {status, p50_ms, p95_ms, mean_ms, queries, peak_memory_kb}}
+    for every view call (or only the view names in ``views``).
+    """
+    results = {}
+    with override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                            'LOCATION': 'greenkart-benchmarks'}},
+        DATABASE_REPLICAS=[], ALLOWED_HOSTS=['*'],
+    ):
+        for label, user, method, url, data in view_requests(sample):
+            if views and label.split('?')[0] not in views:
+                continue
+            cache.clear()
+            timings, queries = [], []
+            for number in range(warmup + iterations):
+                response, elapsed, count = _timed_request(user, method, url, data)
+                if number >= warmup:
+                    timings.append(elapsed)
+                    queries.append(count)
+            # Traced separately: tracemalloc slows every allocation down
+            peak = _peak_memory(user, method, url, data)
+            timings.sort()
+            results[label] = {
+                'status': response.status_code,
+                'p50_ms': round(_percentile(timings, 50) * 1000, 2),
+                'p95_ms': round(_percentile(timings, 95) * 1000, 2),
+                'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+                'queries': max(queries),
+                'peak_memory_kb': round(peak / 1024, 1),
+            }
+    return results
+
+
+def _timed_request(user, method, url, data):
+    count = 0
+
+    def counter(execute, sql, params, many, context):
+        nonlocal count
+        count += 1
+        return execute(sql, params, many, context)
+
+    with transaction.atomic():
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            response = call_view(client, method, url, data)
+            elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+    return response, elapsed, count
+
+
+def _peak_memory(user, method, url, data):
+    with transaction.atomic():
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        tracemalloc.start()
+        try:
+            call_view(client, method, url, data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        transaction.set_rollback(True)
+    return peak
+
+
+def _percentile(ordered, percent):
+    # nearest-rank
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def compare_results(baseline, current, tolerance=0.25):
+    """
+    Regressions of ``current`` against ``baseline`` (both run_benchmarks()
+    results): any extra query, a different status, or a p95 latency or peak
+    memory more than ``tolerance`` above the baseline (latency also has to
+    be LATENCY_NOISE_MS slower). Returns messages.
+    """
+    problems = []
+    for label, now in sorted(current.items()):
+        before = baseline.get(label)
+        if before is None:
+            continue
+        if now['status'] != before['status']:
+            problems.append(f"{label}: status {before['status']} -> {now['status']}")
+        if now['queries'] > before['queries']:
+            problems.append(f"{label}: {before['queries']} -> {now['queries']} queries")
+        if now['p95_ms'] > before['p95_ms'] * (1 + tolerance) + LATENCY_NOISE_MS:
+            problems.append(f"{label}: p95 {before['p95_ms']} ms -> {now['p95_ms']} ms")
+        if now['peak_memory_kb'] > before['peak_memory_kb'] * (1 + tolerance):
+            problems.append(f"{label}: peak memory {before['peak_memory_kb']} KiB -> {now['peak_memory_kb']} KiB")
+    return problems
@@ -0,0 +1,297 @@
+import time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Least
+
+from .models import CartItem, Product
+
+
+# ============================
+# Cart pricing
+# ============================
+CENT = Decimal('0.01')
+
+LINE_TOTAL = ExpressionWrapper(
+    F('product__price') * F('quantity'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+class PricedCart:
+    """A user's cart lines with their products and database-computed totals."""
+
+    def __init__(self, items, total):
+        self.items = items
+        self.total = total
+
+    @property
+    def count(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def cart_lines(user):
+    """Cart rows for ``user`` joined to their product, each with ``line_total``."""
+    return (
+        CartItem.objects.filter(user=user)
+        .select_related('product')
+        .annotate(line_total=LINE_TOTAL)
+        .order_by('added_at', 'id')
+    )
+
+
+def price_cart(user):
+    """
+    Price ``user``'s cart: one joined query for the lines and, when the cart
+    is not empty, one aggregate query for the grand total.
+    """
+    flush_cart(user.pk)
+    items = list(cart_lines(user))
+    total = None
+    if items:
+        total = CartItem.objects.filter(user=user).aggregate(total=Sum(LINE_TOTAL))['total']
+    return _priced(items, total)
+
+
+async def aprice_cart(user):
+    """Async version of price_cart()."""
+    await sync_to_async(flush_cart)(user.pk)
+    items = [item async for item in cart_lines(user)]
+    total = None
+    if items:
+        total = (await CartItem.objects.filter(user=user).aaggregate(total=Sum(LINE_TOTAL)))['total']
+    return _priced(items, total)
+
+
+def _priced(items, total):
+    for item in items:
+        item.line_total = item.line_total.quantize(CENT)
+    return PricedCart(items, (total or Decimal('0.00')).quantize(CENT))
+
+
+# ============================
+# Cached cart with write-behind
+# ============================
+# The cache keeps a snapshot of which products are in a shopper's cart,
+#   {'items': {product_id: quantity}}
+# for the cart badge. Adds are written behind: each is an atomic
+# cache.incr() of the line's counter of pending units. An add that starts a
+# new line also appends its product to the shopper's log of new lines and
+# puts it in the snapshot; removing a line is written through and drops the
+# snapshot.
+#
+# Pending units are applied to CartItem, one UPDATE (or INSERT, for a new
+# line) per line, once a line has CART_WRITE_BEHIND_BATCH of them or the
+# shopper's oldest pending add is CART_WRITE_BEHIND_DELAY seconds old, and
+# always before anything reads CartItem (pricing, checkout). A flush takes
+# the units it applies with an atomic decr(), so adds made meanwhile stay
+# pending.
+#
+# Pending units only exist in the cache, so write-behind needs a cache that
+# every worker shares and that doesn't evict them: Redis with
+# maxmemory-policy noeviction, a file cache on a single host, or the memory
+# cache under runserver. CART_WRITE_BEHIND turns it off; then, and whenever a
+# counter turns out to be missing, adds are written through.
+DIRTY_LOG = 'greenkart:cart:dirty'
+
+
+def _cart_key(user_id):
+    return f'greenkart:cart:{user_id}'
+
+
+def _pending_key(user_id, product_id):
+    return f'greenkart:cart:{user_id}:pending:{product_id}'
+
+
+def _since_key(user_id):
+    # Set while the shopper has pending adds; the time of the first one
+    return f'greenkart:cart:{user_id}:since'
+
+
+def _new_lines_log(user_id):
+    return f'greenkart:cart:{user_id}:new'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def load_cart(user_id):
+    """Return the cached snapshot of ``user_id``'s cart lines, rebuilding it on a miss."""
+    state = cache.get(_cart_key(user_id))
+    if state is None:
+        items = dict(CartItem.objects.filter(user_id=user_id).values_list('product_id', 'quantity'))
+        state = {'items': {**dict.fromkeys(_unflushed_new_lines(user_id), 0), **items}}
+        cache.set(_cart_key(user_id), state, _setting('CART_CACHE_TIMEOUT', 24 * 60 * 60))
+    return state
+
+
+async def aload_cart(user_id):
+    """Async version of load_cart()."""
+    state = await cache.aget(_cart_key(user_id))
+    if state is None:
+        lines = CartItem.objects.filter(user_id=user_id).values_list('product_id', 'quantity')
+        items = {product_id: quantity async for product_id, quantity in lines}
+        new_lines = await sync_to_async(_unflushed_new_lines)(user_id)
+        state = {'items': {**dict.fromkeys(new_lines, 0), **items}}
+        await cache.aset(_cart_key(user_id), state, _setting('CART_CACHE_TIMEOUT', 24 * 60 * 60))
+    return state
+
+
+def _unflushed_new_lines(user_id):
+    # New lines still waiting for a flush, less any removed since
+    keys = {_pending_key(user_id, product_id): product_id for product_id in _read_log(_new_lines_log(user_id))}
+    return [keys[key] for key, pending in cache.get_many(keys).items() if pending]
+
+
+def cart_count(user):
+    return len(load_cart(user.pk)['items'])
+
+
+async def acart_count(user):
+    return len((await aload_cart(user.pk))['items'])
+
+
+def add_item(user, product_id, max_quantity):
+    """Add one unit of ``product_id``, capped at ``max_quantity`` for existing lines."""
+    if _setting('CART_WRITE_BEHIND', False):
+        state = load_cart(user.pk)
+        if product_id in state['items']:
+            if _add_pending(user.pk, product_id):
+                return
+        elif _add_pending(user.pk, product_id, new_line=True):
+            state['items'][product_id] = 0
+            cache.set(_cart_key(user.pk), state, _setting('CART_CACHE_TIMEOUT', 24 * 60 * 60))
+            return
+
+    line, created = CartItem.objects.get_or_create(user=user, product_id=product_id)
+    if created:
+        cache.delete(_cart_key(user.pk))
+    else:
+        CartItem.objects.filter(pk=line.pk).update(quantity=Least(F('quantity') + 1, Value(max_quantity)))
+
+
+def _add_pending(user_id, product_id, new_line=False):
+    """Count one more unit of a line in the cache. False if it must be written through."""
+    key = _pending_key(user_id, product_id)
+    cache.add(key, 0, None)
+    try:
+        pending = cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(): the cache can't be trusted with it
+        return False
+
+    if new_line:
+        _append_log(_new_lines_log(user_id), product_id)
+    now = time.time()
+    if cache.add(_since_key(user_id), now, None):
+        _append_log(DIRTY_LOG, user_id)
+    since = cache.get(_since_key(user_id), now)
+    if pending >= _setting('CART_WRITE_BEHIND_BATCH', 10) or now - since >= _setting('CART_WRITE_BEHIND_DELAY', 30):
+        flush_cart(user_id)
+    return True
+
+
+def remove_item(user, product_id):
+    """Removing is written through: the line is deleted from CartItem at once."""
+    CartItem.objects.filter(user=user, product_id=product_id).delete()
+    cache.delete_many([_cart_key(user.pk), _pending_key(user.pk, product_id)])
+
+
+def flush_cart(user_id):
+    """Apply any pending adds for ``user_id`` to CartItem."""
+    if cache.get(_since_key(user_id)) is None:
+        return
+    # Dropped first: an add from here on starts a new batch and registers again
+    cache.delete(_since_key(user_id))
+    product_ids = set(CartItem.objects.filter(user_id=user_id).values_list('product_id', flat=True))
+    product_ids.update(_take_log(_new_lines_log(user_id)))
+    keys = {_pending_key(user_id, product_id): product_id for product_id in product_ids}
+    for key, pending in cache.get_many(keys).items():
+        if not pending:
+            continue
+        cache.decr(key, pending)
+        try:
+            _apply_pending(user_id, keys[key], pending)
+        except Exception:
+            cache.incr(key, pending)
+            raise
+
+
+def _apply_pending(user_id, product_id, pending):
+    # Capped at the stock, as the add view caps written-through adds
+    stock = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('quantity'))
+    lines = CartItem.objects.filter(user_id=user_id, product_id=product_id)
+    if lines.update(quantity=Least(F('quantity') + pending, stock)):
+        return
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(user_id=user_id, product_id=product_id, quantity=Least(
+                Value(pending), Subquery(Product.objects.filter(pk=product_id).values('quantity')),
+            ))
+    except IntegrityError:
+        # Written through by another worker meanwhile
+        lines.update(quantity=Least(F('quantity') + pending, stock))
+
+
+def forget_cart(user_id, product_ids=()):
+    """Drop the cached cart, and the counters of ``product_ids``, e.g. after checkout emptied CartItem."""
+    cache.delete_many([_cart_key(user_id), _since_key(user_id)]
+                      + [_pending_key(user_id, product_id) for product_id in product_ids])
+
+
+def flush_all_carts():
+    """Flush every cart registered as having pending adds. Returns how many."""
+    user_ids = set(_take_log(DIRTY_LOG))
+    for user_id in user_ids:
+        flush_cart(user_id)
+    return len(user_ids)
+
+
+# Logs are append-only lists in the cache, numbered by an atomic counter:
+# the registry of shoppers with pending adds (so the flush_carts command
+# finds carts of shoppers who went quiet) and each shopper's new lines.
+def _append_log(log, value):
+    cache.add(f'{log}:seq', 0, None)
+    cache.set(f'{log}:{cache.incr(f"{log}:seq")}', value, None)
+
+
+def _read_log(log):
+    """The values appended to ``log`` and not yet taken."""
+    last = cache.get(f'{log}:seq') or 0
+    first = (cache.get(f'{log}:done') or 0) + 1
+    keys = [f'{log}:{number}' for number in range(first, last + 1)]
+    return list(cache.get_many(keys).values())
+
+
+def _take_log(log):
+    """Take the values appended to ``log`` so far."""
+    # Runs take the entries up to the counter's value, so values appended
+    # meanwhile land after it and are taken by the next run.
+    last = cache.get(f'{log}:seq') or 0
+    first = (cache.get(f'{log}:done') or 0) + 1
+    entries = cache.get_many([f'{log}:{number}' for number in range(first, last + 1)])
+    for number in range(first, last + 1):
+        if f'{log}:{number}' in entries:
+            continue
+        # Numbered but not yet written: stop there and pick it up next run,
+        # unless it was already missing then
+        if cache.get(f'{log}:stalled') != number:
+            cache.set(f'{log}:stalled', number, None)
+            last = number - 1
+            break
+
+    taken = [f'{log}:{number}' for number in range(first, last + 1)]
+    cache.set(f'{log}:done', last, None)
+    cache.delete_many(taken)
+    return [entries[key] for key in taken if key in entries]
@@ -0,0 +1,125 @@
+import uuid
+
+from django.db import transaction
+from django.db.models import (
+    Case, DecimalField, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, When,
+)
+from django.utils import timezone
+
+from .analytics import update_sales
+from .cart import forget_cart, price_cart
+from .exceptions import CheckoutError, EmptyCartError, InsufficientStockError
+from .facets import count_sold_out
+from .models import CartItem, Order, OrderItem, Payment, Product, StockReservation
+from .reservations import reserve_cart
+from .taskqueue import enqueue
+
+
+# ============================
+# Checkout pipeline
+# ============================
+# Turning a cart into an order issues the same handful of statements whatever
+# the number of lines: one INSERT for the order, one bulk INSERT for its items,
+# one UPDATE for all stock levels, one UPDATE for the order total and one
+# DELETE each for the reservations and the cart. Stock is normally already
+# held by the shopper's reservations (see reservations.reserve_cart), taken
+# when the checkout page was shown.
+def take_reserved_stock(quantities):
+    """
+    Move ``{product_id: quantity}`` units that are already held for the
+    shopper out of stock, for all products in one conditional UPDATE.
+    """
+    enough = Q()
+    for product_id, quantity in quantities.items():
+        enough |= Q(pk=product_id, quantity__gte=quantity, reserved_quantity__gte=quantity)
+
+    updated = Product.objects.filter(enough).update(
+        quantity=Case(
+            *[When(pk=product_id, then=F('quantity') - quantity)
+              for product_id, quantity in quantities.items()],
+            output_field=PositiveIntegerField(),
+        ),
+        reserved_quantity=Case(
+            *[When(pk=product_id, then=F('reserved_quantity') - quantity)
+              for product_id, quantity in quantities.items()],
+            output_field=PositiveIntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+    if updated != len(quantities):
+        raise InsufficientStockError(set(quantities))
+    # queryset UPDATE sends no post_save
+    count_sold_out(quantities)
+
+
+def order_total():
+    """Subquery summing an order's items in the database."""
+    return Subquery(
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum(F('price') * F('quantity')))
+        .values('total'),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def place_order(user, payment=None):
+    """
+    Convert ``user``'s cart into one Order with its OrderItems, turn the
+    shopper's stock reservations into sold stock, mark ``payment`` paid and link it, then empty the cart. Everything
+    happens in one transaction.
+    """
+    with transaction.atomic():
+        cart = price_cart(user)
+        if not cart:
+            raise EmptyCartError("Cart is empty")
+
+        # Tops up or re-takes any hold that expired; a no-op for lines
+        # that are still held
+        quantities = reserve_cart(user)
+        take_reserved_stock(quantities)
+        StockReservation.objects.filter(user=user).delete()
+
+        order = Order.objects.create(consumer=user, payment=payment, status='pending')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=item.product_id, quantity=item.quantity, price=item.product.price)
+            for item in cart.items
+        ])
+        Order.objects.filter(pk=order.pk).update(total_amount=order_total(), updated_at=timezone.now())
+        order.refresh_from_db(fields=['total_amount'])
+
+        if payment is not None:
+            Payment.objects.filter(pk=payment.pk).update(status='paid', amount=order.total_amount,
+                                                          updated_at=timezone.now())
+            payment.status = 'paid'
+            payment.amount = order.total_amount
+            # The sales rollups are updated by a worker, off the request path
+            enqueue(update_sales, order_id=order.pk)
+
+        CartItem.objects.filter(user=user).delete()
+        transaction.on_commit(lambda: forget_cart(user.pk, quantities))
+    return order
+
+
+def pay_and_place_order(user, amount, card_number):
+    """
+    Record a pending dummy-card Payment of ``amount`` and place ``user``'s
+    order with it; return ``(order, payment)``. If the order cannot be
+    placed, for whatever reason, the payment is marked failed before the
+    error propagates.
+    """
+    payment = Payment.objects.create(
+        transaction_id=uuid.uuid4().hex,
+        buyer=user,
+        amount=amount,
+        status='pending',
+        method='dummy-card',
+        notes=f'Card ending {card_number[-4:]}',
+    )
+    try:
+        order = place_order(user, payment=payment)
+    except Exception:
+        Payment.objects.filter(pk=payment.pk).update(status='failed', updated_at=timezone.now())
+        payment.status = 'failed'
+        raise
+    return order, payment
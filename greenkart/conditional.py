@@ -0,0 +1,168 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cart import aload_cart, load_cart
+from .models import FacetCount, Order, Product
+
+
+# ============================
+# Conditional GET validators
+# ============================
+# Cheap validators for pages that would otherwise always be queried and
+# rendered, derived from the rows the page shows: how many there are and
+# the latest updated_at among them. A delete changes the count and any
+# other change moves updated_at. They are read in the view's own routing
+# context, from the same database as the page, so a page rendered from a
+# lagging replica gets that replica's validator and is revalidated once the
+# replica catches up.
+#
+# The latest updated_at is an index search. Product pages don't count their
+# rows: the facet counts (see greenkart/facets.py) are kept in step with
+# every insert and delete, so the in/out of stock rows add up to the
+# catalogue and a farmer's row is the size of their list.
+def _catalogue():
+    return Product.objects.all()
+
+
+def _catalogue_total():
+    return FacetCount.objects.filter(facet='stock')
+
+
+def _farmer_products(user_id):
+    return Product.objects.filter(farmer_id=user_id)
+
+
+def _farmer_total(user_id):
+    return FacetCount.objects.filter(facet='farmer', value=user_id)
+
+
+def _orders(user_id):
+    return Order.objects.filter(consumer_id=user_id)
+
+
+def _aggregates(changed, total):
+    # Without a maintained total the rows are counted, e.g. one shopper's orders
+    counted = {'count': Count('pk')} if total is None else {}
+    return {**counted, **{f'changed_{n}': Max(lookup) for n, lookup in enumerate(changed)}}
+
+
+def _summarise(row, total):
+    count = row.pop('count') if total is None else total['count'] or 0
+    timestamps = [value for value in row.values() if value is not None]
+    return count, max(timestamps) if timestamps else None
+
+
+def _catalogue_state(request):
+    return _state(request, _catalogue(), 'updated_at', total=_catalogue_total())
+
+
+def _farmer_state(request):
+    user_id = request.user.pk
+    return _state(request, _farmer_products(user_id), 'updated_at', total=_farmer_total(user_id))
+
+
+def _state(request, queryset, *changed, total=None):
+    """
+    (row count, latest of the ``changed`` timestamp lookups) for
+    ``queryset``, the count summed from the FacetCount rows ``total`` if
+    given; read once per request, as condition() asks for both the ETag and
+    Last-Modified.
+    """
+    if not hasattr(request, '_validator_state'):
+        row = queryset.order_by().aggregate(**_aggregates(changed, total))
+        counted = total.aggregate(count=Sum('count')) if total is not None else None
+        request._validator_state = _summarise(row, counted)
+    return request._validator_state
+
+
+async def _astate(request, queryset, *changed, total=None):
+    if not hasattr(request, '_validator_state'):
+        row = await queryset.order_by().aaggregate(**_aggregates(changed, total))
+        counted = await total.aaggregate(count=Sum('count')) if total is not None else None
+        request._validator_state = _summarise(row, counted)
+    return request._validator_state
+
+
+def _etag(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _stamp(state):
+    count, changed_at = state
+    return f"{count}@{changed_at.isoformat() if changed_at else '-'}"
+
+
+# Functions for django.views.decorators.http.condition
+def consumer_dashboard_etag(request, *args, **kwargs):
+    # The page shows the catalogue plus this shopper's cart badge
+    cart_items = len(load_cart(request.user.pk)['items'])
+    return _etag('consumer', _stamp(_catalogue_state(request)), cart_items, request.get_full_path())
+
+
+def farmer_dashboard_etag(request, *args, **kwargs):
+    return _etag('farmer', request.user.pk, _stamp(_farmer_state(request)))
+
+
+def farmer_dashboard_last_modified(request, *args, **kwargs):
+    return _farmer_state(request)[1]
+
+
+def consumer_orders_etag(request, *args, **kwargs):
+    state = _state(request, _orders(request.user.pk), 'updated_at', 'payment__updated_at')
+    return _etag('orders', request.user.pk, _stamp(state))
+
+
+def consumer_orders_last_modified(request, *args, **kwargs):
+    return _state(request, _orders(request.user.pk), 'updated_at', 'payment__updated_at')[1]
+
+
+# Async views: django's condition() calls the validator functions
+# synchronously, which would block the event loop (and request.user can't be
+# loaded from async code), so they get awaitable validators and acondition().
+def acondition(etag_func=None, last_modified_func=None):
+    """condition() for async views, awaiting ``etag_func``/``last_modified_func``."""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+
+            etag = await etag_func(request, *args, **kwargs) if etag_func else None
+            etag = quote_etag(etag) if etag else None
+            last_modified = None
+            if last_modified_func:
+                changed_at = await last_modified_func(request, *args, **kwargs)
+                last_modified = int(changed_at.timestamp()) if changed_at else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+
+async def aconsumer_dashboard_etag(request, *args, **kwargs):
+    user = await request.auser()
+    cart_items = len((await aload_cart(user.pk))['items'])
+    state = await _astate(request, _catalogue(), 'updated_at', total=_catalogue_total())
+    return _etag('consumer', _stamp(state), cart_items, request.get_full_path())
+
+
+async def aconsumer_orders_etag(request, *args, **kwargs):
+    user = await request.auser()
+    state = await _astate(request, _orders(user.pk), 'updated_at', 'payment__updated_at')
+    return _etag('orders', user.pk, _stamp(state))
+
+
+async def aconsumer_orders_last_modified(request, *args, **kwargs):
+    user = await request.auser()
+    return (await _astate(request, _orders(user.pk), 'updated_at', 'payment__updated_at'))[1]
@@ -0,0 +1,12 @@
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+class InsufficientStockError(CheckoutError):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f"Not enough stock for product(s): {sorted(product_ids)}")
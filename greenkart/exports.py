@@ -0,0 +1,161 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import DecimalField, Exists, ExpressionWrapper, F, OuterRef
+from django.utils import timezone
+
+from .models import Order, OrderItem, Payment
+
+
+# ============================
+# Ledger export
+# ============================
+# Orders, order items and payments as CSV or JSON Lines, for reconciliation.
+# Rows are read with values_list().iterator(chunk_size=...), which uses a
+# server-side cursor where the database has one, and are written out as they
+# arrive. Neither the view (StreamingHttpResponse) nor the export_ledger
+# command ever holds more than one chunk. Under ASGI the view streams
+# astream_ledger(): Django would otherwise drain a sync iterator into a list
+# before sending the first byte.
+EXPORT_CHUNK_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+# A CSV cell starting with one of these is run as a formula by spreadsheet
+# apps; product names are typed in by farmers
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# kind: [(column, lookup), ...]
+LEDGERS = {
+    'orders': [
+        ('order_id', 'id'),
+        ('created_at', 'created_at'),
+        ('consumer', 'consumer__email'),
+        ('status', 'status'),
+        ('total_amount', 'total_amount'),
+        ('transaction_id', 'payment__transaction_id'),
+        ('payment_status', 'payment__status'),
+    ],
+    'items': [
+        ('order_item_id', 'id'),
+        ('order_id', 'order_id'),
+        ('created_at', 'order__created_at'),
+        ('order_status', 'order__status'),
+        ('product_id', 'product_id'),
+        ('product', 'product__name'),
+        ('farmer', 'product__farmer__email'),
+        ('quantity', 'quantity'),
+        ('price', 'price'),
+        ('line_total', 'line_total'),
+    ],
+    'payments': [
+        ('transaction_id', 'transaction_id'),
+        ('created_at', 'created_at'),
+        ('buyer', 'buyer__email'),
+        ('amount', 'amount'),
+        ('status', 'status'),
+        ('method', 'method'),
+    ],
+}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def ledger_queryset(kind, since=None, until=None, status=None, farmer=None, using='default'):
+    """
+    The ``kind`` ledger, oldest first. ``since``/``until`` are inclusive dates,
+    ``status`` is the order status (payment status for payments), and
+    ``farmer`` (an email) keeps only rows involving that farmer's products.
+    """
+    if kind == 'orders':
+        queryset, created, status_field = Order.objects.all(), 'created_at', 'status'
+        farmer_items = OrderItem.objects.filter(order=OuterRef('pk'))
+    elif kind == 'items':
+        queryset, created, status_field = OrderItem.objects.all(), 'order__created_at', 'order__status'
+        queryset = queryset.annotate(line_total=ExpressionWrapper(
+            F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+        farmer_items = None
+    elif kind == 'payments':
+        queryset, created, status_field = Payment.objects.all(), 'created_at', 'status'
+        farmer_items = OrderItem.objects.filter(order__payment=OuterRef('pk'))
+    else:
+        raise ValueError(f"Unknown ledger {kind!r}; expected one of {', '.join(LEDGERS)}")
+
+    if since:
+        queryset = queryset.filter(**{f'{created}__gte': _day_start(since)})
+    if until:
+        queryset = queryset.filter(**{f'{created}__lt': _day_start(until + timedelta(days=1))})
+    if status:
+        queryset = queryset.filter(**{status_field: status})
+    if farmer:
+        if farmer_items is None:
+            queryset = queryset.filter(product__farmer__email=farmer)
+        else:
+            # EXISTS instead of a join, so no DISTINCT is needed
+            queryset = queryset.filter(Exists(farmer_items.filter(product__farmer__email=farmer)))
+
+    columns = [lookup for _, lookup in LEDGERS[kind]]
+    return queryset.using(using).order_by('pk').values_list(*columns)
+
+
+def ledger_rows(kind, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    return ledger_queryset(kind, **filters).iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    """A write-only file that returns what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def stream_ledger(kind, fmt, rows, lines_per_chunk=500):
+    """Yield the export of ``rows`` as text, header first, a few hundred lines at a time."""
+    buffer = []
+    for line in _lines(kind, fmt, rows):
+        buffer.append(line)
+        if len(buffer) >= lines_per_chunk:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def astream_ledger(kind, fmt, rows, lines_per_chunk=500):
+    """stream_ledger() for ASGI: each chunk is built in the request's sync thread, one at a time."""
+    chunks = stream_ledger(kind, fmt, rows, lines_per_chunk)
+    # thread_sensitive, so the cursor is always used from the thread that opened it
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _lines(kind, fmt, rows):
+    header = [column for column, _ in LEDGERS[kind]]
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow([csv_cell(value) for value in row])
+    elif fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n'
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(FORMATS)}")
@@ -0,0 +1,178 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, When
+
+from .models import FacetCount, Place, Product, User
+
+
+# ============================
+# Catalogue facets
+# ============================
+# The consumer dashboard filters products by place, farmer, price band and
+# stock. FacetCount holds how many products match each value; every change
+# to a product is applied to it as a delta (one UPDATE per facet touched),
+# so the counts cost a few indexed reads per page view whatever the size of
+# the catalogue. The counts are for the whole catalogue, not narrowed by the
+# filters already chosen. Writes that bypass Product.save() must call
+# count_changes() or count_sold_out() themselves; rebuild_facets() repairs
+# any drift.
+PRICE_BANDS = (50, 100, 250, 500)  # ₹, upper bounds; the last band is open-ended
+FACET_FIELDS = ('place_id', 'farmer_id', 'price_band', 'quantity')
+FILTER_FIELDS = {'place': 'place_id', 'farmer': 'farmer_id', 'price': 'price_band'}
+# Place and farmer filters list only their most common values
+FACET_LIMIT = 20
+# Ids that fit a 64-bit column; the database driver raises on larger ones
+MIN_FILTER_VALUE, MAX_FILTER_VALUE = -2 ** 63, 2 ** 63 - 1
+
+
+def price_band(price):
+    for band, limit in enumerate(PRICE_BANDS):
+        if price < limit:
+            return band
+    return len(PRICE_BANDS)
+
+
+def price_band_case():
+    """price_band() as a database expression."""
+    return Case(
+        *[When(price__lt=limit, then=band) for band, limit in enumerate(PRICE_BANDS)],
+        default=len(PRICE_BANDS), output_field=IntegerField(),
+    )
+
+
+def price_band_label(band):
+    if band == 0:
+        return f"Under ₹{PRICE_BANDS[0]}"
+    if band >= len(PRICE_BANDS):
+        return f"₹{PRICE_BANDS[-1]} and over"
+    return f"₹{PRICE_BANDS[band - 1]}–{PRICE_BANDS[band]}"
+
+
+def facet_values(row):
+    """The (facet, value) pairs a product counts towards; ``row`` is a Product or a dict of FACET_FIELDS."""
+    get = row.get if isinstance(row, dict) else lambda field: getattr(row, field)
+    values = [('farmer', get('farmer_id')), ('price', get('price_band')), ('stock', int(get('quantity') > 0))]
+    if get('place_id') is not None:
+        values.append(('place', get('place_id')))
+    return values
+
+
+def count_changes(removed=(), added=()):
+    """Move the counts for products that changed from their ``removed`` to their ``added`` state."""
+    deltas = Counter()
+    for row in added:
+        deltas.update(facet_values(row))
+    for row in removed:
+        deltas.subtract(facet_values(row))
+    apply_deltas(deltas)
+
+
+def count_sold_out(product_ids):
+    """
+    After a stock UPDATE on products that all had stock, move those it
+    emptied from in stock to out of stock.
+    """
+    sold_out = Product.objects.filter(pk__in=product_ids, quantity=0).count()
+    apply_deltas({('stock', 1): -sold_out, ('stock', 0): sold_out})
+
+
+def apply_deltas(deltas):
+    by_facet = defaultdict(dict)
+    for (facet, value), delta in deltas.items():
+        if delta:
+            by_facet[facet][value] = delta
+    if not by_facet:
+        return
+
+    with transaction.atomic():
+        # Make sure every row exists, then add the deltas in one UPDATE per facet
+        FacetCount.objects.bulk_create(
+            [FacetCount(facet=facet, value=value) for facet, values in by_facet.items() for value in values],
+            ignore_conflicts=True,
+        )
+        for facet, values in by_facet.items():
+            FacetCount.objects.filter(facet=facet, value__in=values).update(count=F('count') + Case(
+                *[When(value=value, then=delta) for value, delta in values.items()],
+                output_field=IntegerField(),
+            ))
+            emptied = [value for value, delta in values.items() if delta < 0]
+            if emptied:
+                FacetCount.objects.filter(facet=facet, value__in=emptied, count__lte=0).delete()
+
+
+def rebuild_facets(product_model=Product, facet_model=FacetCount):
+    """Recompute every product's price band and all facet counts. Returns the number of count rows."""
+    with transaction.atomic():
+        product_model.objects.exclude(price_band=price_band_case()).update(price_band=price_band_case())
+        rows = []
+        for facet, field in FILTER_FIELDS.items():
+            counts = (product_model.objects.filter(**{f'{field}__isnull': False}).order_by()
+                      .values_list(field).annotate(count=Count('pk')))
+            rows += [facet_model(facet=facet, value=value, count=count) for value, count in counts]
+        in_stock = product_model.objects.filter(quantity__gt=0).count()
+        out_of_stock = product_model.objects.count() - in_stock
+        rows += [facet_model(facet='stock', value=value, count=count)
+                 for value, count in ((1, in_stock), (0, out_of_stock)) if count]
+
+        facet_model.objects.all().delete()
+        facet_model.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+# ============================
+# Dashboard filters
+# ============================
+def parse_filters(params):
+    """{facet: value} for the filters set in ``params`` (request.GET); invalid values are ignored."""
+    filters = {}
+    for facet in FILTER_FIELDS:
+        try:
+            value = int(params.get(facet, ''))
+        except ValueError:
+            continue
+        if MIN_FILTER_VALUE <= value <= MAX_FILTER_VALUE:
+            filters[facet] = value
+    if params.get('in_stock'):
+        filters['stock'] = 1
+    return filters
+
+
+def filter_products(queryset, filters):
+    for facet, value in filters.items():
+        if facet == 'stock':
+            queryset = queryset.filter(quantity__gt=0)
+        else:
+            queryset = queryset.filter(**{FILTER_FIELDS[facet]: value})
+    return queryset
+
+
+def facet_options(filters):
+    """
+    {facet: [(value, label, count)]} for the dashboard filters, most common
+    first, plus 'in_stock' (the number of products in stock). Chosen values
+    are always listed.
+    """
+    options = {}
+    for facet in ('place', 'farmer'):
+        counts = dict(FacetCount.objects.filter(facet=facet).order_by('-count', 'value')
+                      .values_list('value', 'count')[:FACET_LIMIT])
+        chosen = filters.get(facet)
+        if chosen is not None and chosen not in counts:
+            counts[chosen] = FacetCount.objects.filter(facet=facet, value=chosen).values_list('count', flat=True).first() or 0
+        options[facet] = counts
+
+    places = Place.objects.in_bulk(options['place'])
+    farmers = dict(User.objects.filter(pk__in=options['farmer']).values_list('pk', 'name'))
+    options['place'] = [(value, str(places[value]), count) for value, count in options['place'].items() if value in places]
+    options['farmer'] = [(value, farmers[value], count) for value, count in options['farmer'].items() if value in farmers]
+
+    prices, in_stock = {}, 0
+    for facet, value, count in FacetCount.objects.filter(facet__in=['price', 'stock']).values_list('facet', 'value', 'count'):
+        if facet == 'price':
+            prices[value] = count
+        elif value == 1:
+            in_stock = count
+    options['price'] = [(band, price_band_label(band), prices.get(band, 0)) for band in range(len(PRICE_BANDS) + 1)]
+    options['in_stock'] = in_stock
+    return options
@@ -1,8 +1,30 @@
 from django import forms
-from .models import User
+from .models import Product, User
 
 class SignupForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput)
     class Meta:
         model = User
         fields = ['name', 'email', 'password', 'role', 'mobile']
+
+
+class ProductImportRowForm(forms.ModelForm):
+    """Validates one row of a bulk product import (see greenkart.imports)."""
+    class Meta:
+        model = Product
+        fields = ['name', 'description', 'quantity', 'price', 'location']
+
+
+class LedgerExportForm(forms.Form):
+    """Filters for a ledger export (see greenkart.exports)."""
+    since = forms.DateField(required=False)
+    until = forms.DateField(required=False)
+    status = forms.CharField(required=False)
+    farmer = forms.EmailField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        since, until = cleaned_data.get('since'), cleaned_data.get('until')
+        if since and until and since > until:
+            raise forms.ValidationError("'since' is after 'until'.")
+        return cleaned_data
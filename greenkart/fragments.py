@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+# ============================
+# Product card fragment cache
+# ============================
+# Rendered product cards are cached per product and card style. A dashboard
+# fetches every card on the page in one get_many and only renders misses.
+# The key includes the product's updated_at, so an edit moves the card to a
+# new key instead of relying on a delete: a render that read the product
+# before the edit (a concurrent request, a lagging replica) can only cache
+# its HTML under the old key, which nothing asks for again. save() sets
+# updated_at; queryset updates of fields a card shows must set it too.
+CARD_TEMPLATES = {
+    'consumer': 'greenkart/_consumer_product_card.html',
+    'farmer': 'greenkart/_farmer_product_card.html',
+}
+
+# Bump when the card templates change so old HTML is not served after deploy
+CARD_VERSION = 1
+
+
+def card_key(product, style):
+    version = int(product.updated_at.timestamp() * 1000000)
+    return f'greenkart:card:v{CARD_VERSION}:{style}:{product.pk}:{version}'
+
+
+def render_product_cards(products, style):
+    """Return the HTML for ``products``' cards, in order, reusing cached cards."""
+    products = list(products)
+    keys = {product.pk: card_key(product, style) for product in products}
+    cached = cache.get_many(keys.values())
+
+    missing = {}
+    cards = []
+    for product in products:
+        html = cached.get(keys[product.pk])
+        if html is None:
+            html = render_to_string(CARD_TEMPLATES[style], {'product': product})
+            missing[keys[product.pk]] = html
+        cards.append(html)
+
+    if missing:
+        cache.set_many(missing, getattr(settings, 'CARD_FRAGMENT_TIMEOUT', 24 * 60 * 60))
+    return mark_safe(''.join(cards))
+
@@ -0,0 +1,287 @@
+import csv
+import math
+import re
+import uuid
+from pathlib import Path
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Place, Product
+from .pagination import DEFAULT_PAGE_SIZE, KeysetPage, keyset_paginate
+from .search import filter_matching
+
+
+# ============================
+# Gazetteer
+# ============================
+# Product.location stays free text; it is matched against the bundled
+# gazetteer of towns and cities and the match stored in Product.place. A
+# location names a place if the whole text, or one of its comma-separated
+# parts, is the place's name, one of its aliases, or "name state" (case and
+# punctuation ignored): "Pune", "Poona", "Kothrud, Pune" and
+# "Pune, Maharashtra" are all Pune. Where two places share a name the one
+# listed first in the gazetteer wins.
+#
+# Each process keeps the lookup table in memory, tagged with the version in
+# the shared cache it was built at. Writes to Place set a new version, so
+# every process rebuilds its table on its next lookup.
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer.csv'
+PLACES_VERSION_KEY = 'greenkart:places:version'
+
+NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+_place_keys = (None, None)
+
+
+def normalize(text):
+    return NON_WORD_RE.sub(' ', (text or '').lower()).strip()
+
+
+def read_gazetteer(path=GAZETTEER_PATH):
+    with open(path, newline='', encoding='utf-8') as gazetteer:
+        for row in csv.DictReader(gazetteer):
+            latitude, longitude = float(row['latitude']), float(row['longitude'])
+            yield {
+                'name': row['name'].strip(),
+                'state': row['state'].strip(),
+                'aliases': row['aliases'].strip(),
+                'latitude': latitude,
+                'longitude': longitude,
+                'cell': grid_cell(latitude, longitude),
+            }
+
+
+def load_gazetteer(place_model=Place, path=GAZETTEER_PATH):
+    """Add new gazetteer places and update changed ones. Returns (added, updated)."""
+    existing = {(place.name, place.state): place for place in place_model.objects.all()}
+    new, changed = [], []
+    for row in read_gazetteer(path):
+        place = existing.get((row['name'], row['state']))
+        if place is None:
+            new.append(place_model(**row))
+        elif any(getattr(place, field) != value for field, value in row.items()):
+            for field, value in row.items():
+                setattr(place, field, value)
+            changed.append(place)
+    place_model.objects.bulk_create(new, batch_size=500)
+    place_model.objects.bulk_update(changed, ['aliases', 'latitude', 'longitude', 'cell'], batch_size=500)
+    reset_geocoder()
+    return len(new), len(changed)
+
+
+def place_keys(place_model=Place):
+    """{normalized name: place id} for every way a location can name a place."""
+    keys = {}
+    for pk, name, state, aliases in place_model.objects.order_by('pk').values_list('pk', 'name', 'state', 'aliases'):
+        for key in (name, f'{name} {state}', *aliases.split(';')):
+            if normalize(key):
+                keys.setdefault(normalize(key), pk)
+    return keys
+
+
+def current_place_keys():
+    """place_keys() as of the latest write to Place, rebuilt only after one."""
+    global _place_keys
+    version = cache.get(PLACES_VERSION_KEY)
+    if version is None:
+        # Read back: another process may have set it first, and a dummy
+        # cache keeps nothing (then the table is only rebuilt by this process)
+        cache.add(PLACES_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(PLACES_VERSION_KEY)
+    built_at, keys = _place_keys
+    if keys is None or built_at != version:
+        keys = place_keys()
+        _place_keys = (version, keys)
+    return keys
+
+
+def geocode(location, keys=None):
+    """The id of the Place ``location`` names, or None."""
+    if keys is None:
+        keys = current_place_keys()
+    text = normalize(location)
+    if text in keys:
+        return keys[text]
+    for part in (location or '').split(','):
+        part = normalize(part)
+        if part in keys:
+            return keys[part]
+    return None
+
+
+def reset_geocoder():
+    # Call after changing Place rows; bulk writes send no signals
+    def reset():
+        global _place_keys
+        _place_keys = (None, None)
+        cache.set(PLACES_VERSION_KEY, uuid.uuid4().hex, None)
+    transaction.on_commit(reset)
+
+
+def geocode_products(product_model=Product, place_model=Place, only_missing=False):
+    """
+    Set Product.place from every product's location. Returns the number
+    changed. These are queryset updates: afterwards call
+    facets.rebuild_facets(), as the load_gazetteer command does.
+    """
+    keys = place_keys(place_model)
+    products = product_model.objects.all()
+    if only_missing:
+        products = products.filter(place__isnull=True)
+    # So the catalogue validators see the change; the historical model
+    # migration 0016 runs this with has no updated_at yet
+    stamp = {}
+    if any(field.name == 'updated_at' for field in product_model._meta.concrete_fields):
+        stamp['updated_at'] = timezone.now()
+    changed = 0
+    # One UPDATE per distinct location text
+    for location in products.order_by().values_list('location', flat=True).distinct():
+        place_id = geocode(location, keys)
+        changed += (
+            products.filter(location=location).exclude(place_id=place_id).update(place_id=place_id, **stamp)
+            if place_id is not None else
+            products.filter(location=location, place__isnull=False).update(place_id=None, **stamp)
+        )
+    return changed
+
+
+# ============================
+# Spatial index
+# ============================
+# Places sit in a grid of CELL_DEGREES squares numbered row by row, so the
+# cells covering a bounding box are one contiguous range of cell numbers
+# per grid row. Finding the places within a radius takes one index range
+# scan per row, then an exact distance check on the few places found.
+# Products are then read per place, nearest place first, through the
+# (place, created_at) index: the cost of a query depends on the number of
+# places around the point and the page size, not on the number of listings.
+CELL_DEGREES = 0.25
+GRID_COLUMNS = int(360 / CELL_DEGREES)
+KM_PER_DEGREE = 111.32
+EARTH_RADIUS_KM = 6371.0
+
+NEAR_RADII_KM = (10, 25, 50, 100, 250)
+DEFAULT_NEAR_RADIUS_KM = 50
+# nearest_products() widens its search up to this far
+MAX_NEAR_RADIUS_KM = 3200
+
+
+def grid_cell(latitude, longitude):
+    row = int((latitude + 90) // CELL_DEGREES)
+    column = int((longitude + 180) // CELL_DEGREES) % GRID_COLUMNS
+    return row * GRID_COLUMNS + column
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell_ranges(latitude, longitude, radius_km):
+    # The bounding box of the circle, as (first cell, last cell) per grid row
+    lat_span = radius_km / KM_PER_DEGREE
+    lon_span = min(180.0, radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)))
+    first_row = int((max(-90.0, latitude - lat_span) + 90) // CELL_DEGREES)
+    last_row = int((min(90.0, latitude + lat_span) + 90) // CELL_DEGREES)
+    first_column = int((longitude - lon_span + 180) // CELL_DEGREES)
+    last_column = int((longitude + lon_span + 180) // CELL_DEGREES)
+    if last_column - first_column + 1 >= GRID_COLUMNS:
+        first_column, last_column = 0, GRID_COLUMNS - 1
+
+    for row in range(first_row, last_row + 1):
+        base = row * GRID_COLUMNS
+        if first_column < 0:
+            yield base + first_column % GRID_COLUMNS, base + GRID_COLUMNS - 1
+            yield base, base + last_column
+        elif last_column >= GRID_COLUMNS:
+            yield base + first_column, base + GRID_COLUMNS - 1
+            yield base, base + last_column % GRID_COLUMNS
+        else:
+            yield base + first_column, base + last_column
+
+
+def places_within(latitude, longitude, radius_km):
+    """[(distance in km, place id)] for the places within ``radius_km``, nearest first."""
+    cells = Q()
+    for first, last in _cell_ranges(latitude, longitude, radius_km):
+        cells |= Q(cell__gte=first, cell__lte=last)
+    nearby = []
+    for pk, place_lat, place_lon in Place.objects.filter(cells).values_list('pk', 'latitude', 'longitude'):
+        distance = distance_km(latitude, longitude, place_lat, place_lon)
+        if distance <= radius_km:
+            nearby.append((distance, pk))
+    nearby.sort()
+    return nearby
+
+
+def nearby_page(latitude, longitude, radius_km, cursor=None, page_size=DEFAULT_PAGE_SIZE, queryset=None):
+    """
+    One page of the products within ``radius_km``, nearest place first and
+    newest first within a place, each with ``distance_km``. The cursor is
+    the rank of the place the page ended in plus a keyset cursor within it.
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    places = places_within(latitude, longitude, radius_km)
+    start, position = _decode_cursor(cursor)
+
+    items = []
+    for rank in range(start, len(places)):
+        distance, place_id = places[rank]
+        page = keyset_paginate(queryset.filter(place_id=place_id), cursor=position if rank == start else None,
+                               page_size=page_size - len(items))
+        for product in page.items:
+            product.distance_km = round(distance, 1)
+        items += page.items
+        if len(items) == page_size:
+            if page.has_next:
+                return KeysetPage(items, f'{rank}.{page.next_cursor}')
+            # Only offer another page if a farther place has something on it
+            farther = [pk for distance, pk in places[rank + 1:]]
+            if farther and queryset.filter(place_id__in=farther).exists():
+                return KeysetPage(items, f'{rank + 1}.')
+            break
+    return KeysetPage(items, None)
+
+
+def nearest_products(latitude, longitude, count=DEFAULT_PAGE_SIZE, queryset=None):
+    """The ``count`` products nearest to the point, widening the radius until found."""
+    radius = NEAR_RADII_KM[0]
+    while True:
+        page = nearby_page(latitude, longitude, radius, page_size=count, queryset=queryset)
+        if len(page) == count or radius >= MAX_NEAR_RADIUS_KM:
+            return page.items
+        radius *= 2
+
+
+def clamp_radius(value):
+    try:
+        radius = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_NEAR_RADIUS_KM
+    return radius if radius in NEAR_RADII_KM else DEFAULT_NEAR_RADIUS_KM
+
+
+def products_near(location, radius_km, query='', cursor=None, page_size=DEFAULT_PAGE_SIZE, queryset=None):
+    """(place, page) for the products around the place ``location`` names; place is None if unknown."""
+    place_id = geocode(location)
+    if place_id is None:
+        return None, KeysetPage([], None)
+    place = Place.objects.get(pk=place_id)
+    queryset = Product.objects.all() if queryset is None else queryset
+    if query:
+        queryset = filter_matching(queryset, query)
+    return place, nearby_page(place.latitude, place.longitude, radius_km, cursor=cursor,
+                              page_size=page_size, queryset=queryset)
+
+
+def _decode_cursor(cursor):
+    rank, _, position = (cursor or '').partition('.')
+    try:
+        return max(0, int(rank)), position or None
+    except ValueError:
+        return 0, None
@@ -0,0 +1,128 @@
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Product
+from .taskqueue import enqueue, task
+
+
+# ============================
+# Product image derivatives
+# ============================
+# Farmers upload photos of any size. Each upload is turned into a few
+# resized, recompressed variants (WebP plus a JPEG fallback) so pages only
+# transfer the pixels they display. Generation runs after the upload's
+# transaction commits, on the background task queue (greenkart.taskqueue),
+# never on the request path.
+#
+# Product.image_variants records what was produced, e.g.
+#   {"source": "product_images/apple.jpeg",
+#    "card": {"width": 320, "height": 320, "webp": "...", "jpeg": "..."}, ...}
+VARIANTS = (
+    # name, target width, crop to square
+    ('thumb', 96, True),
+    ('card', 320, True),
+    ('detail', 960, False),
+)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+def variant_name(source_name, variant, extension):
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'derived', f"{stem}-{variant}.{extension}")
+
+
+def _resize(image, width, square):
+    if square:
+        side = min(width, image.width, image.height)
+        return ImageOps.fit(image, (side, side), Image.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((width, width), Image.LANCZOS)
+    return resized
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'WEBP':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=6)
+    else:
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(field_file):
+    """Resize and encode every variant of ``field_file``; return the variants map."""
+    storage = field_file.storage
+    with field_file.open('rb') as handle:
+        source = ImageOps.exif_transpose(Image.open(handle))
+        source = source.convert('RGB')
+
+    variants = {'source': field_file.name}
+    for variant, width, square in VARIANTS:
+        resized = _resize(source, width, square)
+        entry = {'width': resized.width, 'height': resized.height}
+        for fmt, key, extension in (('WEBP', 'webp', 'webp'), ('JPEG', 'jpeg', 'jpg')):
+            # content-addressed: the name only picks the directory and extension
+            name = variant_name(field_file.name, variant, extension)
+            entry[key] = storage.save(name, _encode(resized, fmt))
+        variants[variant] = entry
+    return variants
+
+
+def variant_files(variants):
+    names = set()
+    for variant, _, _ in VARIANTS:
+        entry = (variants or {}).get(variant) or {}
+        names.update(entry[key] for key in ('webp', 'jpeg') if entry.get(key))
+    return names
+
+
+def delete_variants(variants, storage, keep=()):
+    for name in variant_files(variants) - set(keep):
+        if storage.exists(name):
+            storage.delete(name)
+
+
+@task(priority=5, timeout=10 * 60)
+def generate_variants(product_id):
+    """Build the variants for one product's current image and record them."""
+    product = Product.objects.filter(pk=product_id).only('pk', 'image', 'image_variants').first()
+    if product is None or not product.image:
+        return None
+    previous = product.image_variants or {}
+    source = product.image.name
+    variants = build_variants(product.image)
+    storage = product.image.storage
+    # Only record the result if the image was not replaced in the meantime.
+    # Variants are derived from the source bytes, so they are shared by every
+    # product using the same (content-addressed) source and can only go once
+    # nothing references that source.
+    updated = Product.objects.filter(pk=product_id, image=source).update(image_variants=variants,
+                                                                        updated_at=timezone.now())
+    if not updated:
+        if not Product.objects.filter(image=source).exists():
+            delete_variants(variants, storage)
+        return None
+    old_source = previous.get('source')
+    if old_source and old_source != source and not Product.objects.filter(image=old_source).exists():
+        delete_variants(previous, storage, keep=variant_files(variants))
+    return variants
+
+
+def schedule_variants(product):
+    """Queue variant generation for ``product``; it runs once the current transaction commits."""
+    product_id = product.pk
+    if getattr(settings, 'IMAGE_VARIANTS_SYNC', False):
+        transaction.on_commit(lambda: generate_variants(product_id))
+    else:
+        enqueue(generate_variants, product_id=product_id)
+
+
+def needs_variants(product):
+    return bool(product.image) and (product.image_variants or {}).get('source') != product.image.name
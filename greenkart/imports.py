@@ -0,0 +1,181 @@
+import codecs
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .forms import ProductImportRowForm
+from .facets import FACET_FIELDS, count_changes, price_band
+from .geo import current_place_keys, geocode
+from .models import Product
+
+
+# ============================
+# Bulk product import
+# ============================
+# A CSV (with a header row) or JSON Lines file is read one row at a time and
+# each row is validated with ProductImportRowForm's fields. Valid rows are upserted in
+# chunks of IMPORT_CHUNK_SIZE, keyed on (farmer, name): one query to find the
+# chunk's existing products, one bulk_update and one bulk_create, each chunk
+# in its own transaction. Nothing but the current chunk and the first
+# MAX_REPORTED_ERRORS errors is held in memory, whatever the file size.
+#
+# bulk_create/bulk_update send no model signals: the search index follows
+# through its database triggers, and updated_at is set by hand so cached
+# cards move to a new key.
+IMPORT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+ROW_FIELDS = ProductImportRowForm.base_fields
+FORMATS = ('csv', 'jsonl')
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        # (line number, {field: [messages]}), the first MAX_REPORTED_ERRORS
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, errors))
+
+    @property
+    def errors_truncated(self):
+        return self.error_count > len(self.errors)
+
+
+def detect_format(filename):
+    """Guess the import format from a file name; CSV unless it looks like JSON Lines."""
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def iter_rows(binary_file, fmt):
+    """
+    Yield (line number, dict or None, error) for each record of ``binary_file``.
+
+    Decoding is incremental, so the file is never read into memory whole.
+    """
+    text = codecs.getreader('utf-8-sig')(binary_file, errors='replace')
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, None, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, "Expected a JSON object."
+                continue
+            yield line_number, row, None
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            # line_num is where the record ends, which is what an editor shows
+            yield reader.line_num, row, None
+
+
+def import_products(farmer, binary_file, fmt='csv', chunk_size=IMPORT_CHUNK_SIZE, on_error=None):
+    """
+    Upsert ``farmer``'s products from ``binary_file`` (opened in binary mode)
+    and return an ImportResult. ``on_error(line, errors)`` is called for
+    every rejected row as it is found.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown import format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+    result = ImportResult()
+
+    def reject(line, errors):
+        result.add_error(line, errors)
+        if on_error:
+            on_error(line, errors)
+
+    chunk = {}
+    for line, row, error in iter_rows(binary_file, fmt):
+        result.rows += 1
+        if error:
+            reject(line, {'__all__': [error]})
+            continue
+        data, errors = clean_row(row)
+        if errors:
+            reject(line, errors)
+            continue
+        # A name repeated within a chunk: the later row wins
+        chunk[data['name']] = (line, data)
+        if len(chunk) >= chunk_size:
+            _upsert(farmer, chunk, result, reject)
+            chunk = {}
+    if chunk:
+        _upsert(farmer, chunk, result, reject)
+    return result
+
+
+def clean_row(row):
+    """
+    Return (cleaned data, errors) for one row. The form's fields are used
+    directly: building a whole ModelForm per row costs more than the rest
+    of the import put together.
+    """
+    data, errors = {}, {}
+    for name, field in ROW_FIELDS.items():
+        try:
+            data[name] = field.clean(_text(row.get(name)))
+        except ValidationError as exc:
+            errors[name] = exc.messages
+    return data, errors
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def _upsert(farmer, chunk, result, reject):
+    with transaction.atomic():
+        existing = {}
+        # Oldest product wins if the farmer already has duplicates by name
+        for product in Product.objects.filter(farmer=farmer, name__in=chunk).order_by('-id'):
+            existing[product.name] = product
+
+        changed, previous, new = [], [], []
+        keys = current_place_keys()
+        for name, (line, data) in chunk.items():
+            product = existing.get(name)
+            if product is None:
+                new.append(Product(farmer=farmer, place_id=geocode(data['location'], keys),
+                                   price_band=price_band(data['price']), **data))
+                continue
+            if data['quantity'] < product.reserved_quantity:
+                reject(line, {'quantity': [
+                    f"Can't go below the {product.reserved_quantity} unit(s) held for shoppers at checkout."
+                ]})
+                continue
+            previous.append({field: getattr(product, field) for field in FACET_FIELDS})
+            for field, value in data.items():
+                setattr(product, field, value)
+            product.place_id = geocode(product.location, keys)
+            product.price_band = price_band(product.price)
+            # bulk_update doesn't apply auto_now
+            product.updated_at = timezone.now()
+            changed.append(product)
+
+        # bulk_create/bulk_update skip the signals that set place and
+        # price_band and count facets
+        if changed:
+            Product.objects.bulk_update(changed, ['description', 'quantity', 'price', 'location', 'place', 'price_band',
+                                                  'updated_at'])
+        if new:
+            Product.objects.bulk_create(new)
+        count_changes(removed=previous, added=changed + new)
+
+    result.updated += len(changed)
+    result.created += len(new)
@@ -0,0 +1,143 @@
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from greenkart.analytics import record_sale, rebuild_rollups
+from greenkart.benchmarks import call_view, unlisted_views, view_requests
+from greenkart.models import CartItem, Order, OrderItem, Payment, Product, StockReservation, User
+from greenkart.pagination import encode_cursor
+
+
+# A sequential scan of a whole table, or a sort the planner has to build
+# itself. "SCAN t USING [COVERING] INDEX i" walks a whole index in order, so
+# it only passes when the query has a LIMIT to stop it; a bounded range is
+# planned as "SEARCH".
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)( AS \w+)?$')
+INDEX_SCAN_RE = re.compile(r'^SCAN (\w+)( AS \w+)? USING (COVERING )?INDEX ')
+LIMIT_RE = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+TEMP_BTREE_RE = re.compile(r'USE TEMP B-TREE FOR ')
+
+# Plans that are expected, by view (or view?variant) and plan detail
+ACCEPTED = {
+    # the per-product totals are ordered by a SUM over at most one rollup row
+    # per product and day; no index can hold that order
+    ('farmer_analytics', 'USE TEMP B-TREE FOR GROUP BY'),
+    ('farmer_analytics', 'USE TEMP B-TREE FOR ORDER BY'),
+    # bm25() relevance is computed per match
+    ('consumer_dashboard?q', 'USE TEMP B-TREE FOR ORDER BY'),
+    ('api_products?q', 'USE TEMP B-TREE FOR ORDER BY'),
+    # a ledger export streams the whole table in primary key order and
+    # filters rows as it goes, so the first row is sent without a sort
+    ('export_ledger', 'SCAN greenkart_orderitem'),
+    # one farmer's lines are found through their products' indexes, then
+    # put back in ledger order
+    ('export_ledger?farmer', 'USE TEMP B-TREE FOR ORDER BY'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Call every view in greenkart.urls against sample rows (rolled back afterwards), "
+        "run EXPLAIN QUERY PLAN on each query it issues, and report full table scans "
+        "and temporary B-tree sorts. Exits non-zero if any are found."
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("audit_query_plans reads SQLite's EXPLAIN QUERY PLAN output; run it against SQLite.")
+        self.verbosity = options['verbosity']
+
+        problems = []
+        # A dummy cache so nothing about the sample rows outlives the audit,
+        # and no replicas so every query is captured here
+        with override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+            DATABASE_REPLICAS=[], ALLOWED_HOSTS=['*'],
+        ):
+            with transaction.atomic():
+                sample = self.make_sample()
+                for name in unlisted_views():
+                    self.stderr.write(f"{name}: not in greenkart.benchmarks.VIEW_CALLS, skipped")
+                for label, user, method, url, data in view_requests(sample):
+                    problems += self.check_queries(label, self.capture(user, method, url, data))
+                transaction.set_rollback(True)
+
+        if problems:
+            raise CommandError(f"{len(problems)} query plan problem(s) found.")
+        self.stdout.write(self.style.SUCCESS("No full table scans or temporary sorts."))
+
+    def make_sample(self):
+        now = timezone.now()
+        farmer = User.objects.create_user('audit-farmer@example.com', 'audit', role='farmer', name='Audit')
+        consumer = User.objects.create_user('audit-consumer@example.com', 'audit', role='consumer', name='Audit')
+        staff = User.objects.create_user('audit-staff@example.com', 'audit', role='consumer', name='Audit', is_staff=True)
+        products = [
+            Product.objects.create(farmer=farmer, name=f'Fresh audit produce {i}', description='Audit',
+                                   quantity=100, price=Decimal('10.00'), location='Pune',
+                                   created_at=now - timedelta(minutes=i))
+            for i in range(3)
+        ]
+        cart_item = CartItem.objects.create(user=consumer, product=products[0], quantity=1)
+        CartItem.objects.create(user=consumer, product=products[1], quantity=2)
+        StockReservation.objects.create(user=consumer, product=products[1], quantity=1,
+                                        expires_at=now + timedelta(minutes=5))
+        Product.objects.filter(pk=products[1].pk).update(reserved_quantity=1)
+        payment = Payment.objects.create(buyer=consumer, amount=Decimal('10.00'), status='paid')
+        order = Order.objects.create(consumer=consumer, payment=payment, total_amount=Decimal('10.00'))
+        OrderItem.objects.create(order=order, product=products[2], quantity=1, price=Decimal('10.00'))
+        record_sale(order)
+        rebuild_rollups()
+        return {
+            'users': {'farmer': farmer, 'consumer': consumer, 'staff': staff},
+            'product': products[2].pk,
+            'cart_item': cart_item.pk,
+            'payment': payment.transaction_id,
+            'cursor': encode_cursor(products[0].created_at, products[0].pk),
+            'farmer_email': farmer.email,
+            'near': 'Pune',
+            'farmer_id': farmer.pk,
+            'order': order.pk,
+            'place_id': products[0].place_id,
+        }
+
+    def capture(self, user, method, url, data):
+        with transaction.atomic():
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            with CaptureQueriesContext(connection) as captured:
+                call_view(client, method, url, data)
+            transaction.set_rollback(True)
+        return captured.captured_queries
+
+    def check_queries(self, label, queries):
+        problems = []
+        seen = set()
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')) or sql in seen:
+                continue
+            seen.add(sql)
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            for detail in plan:
+                unbounded = INDEX_SCAN_RE.match(detail) and not LIMIT_RE.search(sql)
+                if not FULL_SCAN_RE.match(detail) and not unbounded and not TEMP_BTREE_RE.search(detail):
+                    continue
+                if (label, detail) in ACCEPTED or (label.split('?')[0], detail) in ACCEPTED:
+                    continue
+                problems.append((label, detail, sql))
+                self.stdout.write(self.style.WARNING(f"{label}: {detail}"))
+                self.stdout.write(f"    {sql[:300]}")
+            if self.verbosity > 1:
+                self.stdout.write(f"{label}: {sql[:200]}")
+                for detail in plan:
+                    self.stdout.write(f"    {detail}")
+        return problems
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from greenkart.models import Product
+from greenkart.storage import is_content_addressed, product_image_storage, release_image
+
+
+class Command(BaseCommand):
+    help = ("Move product images saved under their upload names into content-addressed "
+            "storage, so duplicate uploads collapse into one file.")
+
+    def handle(self, *args, **options):
+        moved = missing = 0
+        products = Product.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image', 'image_variants')
+        for product in products.iterator(chunk_size=500):
+            old_name = product.image.name
+            if is_content_addressed(old_name):
+                continue
+            if not product_image_storage.exists(old_name):
+                missing += 1
+                self.stderr.write(f"Product {product.pk}: {old_name} is missing")
+                continue
+            with product_image_storage.open(old_name, 'rb') as handle:
+                new_name = product_image_storage.save(old_name, handle)
+            # queryset update: no signals, the old file is released below
+            Product.objects.filter(pk=product.pk).update(image=new_name, image_variants={},
+                                                         updated_at=timezone.now())
+            release_image(old_name, product.image_variants)
+            moved += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} image(s) into content-addressed storage, {missing} missing. "
+            "Run generate_image_variants to rebuild their variants."
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from greenkart.exports import EXPORT_CHUNK_SIZE, FORMATS, LEDGERS, ledger_rows, stream_ledger
+from greenkart.forms import LedgerExportForm
+
+
+class Command(BaseCommand):
+    help = "Export the orders, order items or payments ledger as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(LEDGERS))
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--since', help="First day to include (YYYY-MM-DD).")
+        parser.add_argument('--until', help="Last day to include (YYYY-MM-DD).")
+        parser.add_argument('--status', help="Order status (payment status for payments).")
+        parser.add_argument('--farmer', help="Only rows involving this farmer's products (email).")
+        parser.add_argument('--output', '-o', help="File to write; standard output by default.")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        form = LedgerExportForm({name: options[name] for name in ('since', 'until', 'status', 'farmer')})
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+
+        rows = ledger_rows(options['kind'], chunk_size=options['chunk_size'],
+                           using=options['database'], **form.cleaned_data)
+        chunks = stream_ledger(options['kind'], options['format'], rows)
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for chunk in chunks:
+                output.write(chunk)
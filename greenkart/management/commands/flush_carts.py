@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from greenkart.cart import flush_all_carts
+
+
+class Command(BaseCommand):
+    help = "Write pending cached cart changes back to the database. Run periodically from cron."
+
+    def handle(self, *args, **options):
+        flushed = flush_all_carts()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} cart(s)."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from greenkart.images import generate_variants, needs_variants
+from greenkart.models import Product
+
+
+class Command(BaseCommand):
+    help = "Build thumbnail/card/detail WebP and JPEG variants for product images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Rebuild every product, not only those with missing or stale variants.")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image', 'image_variants')
+        built = failed = 0
+        for product in products.iterator(chunk_size=500):
+            if not options['all'] and not needs_variants(product):
+                continue
+            try:
+                generate_variants(product.pk)
+                built += 1
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f"Product {product.pk}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {built} product(s), {failed} failed."))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from greenkart.benchmarks import BENCHMARK_DOMAIN, BENCHMARK_PASSWORD, generate_marketplace
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-insert a synthetic marketplace (farmers, consumers, products, carts, orders "
+        "and payments) for benchmarking. Point GREENKART_SQLITE_PATH at a database of its "
+        "own and migrate it first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farmers', type=int, default=20)
+        parser.add_argument('--consumers', type=int, default=200)
+        parser.add_argument('--products-per-farmer', type=int, default=25)
+        parser.add_argument('--cart-items', type=int, default=3, help="Cart lines per consumer.")
+        parser.add_argument('--orders-per-consumer', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=1, help="The same seed generates the same marketplace.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per INSERT.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            counts = generate_marketplace(
+                farmers=options['farmers'],
+                consumers=options['consumers'],
+                products_per_farmer=options['products_per_farmer'],
+                cart_items=options['cart_items'],
+                orders_per_consumer=options['orders_per_consumer'],
+                seed=options['seed'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        rows = ', '.join(f"{count} {model}" for model, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated in {time.perf_counter() - start:.1f}s; the database now has {rows}."))
+        self.stdout.write(f"Accounts are <role>-<n>@{BENCHMARK_DOMAIN} and staff@{BENCHMARK_DOMAIN}, "
+                          f"password {BENCHMARK_PASSWORD!r}.")
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from greenkart.imports import FORMATS, IMPORT_CHUNK_SIZE, detect_format, import_products
+from greenkart.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Add or update a farmer's products from a CSV or JSON Lines file, matching "
+        "existing products by name. Rejected rows are reported with their line number."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('farmer', help="Email address of the farmer who owns the products.")
+        parser.add_argument('path', help="CSV or JSON Lines file to import.")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="File format; detected from the file name by default.")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help="Rows written per transaction.")
+
+    def handle(self, *args, **options):
+        try:
+            farmer = User.objects.get(email=options['farmer'], role='farmer')
+        except User.DoesNotExist:
+            raise CommandError(f"No farmer with email {options['farmer']}.")
+
+        def report(line, errors):
+            for field, messages in errors.items():
+                prefix = '' if field == '__all__' else f"{field}: "
+                self.stderr.write(f"line {line}: {prefix}{' '.join(messages)}")
+
+        fmt = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as binary_file:
+                result = import_products(farmer, binary_file, fmt=fmt,
+                                         chunk_size=options['chunk_size'], on_error=report)
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {result.rows} row(s): {result.created} product(s) added, "
+            f"{result.updated} updated, {result.error_count} rejected."
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from greenkart.facets import rebuild_facets
+from greenkart.geo import GAZETTEER_PATH, geocode_products, load_gazetteer
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the places gazetteer (name, state, latitude, longitude, aliases CSV) "
+        "and re-match every product's location against it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(GAZETTEER_PATH), help="Gazetteer CSV to load.")
+        parser.add_argument('--only-missing', action='store_true',
+                            help="Only geocode products that have no place yet.")
+
+    def handle(self, *args, **options):
+        try:
+            added, updated = load_gazetteer(path=options['path'])
+        except (OSError, KeyError, ValueError) as exc:
+            raise CommandError(f"Could not read {options['path']}: {exc}")
+        located = geocode_products(only_missing=options['only_missing'])
+        if located:
+            # The place counts of the moved products
+            rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(
+            f"{added} places added, {updated} updated; {located} products re-located."
+        ))
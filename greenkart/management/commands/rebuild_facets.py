@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from greenkart.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the catalogue filter counts and product price bands. Run whenever "
+        "the counts may have drifted (e.g. after editing products outside the app)."
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt catalogue facets: {rows} count row(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from greenkart.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups from the order history. Run once after "
+        "upgrading, and whenever the rollups may have drifted (e.g. after editing "
+        "orders outside the app)."
+    )
+
+    def handle(self, *args, **options):
+        products, farmers = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt sales rollups: {products} product-day and {farmers} farmer-day row(s)."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from greenkart.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text product search index from the product table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        rebuild_index(using=options['database'])
+        self.stdout.write(self.style.SUCCESS("Product search index rebuilt."))
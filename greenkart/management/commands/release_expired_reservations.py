@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from greenkart.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = "Return stock held by expired checkout reservations. Run every minute or so from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired reservation(s)."))
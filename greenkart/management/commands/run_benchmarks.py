@@ -0,0 +1,70 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from greenkart.benchmarks import benchmark_sample, compare_results, run_benchmarks, unlisted_views
+from greenkart.models import Order, Product, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every view in greenkart.urls against the generate_marketplace data and "
+        "report p50/p95 latency, query count and peak memory per view as JSON. With "
+        "--baseline, fail if any view got slower, heavier or issues more queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Timed requests per view.")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests per view first.")
+        parser.add_argument('--view', action='append', dest='views',
+                            help="Only benchmark this URL name; repeat for more.")
+        parser.add_argument('--output', help="Write the JSON report here instead of to stdout.")
+        parser.add_argument('--baseline', help="A previous report to compare against.")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed p95 latency and peak memory growth over the baseline (0.25 = 25%%).")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        try:
+            sample = benchmark_sample()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        for name in unlisted_views():
+            self.stderr.write(f"{name}: not in greenkart.benchmarks.VIEW_CALLS, skipped")
+
+        results = run_benchmarks(sample, iterations=options['iterations'], warmup=options['warmup'],
+                                 views=options['views'])
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'dataset': {model.__name__: model.objects.count() for model in (User, Product, Order)},
+            'iterations': options['iterations'],
+            'views': results,
+        }
+        # Sorted and indented so two reports diff line by line
+        output = json.dumps(report, indent=2, sort_keys=True) + '\n'
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+        else:
+            self.stdout.write(output, ending='')
+
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as baseline_file:
+                    baseline = json.load(baseline_file)['views']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {exc}")
+            problems = compare_results(baseline, results, tolerance=options['tolerance'])
+            for problem in problems:
+                self.stderr.write(problem)
+            if problems:
+                raise CommandError(f"{len(problems)} regression(s) against {options['baseline']}.")
+            self.stderr.write(self.style.SUCCESS(f"No regressions against {options['baseline']}."))
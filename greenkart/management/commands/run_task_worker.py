@@ -0,0 +1,72 @@
+import multiprocessing
+import signal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def _work(poll_interval, burst, max_tasks):
+    # A child started with spawn or forkserver is a fresh interpreter, so
+    # the app registry is loaded here rather than at import time
+    django.setup()
+    from greenkart.taskqueue import Worker
+
+    worker = Worker(poll_interval=poll_interval)
+    # Finish the current task, then exit
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run(burst=burst, max_tasks=max_tasks)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks (see greenkart.taskqueue) in one or more worker "
+        "processes. SIGTERM or Ctrl-C lets every worker finish its current task first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes to run.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before looking for tasks again.")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--max-tasks', type=int,
+                            help="Exit after this many tasks (per process), e.g. to recycle memory.")
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes < 1:
+            raise CommandError("--processes must be at least 1.")
+        work_args = (options['poll_interval'], options['burst'], options['max_tasks'])
+
+        if processes == 1:
+            _work(*work_args)
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        children = [
+            multiprocessing.Process(target=_work, args=work_args, name=f'task-worker-{number}')
+            for number in range(1, processes + 1)
+        ]
+        for child in children:
+            child.start()
+        self.stdout.write(f"Started {processes} task workers.")
+
+        def forward(signum, frame):
+            for child in children:
+                if child.is_alive():
+                    child.terminate()
+
+        signal.signal(signal.SIGTERM, forward)
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            # Ctrl-C already reached the children; wait for them to finish
+            for child in children:
+                child.join()
+        failed = [child.name for child in children if child.exitcode]
+        if failed:
+            raise CommandError(f"Worker(s) exited with an error: {', '.join(failed)}")
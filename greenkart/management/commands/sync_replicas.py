@@ -0,0 +1,38 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into each SQLite replica file. Stands in "
+        "for replication when trying read replicas locally; run it from cron or by hand."
+    )
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError("sync_replicas only copies SQLite databases; use real replication otherwise.")
+
+        aliases = [alias for alias in settings.DATABASE_REPLICAS if connections[alias].vendor == 'sqlite']
+        if not aliases:
+            self.stdout.write("No SQLite replicas configured (set GREENKART_DB_REPLICAS).")
+            return
+
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        try:
+            for alias in aliases:
+                # Drop Django's own connection so the copy isn't blocked by it
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    # The backup API copies a consistent snapshot, even while
+                    # the primary is being written to
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f"Synced {alias}."))
+        finally:
+            source.close()
@@ -0,0 +1,252 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates, Template
+
+
+# ============================
+# Request metrics
+# ============================
+# Per-view latency, ORM query count/time, template render time and response
+# size, kept in process memory and published in the Prometheus text format
+# at /metrics. Each worker process keeps its own registry; Prometheus adds
+# them up across scrape targets; only staff and the scrapers listed in
+# METRICS_ALLOWED_IPS may read it. Recording a request is a few dict updates
+# under a lock, cheap enough to leave on in production.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+UNRESOLVED = '<unresolved>'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+
+class Summary:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    # (metric name, help text, Prometheus type, factory)
+    METRICS = (
+        ('greenkart_request_duration_seconds', 'Time spent handling a request.',
+         'histogram', lambda: Histogram(LATENCY_BUCKETS)),
+        ('greenkart_request_db_queries', 'ORM queries issued per request.',
+         'histogram', lambda: Histogram(QUERY_COUNT_BUCKETS)),
+        ('greenkart_request_db_seconds', 'Time spent executing ORM queries per request.',
+         'summary', Summary),
+        ('greenkart_request_template_seconds', 'Time spent rendering templates per request.',
+         'summary', Summary),
+        ('greenkart_response_size_bytes', 'Size of the response body.',
+         'histogram', lambda: Histogram(SIZE_BUCKETS)),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {name: {} for name, _, _, _ in self.METRICS}
+        self._factories = {name: factory for name, _, _, factory in self.METRICS}
+        self._requests = {}
+
+    def record(self, view, status, duration, queries, db_time, render_time, size):
+        values = (
+            ('greenkart_request_duration_seconds', duration),
+            ('greenkart_request_db_queries', queries),
+            ('greenkart_request_db_seconds', db_time),
+            ('greenkart_request_template_seconds', render_time),
+            ('greenkart_response_size_bytes', size),
+        )
+        with self._lock:
+            key = (view, f"{status // 100}xx")
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for name, value in values:
+                if value is None:
+                    continue
+                series = self._series[name]
+                if view not in series:
+                    series[view] = self._factories[name]()
+                series[view].observe(value)
+
+    def reset(self):
+        with self._lock:
+            for series in self._series.values():
+                series.clear()
+            self._requests.clear()
+
+    def render(self):
+        """Return every series in the Prometheus text exposition format."""
+        lines = [
+            '# HELP greenkart_requests_total Requests handled, by view and status class.',
+            '# TYPE greenkart_requests_total counter',
+        ]
+        with self._lock:
+            for (view, status), count in sorted(self._requests.items()):
+                lines.append(f'greenkart_requests_total{{view="{_escape(view)}",status="{status}"}} {count}')
+
+            for name, help_text, kind, _ in self.METRICS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for view, metric in sorted(self._series[name].items()):
+                    label = f'view="{_escape(view)}"'
+                    if kind == 'histogram':
+                        cumulative = 0
+                        for bound, count in zip(metric.buckets, metric.counts):
+                            cumulative += count
+                            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {metric.count}')
+                    lines.append(f'{name}_sum{{{label}}} {metric.sum:.6f}')
+                    lines.append(f'{name}_count{{{label}}} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+class RequestSample:
+    """Counters for the request currently being handled."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        # True while a template is rendering, so that templates it renders
+        # itself (included cards, {% product_cards %}) are not timed twice
+        self.rendering = False
+
+
+_current_sample = ContextVar('greenkart_request_sample', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    """
+    django.db execute_wrapper installed on every connection. Counts into the
+    current request's sample; the async ORM runs queries in a worker thread
+    with its own connections but a copy of the request's context.
+    """
+    sample = _current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.db_time += time.perf_counter() - start
+        sample.queries += 1
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # connection_created receiver; fires again on every reconnect
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class RequestMetricsMiddleware:
+    """Record one sample per request, labelled with the resolved URL name."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sample = RequestSample()
+        token = _current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_sample.reset(token)
+        self.record(request, response, sample, start)
+        return response
+
+    async def __acall__(self, request):
+        sample = RequestSample()
+        token = _current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_sample.reset(token)
+        self.record(request, response, sample, start)
+        return response
+
+    def record(self, request, response, sample, start):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else UNRESOLVED
+        registry.record(
+            view=view,
+            status=response.status_code,
+            duration=time.perf_counter() - start,
+            queries=sample.queries,
+            db_time=sample.db_time,
+            render_time=sample.render_time,
+            size=None if response.streaming else len(response.content),
+        )
+
+
+# ============================
+# Template render timing
+# ============================
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        sample = _current_sample.get()
+        if sample is None or sample.rendering:
+            return super().render(context, request)
+        sample.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            sample.render_time += time.perf_counter() - start
+            sample.rendering = False
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The stock Django template backend, timing each top-level render."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def metrics_view(request):
+    """The registry, for staff and for scrapers listed in METRICS_ALLOWED_IPS."""
+    user = getattr(request, 'user', None)
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS and not (user and user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
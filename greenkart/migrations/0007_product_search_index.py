@@ -0,0 +1,73 @@
+from django.db import migrations
+
+
+# External-content FTS5 table over greenkart_product. The triggers keep it in
+# step with every INSERT/UPDATE/DELETE, including bulk and queryset writes
+# that never send Django signals.
+CREATE_TABLE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS greenkart_product_fts USING fts5(
+        name, description, location,
+        content='greenkart_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+
+# Frozen copy of greenkart.search.TRIGGERS as of this migration; the app
+# module may change, this migration must not
+TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER greenkart_product_fts_ai AFTER INSERT ON greenkart_product BEGIN
+        INSERT INTO greenkart_product_fts(rowid, name, description, location)
+        VALUES (new.id, new.name, new.description, new.location);
+    END
+    """,
+    """
+    CREATE TRIGGER greenkart_product_fts_ad AFTER DELETE ON greenkart_product BEGIN
+        INSERT INTO greenkart_product_fts(greenkart_product_fts, rowid, name, description, location)
+        VALUES ('delete', old.id, old.name, old.description, old.location);
+    END
+    """,
+    """
+    CREATE TRIGGER greenkart_product_fts_au
+    AFTER UPDATE OF name, description, location ON greenkart_product BEGIN
+        INSERT INTO greenkart_product_fts(greenkart_product_fts, rowid, name, description, location)
+        VALUES ('delete', old.id, old.name, old.description, old.location);
+        INSERT INTO greenkart_product_fts(rowid, name, description, location)
+        VALUES (new.id, new.name, new.description, new.location);
+    END
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS greenkart_product_fts_au",
+    "DROP TRIGGER IF EXISTS greenkart_product_fts_ad",
+    "DROP TRIGGER IF EXISTS greenkart_product_fts_ai",
+    "DROP TABLE IF EXISTS greenkart_product_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_TABLE_SQL)
+    for statement in TRIGGERS_SQL:
+        schema_editor.execute(statement)
+    schema_editor.execute("INSERT INTO greenkart_product_fts(greenkart_product_fts) VALUES ('rebuild')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenkart', '0006_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:12
+
+import greenkart.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenkart', '0009_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=greenkart.storage.get_product_image_storage, upload_to='product_images/'),
+        ),
+    ]
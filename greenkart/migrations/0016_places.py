@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def load_places(apps, schema_editor):
+    from greenkart.geo import geocode_products, load_gazetteer
+
+    Place = apps.get_model('greenkart', 'Place')
+    load_gazetteer(place_model=Place)
+    geocode_products(product_model=apps.get_model('greenkart', 'Product'), place_model=Place)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenkart', '0015_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=100)),
+                ('aliases', models.CharField(blank=True, max_length=255)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('cell', models.IntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cell'], name='place_cell_idx')],
+                'unique_together': {('name', 'state')},
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='place',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='greenkart.place'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['place', '-created_at', '-id'], name='product_place_created_idx'),
+        ),
+        migrations.RunPython(load_places, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:54
+
+from django.db import migrations, models
+
+
+def count_facets(apps, schema_editor):
+    from greenkart.facets import rebuild_facets
+
+    rebuild_facets(product_model=apps.get_model('greenkart', 'Product'),
+                   facet_model=apps.get_model('greenkart', 'FacetCount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenkart', '0016_places'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('place', 'Place'), ('farmer', 'Farmer'), ('price', 'Price'), ('stock', 'Stock')], max_length=10)),
+                ('value', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_band',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['farmer', '-created_at', '-id'], name='product_farmer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price_band', '-created_at', '-id'], name='product_price_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facetcount',
+            index=models.Index(fields=['facet', '-count', 'value'], name='facet_count_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='facetcount',
+            unique_together={('facet', 'value')},
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
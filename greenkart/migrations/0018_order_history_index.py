@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenkart', '0017_catalogue_facets'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_consumer_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['consumer', '-created_at', '-id'], name='order_consumer_created_idx'),
+        ),
+    ]
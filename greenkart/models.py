@@ -4,6 +4,8 @@ from django.utils import timezone
 from decimal import Decimal
 import uuid
 
+from .storage import get_product_image_storage
+
 
 # ============================
 # Custom User Manager
@@ -59,6 +61,32 @@ class User(AbstractUser):
         return f"{self.email} ({self.role})"
 
 
+# ============================
+# Place Model
+# ============================
+# Towns and cities from the bundled gazetteer (greenkart/data/gazetteer.csv),
+# which products' free-text locations are matched against. cell is the
+# place's square in a fixed latitude/longitude grid (see greenkart.geo) so
+# the places around a point are found with a few index range scans.
+class Place(models.Model):
+    name = models.CharField(max_length=100)
+    state = models.CharField(max_length=100)
+    # Other names the place is known by, separated by ';'
+    aliases = models.CharField(max_length=255, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    cell = models.IntegerField()
+
+    class Meta:
+        unique_together = ('name', 'state')
+        indexes = [
+            models.Index(fields=['cell'], name='place_cell_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}, {self.state}"
+
+
 # ============================
 # Product Model
 # ============================
@@ -67,14 +95,51 @@ class Product(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     quantity = models.PositiveIntegerField()
+    # Units held by unexpired checkout reservations; never more than quantity
+    reserved_quantity = models.PositiveIntegerField(default=0)
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    image = models.ImageField(upload_to='product_images/', blank=True, null=True)
+    # Stored by content hash; indexed because the number of products naming
+    # a file is its reference count
+    image = models.ImageField(upload_to='product_images/', storage=get_product_image_storage,
+                              blank=True, null=True, db_index=True)
+    # Resized copies of image, filled in by greenkart.images after upload
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     location = models.CharField(max_length=100)
+    # The gazetteer place ``location`` names, if any; kept in step with
+    # location by greenkart.geo. Indexed with created_at below.
+    place = models.ForeignKey(Place, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                              db_index=False, related_name='products')
+    # Which of greenkart.facets.PRICE_BANDS price falls in; set on save
+    price_band = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(default=timezone.now)
+    # Part of the cached card keys and the catalogue validators; queryset
+    # updates of shown fields must set it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Backs the keyset pagination of the consumer catalogue
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            # Newest products of one farmer / price band, for catalogue filters
+            models.Index(fields=['farmer', '-created_at', '-id'], name='product_farmer_created_idx'),
+            models.Index(fields=['price_band', '-created_at', '-id'], name='product_price_created_idx'),
+            # Bulk imports match rows to existing products by farmer and name
+            models.Index(fields=['farmer', 'name'], name='product_farmer_name_idx'),
+            # Admin prefix search
+            models.Index(fields=['name'], name='product_name_idx'),
+            # Newest products of each place, for the "near me" queries
+            models.Index(fields=['place', '-created_at', '-id'], name='product_place_created_idx'),
+            # The catalogue validator's MAX(updated_at)
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.farmer.email}"
 
+    @property
+    def available_quantity(self):
+        return self.quantity - self.reserved_quantity
+
 
 # ============================
 # Cart Model
@@ -87,6 +152,10 @@ class CartItem(models.Model):
 
     class Meta:
         unique_together = ('user', 'product')
+        indexes = [
+            # A shopper's cart in the order items were added
+            models.Index(fields=['user', 'added_at'], name='cartitem_user_added_idx'),
+        ]
 
     def subtotal(self):
         return self.product.price * self.quantity
@@ -95,6 +164,23 @@ class CartItem(models.Model):
         return f"{self.product.name} x {self.quantity}"
 
 
+# ============================
+# Stock Reservation Model
+# ============================
+class StockReservation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('user', 'product')
+
+    def __str__(self):
+        return f"{self.product.name} x {self.quantity} held for {self.user.email}"
+
+
 # ============================
 # Payment Model
 # ============================
@@ -121,6 +207,14 @@ class Payment(models.Model):
     method = models.CharField(max_length=50, blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
+    # The orders page validators; queryset updates of status must set it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Admin date_hierarchy narrowing
+            models.Index(fields=['created_at'], name='payment_created_idx'),
+        ]
 
     def __str__(self):
         return f"Payment {self.transaction_id} - {self.status} - ₹{self.amount}"
@@ -141,6 +235,19 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(default=timezone.now)
+    # The orders page validators; queryset updates of shown fields must set it
+    updated_at = models.DateTimeField(auto_now=True)
+    # Whether this order is currently added into the sales rollups; flipped
+    # by greenkart.analytics so an order is never counted twice
+    counted_in_sales = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            # Admin date_hierarchy narrowing and ledger date ranges
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            # A consumer's order history, newest first; id orders keyset pages
+            models.Index(fields=['consumer', '-created_at', '-id'], name='order_consumer_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.consumer.email} - {self.status}"
@@ -163,3 +270,108 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} (x{self.quantity})"
+
+
+# ============================
+# Sales rollup Models
+# ============================
+# Daily totals kept up to date by greenkart.analytics as orders are paid or
+# cancelled, so the farmer analytics page reads a few rows per day instead
+# of scanning OrderItem.
+class ProductSalesDaily(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='product_daily_sales')
+    day = models.DateField()
+    units_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'day')
+        indexes = [
+            models.Index(fields=['farmer', 'day'], name='product_sales_farmer_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.units_sold} sold"
+
+
+class FarmerSalesDaily(models.Model):
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    units_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('farmer', 'day')
+
+    def __str__(self):
+        return f"{self.farmer_id} on {self.day}: ₹{self.revenue}"
+
+
+# ============================
+# Catalogue facet Model
+# ============================
+# How many products each catalogue filter value matches, kept up to date by
+# greenkart.facets as products are saved, deleted or sell out, so the
+# dashboard's filter counts are read from a few rows instead of GROUP BY
+# queries over Product.
+class FacetCount(models.Model):
+    FACET_CHOICES = (
+        ('place', 'Place'),
+        ('farmer', 'Farmer'),
+        ('price', 'Price'),
+        ('stock', 'Stock'),
+    )
+
+    facet = models.CharField(max_length=10, choices=FACET_CHOICES)
+    # A place or farmer id, a price band, or 1/0 for in/out of stock
+    value = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value')
+        indexes = [
+            # The most common values of a facet
+            models.Index(fields=['facet', '-count', 'value'], name='facet_count_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.count}"
+
+
+# ============================
+# Background Task Model
+# ============================
+# A job for the database-backed task queue (see greenkart.taskqueue).
+# run_at is when the task may next be picked up: a worker that claims it
+# moves run_at past the task's visibility timeout, so if that worker dies
+# the task becomes available again. Finished tasks are deleted; tasks that
+# ran out of attempts stay behind as 'failed'.
+class Task(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Higher runs first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Workers take the most urgent queued task that is due
+            models.Index(fields=['status', '-priority', 'run_at'], name='task_ready_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,105 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+# ============================
+# Keyset (cursor) pagination
+# ============================
+# Pages are walked with a WHERE clause on (created_at, id) instead of OFFSET,
+# so fetching page 500 costs the same index range scan as fetching page 1.
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 60
+
+
+def encode_cursor(created_at, pk):
+    """Pack the sort key of the last row on a page into an opaque token."""
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (created_at, pk) for a cursor token, or None if it is invalid."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return None
+
+
+def clamp_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def page_query(params):
+    """``params`` (request.GET) without the paging parameters, urlencoded for "Load more" links."""
+    params = params.copy()
+    for name in ('cursor', 'fragment'):
+        params.pop(name, None)
+    return params.urlencode()
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of ``queryset`` ordered newest first by (created_at, id).
+
+    One extra row is fetched to learn whether another page exists, so no
+    COUNT(*) is ever issued.
+    """
+    rows = list(_page_queryset(queryset, cursor, page_size))
+    return _keyset_page(rows, page_size)
+
+
+async def akeyset_paginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Async version of keyset_paginate()."""
+    rows = [row async for row in _page_queryset(queryset, cursor, page_size)]
+    return _keyset_page(rows, page_size)
+
+
+def _page_queryset(queryset, cursor, page_size):
+    queryset = queryset.order_by('-created_at', '-id')
+    position = decode_cursor(cursor)
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+    return queryset[:page_size + 1]
+
+
+def _keyset_page(rows, page_size):
+    items = rows[:page_size]
+    next_cursor = None
+    if len(rows) > page_size:
+        last = items[-1]
+        if isinstance(last, dict):
+            # a values() page; it must include created_at and id
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+        else:
+            next_cursor = encode_cursor(last.created_at, last.pk)
+    return KeysetPage(items, next_cursor)
@@ -0,0 +1,161 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+
+from .exceptions import InsufficientStockError
+from .models import CartItem, Product, StockReservation
+
+
+# ============================
+# Stock reservations
+# ============================
+# A reservation holds units of a product for one shopper while they check
+# out. Holds are taken with one conditional UPDATE over the product rows
+# ("quantity - reserved >= n" for each), so concurrent shoppers only contend
+# on the rows they actually share and the last unit can never be promised
+# twice.
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+
+
+def _hold(deltas):
+    """
+    Move ``{product_id: delta}`` units into (or out of, if negative) the
+    products' held stock in one UPDATE. All-or-nothing: raises
+    InsufficientStockError, listing the short products, if any positive
+    delta is more than the product has free.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    enough = Q()
+    for product_id, delta in deltas.items():
+        if delta > 0:
+            enough |= Q(pk=product_id, free__gte=delta)
+        else:
+            enough |= Q(pk=product_id)
+    try:
+        with transaction.atomic():
+            updated = Product.objects.alias(free=F('quantity') - F('reserved_quantity')).filter(enough).update(
+                reserved_quantity=Case(
+                    *[When(pk=product_id, then=F('reserved_quantity') + delta)
+                      for product_id, delta in deltas.items()],
+                    output_field=PositiveIntegerField(),
+                ),
+            )
+            if updated != len(deltas):
+                raise InsufficientStockError(set())
+    except InsufficientStockError:
+        wanted = {product_id: delta for product_id, delta in deltas.items() if delta > 0}
+        free = dict(Product.objects.filter(pk__in=wanted).annotate(free=F('quantity') - F('reserved_quantity'))
+                    .values_list('pk', 'free'))
+        raise InsufficientStockError({product_id for product_id, delta in wanted.items()
+                                      if free.get(product_id, 0) < delta} or set(wanted))
+
+
+def _unhold(quantities):
+    """Return ``{product_id: quantity}`` held units to stock in one UPDATE."""
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(reserved_quantity=Case(
+        *[When(pk=product_id, then=F('reserved_quantity') - quantity)
+          for product_id, quantity in quantities.items()],
+        output_field=PositiveIntegerField(),
+    ))
+
+
+def reserve(user, product_id, quantity):
+    """
+    Make ``user``'s hold on ``product_id`` exactly ``quantity`` units and
+    push its expiry forward. Raises InsufficientStockError if the extra
+    units are not available.
+    """
+    with transaction.atomic():
+        existing = StockReservation.objects.select_for_update().filter(user=user, product_id=product_id).first()
+        held = existing.quantity if existing else 0
+        _hold({product_id: quantity - held})
+
+        expires_at = timezone.now() + reservation_ttl()
+        if existing:
+            StockReservation.objects.filter(pk=existing.pk).update(quantity=quantity, expires_at=expires_at)
+        else:
+            StockReservation.objects.create(user=user, product_id=product_id,
+                                            quantity=quantity, expires_at=expires_at)
+
+
+def reserve_cart(user):
+    """
+    Hold stock for every line in ``user``'s cart. Lines whose hold already
+    matches the cart only get their expiry refreshed. All-or-nothing: if any
+    line is short, no hold changes and InsufficientStockError lists them.
+    """
+    with transaction.atomic():
+        wanted = dict(CartItem.objects.filter(user=user).values_list('product_id', 'quantity'))
+        # Locked, so release_expired() can't return a hold this is resizing
+        held = dict(StockReservation.objects.select_for_update().filter(user=user)
+                    .values_list('product_id', 'quantity'))
+        # Holds for products that left the cart go back to stock, all in the
+        # same UPDATE
+        _hold({
+            **{product_id: -quantity for product_id, quantity in held.items() if product_id not in wanted},
+            **{product_id: quantity - held.get(product_id, 0) for product_id, quantity in wanted.items()},
+        })
+        StockReservation.objects.filter(user=user).exclude(product_id__in=wanted).delete()
+
+        expires_at = timezone.now() + reservation_ttl()
+        StockReservation.objects.bulk_create(
+            [StockReservation(user=user, product_id=product_id, quantity=quantity, expires_at=expires_at)
+             for product_id, quantity in wanted.items()],
+            update_conflicts=True,
+            unique_fields=['user', 'product'],
+            update_fields=['quantity', 'expires_at'],
+        )
+    return wanted
+
+
+def release(user, product_ids=None):
+    """Drop ``user``'s holds (optionally only for ``product_ids``) and return the units to stock."""
+    with transaction.atomic():
+        reservations = StockReservation.objects.filter(user=user)
+        if product_ids is not None:
+            reservations = reservations.filter(product_id__in=product_ids)
+        quantities = dict(reservations.select_for_update().values_list('product_id', 'quantity'))
+        if quantities:
+            reservations.filter(product_id__in=quantities).delete()
+            _unhold(quantities)
+
+
+def release_expired(now=None, batch_size=500):
+    """
+    Return stock held by expired reservations. Each row is deleted with a
+    condition on its expiry and quantity, so a hold refreshed by its shopper
+    between the SELECT and the DELETE is left alone. Returns the number of
+    reservations released.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        batch = list(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .values_list('pk', 'product_id', 'quantity')[:batch_size]
+        )
+        if not batch:
+            return released
+
+        quantities = {}
+        deleted_in_batch = 0
+        with transaction.atomic():
+            for pk, product_id, quantity in batch:
+                deleted, _ = StockReservation.objects.filter(
+                    pk=pk, expires_at__lte=now, quantity=quantity,
+                ).delete()
+                if deleted:
+                    deleted_in_batch += 1
+                    quantities[product_id] = quantities.get(product_id, 0) + quantity
+            _unhold(quantities)
+        released += deleted_in_batch
+        if len(batch) < batch_size or not deleted_in_batch:
+            return released
@@ -0,0 +1,124 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# ============================
+# Read replicas
+# ============================
+# Views decorated with @read_from_replica run their reads against one of
+# settings.DATABASE_REPLICAS; everything else, and every write, uses the
+# primary ("default"). After a request that writes (any unsafe method, or a
+# GET view decorated with @writes_to_primary) the shopper is pinned to the
+# primary for REPLICA_PIN_SECONDS by a cookie, so they always see their own
+# changes while the replicas catch up. A request reads from one replica
+# throughout, so its conditional GET validators and its page agree.
+#
+# Only the shop's own tables are read from replicas. Sessions and users stay
+# on the primary: a replica lagging behind a login would otherwise log the
+# shopper straight back out.
+PIN_COOKIE = 'greenkart_primary'
+
+# The replica the current request reads from, if any
+_replica_alias = ContextVar('greenkart_replica_alias', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def read_from_replica(view):
+    view.read_from_replica = True
+    return view
+
+
+def writes_to_primary(view):
+    view.writes_to_primary = True
+    return view
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica_alias.get()
+        if alias is None:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label != 'greenkart' or model._meta.label == settings.AUTH_USER_MODEL:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction on the primary must see its writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Explicit, so saving an object read from a replica goes to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Decide in the request's own context, not in a worker thread
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request._replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                _replica_alias.reset(request._replica_token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        request._replica_token = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                _replica_alias.reset(request._replica_token)
+        return self.pin(request, response)
+
+    def pin(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') or getattr(request, 'wrote_to_primary', False):
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'writes_to_primary', False):
+            request.wrote_to_primary = True
+        elif (getattr(view_func, 'read_from_replica', False)
+              and replicas()
+              and request.method in ('GET', 'HEAD')
+              and PIN_COOKIE not in request.COOKIES):
+            request._replica_token = _replica_alias.set(random.choice(replicas()))
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        return ReplicaRoutingMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
@@ -0,0 +1,183 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+from .pagination import DEFAULT_PAGE_SIZE, KeysetPage
+
+
+# ============================
+# Product full-text search
+# ============================
+# On SQLite the catalogue is indexed by the FTS5 table created in migration
+# 0007; triggers keep it in sync with greenkart_product. Other backends fall
+# back to a plain icontains filter.
+FTS_TABLE = 'greenkart_product_fts'
+
+# SQLite can't alter most columns in place, so migrations that touch Product
+# rebuild greenkart_product, and the triggers go with the old table.
+# ensure_search_triggers() puts them back after every migrate. Migration 0007
+# keeps its own frozen copy of this SQL.
+TRIGGERS = {
+    'greenkart_product_fts_ai': f"""
+        CREATE TRIGGER greenkart_product_fts_ai AFTER INSERT ON greenkart_product BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description, location)
+            VALUES (new.id, new.name, new.description, new.location);
+        END""",
+    'greenkart_product_fts_ad': f"""
+        CREATE TRIGGER greenkart_product_fts_ad AFTER DELETE ON greenkart_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, location)
+            VALUES ('delete', old.id, old.name, old.description, old.location);
+        END""",
+    'greenkart_product_fts_au': f"""
+        CREATE TRIGGER greenkart_product_fts_au
+        AFTER UPDATE OF name, description, location ON greenkart_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, location)
+            VALUES ('delete', old.id, old.name, old.description, old.location);
+            INSERT INTO {FTS_TABLE}(rowid, name, description, location)
+            VALUES (new.id, new.name, new.description, new.location);
+        END""",
+}
+
+# bm25() column weights: a hit in the name counts more than one in the
+# location, which counts more than one in the description.
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+LOCATION_WEIGHT = 4.0
+
+MAX_TERMS = 8
+
+# Ranked results can only be paged by offset; nobody pages this deep, and
+# the cap keeps a forged cursor from reaching the database as a huge OFFSET
+MAX_SEARCH_DEPTH = 1000
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(text):
+    """
+    Turn free text typed by a shopper into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term so FTS5 syntax characters in the
+    input can never produce a query error; terms are ANDed together.
+    """
+    terms = TOKEN_RE.findall((text or '').lower())[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_product_ids(text, limit=DEFAULT_PAGE_SIZE, offset=0, using='default'):
+    """Return product ids matching ``text``, best match first."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return list(_fallback_queryset(text).using(using)
+                    .values_list('id', flat=True)[offset:offset + limit])
+
+    match = build_match_query(text)
+    if not match:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s), rowid DESC LIMIT %s OFFSET %s",
+            [match, NAME_WEIGHT, DESCRIPTION_WEIGHT, LOCATION_WEIGHT, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def filter_matching(queryset, text):
+    """
+    ``queryset`` narrowed to the products matching ``text``, in its own
+    order; for searches combined with filters, which rank by recency.
+    """
+    if connections[queryset.db].vendor != 'sqlite':
+        return queryset.filter(pk__in=_fallback_queryset(text).values('pk'))
+    match = build_match_query(text)
+    if not match:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]))
+
+
+def search_products(text, limit=DEFAULT_PAGE_SIZE, offset=0, queryset=None):
+    """Return ranked Product instances for ``text``."""
+    queryset = queryset if queryset is not None else Product.objects.all()
+    ids = search_product_ids(text, limit=limit, offset=offset, using=queryset.db)
+    found = queryset.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def search_page(text, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return a page of ranked results shaped like a keyset page.
+
+    Relevance order has no stable sort key to seek on, so the cursor here is
+    a plain result offset.
+    """
+    offset = search_offset(cursor)
+    products = search_products(text, limit=page_size + 1, offset=offset)
+    return KeysetPage(products[:page_size], next_search_cursor(offset, page_size, len(products)))
+
+
+def search_offset(cursor):
+    """The result offset a search cursor stands for, at most MAX_SEARCH_DEPTH."""
+    try:
+        offset = int(cursor or 0)
+    except ValueError:
+        return 0
+    return max(0, min(offset, MAX_SEARCH_DEPTH))
+
+
+def next_search_cursor(offset, page_size, fetched):
+    """Cursor for the page after one fetched with ``page_size + 1`` rows from ``offset``."""
+    following = offset + page_size
+    if fetched > page_size and following < MAX_SEARCH_DEPTH:
+        return str(following)
+    return None
+
+
+def rebuild_index(using='default'):
+    """Repopulate the FTS table from greenkart_product."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def ensure_search_triggers(using='default'):
+    """
+    Recreate any missing sync trigger and, if one was missing, rebuild the
+    index since writes made without it were not indexed. Returns the names of
+    the triggers created.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+        )
+        if cursor.fetchone() is None:
+            # migration 0007 not applied yet
+            return []
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(TRIGGERS[name])
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return missing
+
+
+def _fallback_queryset(text):
+    terms = TOKEN_RE.findall(text or '')[:MAX_TERMS]
+    if not terms:
+        return Product.objects.none()
+    queryset = Product.objects.all()
+    for term in terms:
+        queryset = queryset.filter(
+            Q(name__icontains=term) | Q(description__icontains=term) | Q(location__icontains=term)
+        )
+    return queryset.order_by('-created_at', '-id')
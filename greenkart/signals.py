@@ -0,0 +1,89 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .analytics import reverse_sale
+from .cart import flush_cart
+from .facets import FACET_FIELDS, count_changes, price_band
+from .geo import geocode, reset_geocoder
+from .images import needs_variants, schedule_variants
+from .models import Order, Place, Product
+from .search import ensure_search_triggers
+from .storage import release_image
+
+
+def restore_search_triggers(sender, using='default', **kwargs):
+    # post_migrate, connected in GreenkartConfig.ready()
+    ensure_search_triggers(using=using)
+
+
+@receiver(pre_save, sender=Product)
+def derive_product_fields(sender, instance, **kwargs):
+    # The farmer forms assign the raw POST strings; convert them the way the
+    # database would before deriving anything from them
+    for field in ('price', 'quantity'):
+        setattr(instance, field, Product._meta.get_field(field).to_python(getattr(instance, field)))
+    # A dictionary lookup; the gazetteer is cached per process
+    instance.place_id = geocode(instance.location)
+    instance.price_band = price_band(instance.price)
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_state(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk:
+        instance._previous = (
+            Product.objects.filter(pk=instance.pk).values('image', 'image_variants', *FACET_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    count_changes(removed=[previous] if previous else [], added=[instance])
+    if previous and previous['image'] and previous['image'] != instance.image.name:
+        # The old upload may now be an orphan
+        old_name, old_variants = previous['image'], previous['image_variants']
+        transaction.on_commit(lambda: release_image(old_name, old_variants))
+
+    if needs_variants(instance):
+        schedule_variants(instance)
+    elif not instance.image and instance.image_variants:
+        instance.image_variants, instance.updated_at = {}, timezone.now()
+        Product.objects.filter(pk=instance.pk).update(image_variants={}, updated_at=instance.updated_at)
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # Before the delete, while its items still exist
+    if instance.counted_in_sales:
+        reverse_sale(instance)
+
+
+@receiver(user_logged_out)
+def write_back_cart(sender, request, user, **kwargs):
+    if user is not None:
+        flush_cart(user.pk)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_deleted_facets(sender, instance, **kwargs):
+    # The stored values; stock may have changed since instance was loaded
+    instance._previous = Product.objects.filter(pk=instance.pk).values(*FACET_FIELDS).first()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    count_changes(removed=[previous] if previous else [])
+    if instance.image:
+        name, variants = instance.image.name, instance.image_variants
+        transaction.on_commit(lambda: release_image(name, variants))
+
+
+@receiver(post_save, sender=Place)
+@receiver(post_delete, sender=Place)
+def place_changed(sender, **kwargs):
+    reset_geocoder()
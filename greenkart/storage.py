@@ -0,0 +1,208 @@
+import gzip
+import hashlib
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.contrib.staticfiles.views import serve as serve_static_from_finders
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.cache import patch_vary_headers
+from django.utils.deconstruct import deconstructible
+from django.views.static import serve
+
+try:
+    import brotli
+except ImportError:  # optional; without it only gzip copies are written
+    brotli = None
+
+
+# ============================
+# Content-addressed media storage
+# ============================
+# Files are named after the SHA-256 of their bytes:
+#   product_images/3f/3f9a...c1.jpeg
+# so a photo uploaded twice is stored once, and a URL never changes meaning
+# and can be cached forever. A file is shared by every Product whose image
+# names it; the number of such rows is its reference count, and the file is
+# deleted when that reaches zero (see release_image).
+HASHED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}\.[\w]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+@deconstructible(path='greenkart.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, *args, **kwargs):
+        # Two concurrent uploads of the same bytes write the same name;
+        # overwriting identical content is harmless.
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(*args, **kwargs)
+
+    @staticmethod
+    def content_digest(content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return digest.hexdigest()
+
+    def hashed_name(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        digest = self.content_digest(content)
+        return posixpath.join(directory, digest[:2], f"{digest}{extension}")
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content is hashed in _save
+        return name
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+product_image_storage = ContentAddressedStorage()
+
+
+def get_product_image_storage():
+    return product_image_storage
+
+
+def is_content_addressed(name):
+    return bool(name and HASHED_NAME_RE.search(name))
+
+
+def release_image(name, variants=None):
+    """
+    Delete the image file ``name`` and its variants if no product refers
+    to it any more.
+    """
+    from .images import delete_variants
+    from .models import Product
+
+    if not name or Product.objects.filter(image=name).exists():
+        return False
+    if product_image_storage.exists(name):
+        product_image_storage.delete(name)
+    if variants:
+        delete_variants(variants, product_image_storage)
+    return True
+
+
+def serve_media(request, path, document_root=None):
+    """django.views.static.serve, marking content-addressed files immutable."""
+    response = serve(request, path, document_root=document_root)
+    if is_content_addressed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 86400)}"
+    return response
+
+
+# ============================
+# Static files
+# ============================
+# collectstatic stores every static file under a name containing a hash of
+# its content (base.css -> base.1f0e3dad9990.css), records the mapping in
+# staticfiles.json for {% static %}, and writes gzip (.gz) and, when the
+# brotli package is installed, brotli (.br) copies of the text files next
+# to the hashed ones. A hashed name never changes meaning, so it is served
+# as immutable; a web server in front can serve the copies as they are
+# (nginx gzip_static / brotli_static), and so does serve_static.
+PRECOMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.xml', '.map')
+# Below this the compression framing outweighs the saving
+PRECOMPRESS_MIN_SIZE = 256
+# Accept-Encoding token and file suffix, preferred first
+PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def stored_name(self, name):
+        # Until collectstatic has written a manifest (a fresh checkout, the
+        # test suite) link to the plain names, found by the finders
+        if not self.hashed_files:
+            return name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected (e.g. a missing placeholder image): keep the
+            # plain link, which 404s as it did before, rather than a 500
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            if name.endswith(PRECOMPRESS_EXTENSIONS):
+                self.precompress(name)
+
+    def precompress(self, name):
+        """Write the .gz (and .br) copies of ``name`` that are smaller than it. Returns their names."""
+        with self.open(name) as source:
+            content = source.read()
+        if len(content) < PRECOMPRESS_MIN_SIZE:
+            return []
+        copies = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            copies['.br'] = brotli.compress(content, quality=11)
+
+        written = []
+        for suffix, compressed in copies.items():
+            if len(compressed) >= len(content):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            written.append(self._save(name + suffix, ContentFile(compressed)))
+        return written
+
+    def is_hashed(self, name):
+        if not hasattr(self, '_hashed_names'):
+            self._hashed_names = set(self.hashed_files.values())
+        return name in self._hashed_names
+
+
+def accepted_encodings(request):
+    return {
+        part.split(';')[0].strip().lower()
+        for part in request.headers.get('Accept-Encoding', '').split(',')
+        if not part.replace(' ', '').endswith(';q=0')
+    }
+
+
+def serve_static(request, path):
+    """
+    Serve a static file with a Cache-Control header: from the app static
+    directories in DEBUG, from STATIC_ROOT (after collectstatic) otherwise,
+    using a precompressed copy when the client accepts it. Put a web server
+    or CDN in front of this in production.
+    """
+    if settings.DEBUG:
+        response = serve_static_from_finders(request, path)
+        response['Cache-Control'] = f"public, max-age={getattr(settings, 'STATIC_CACHE_MAX_AGE', 86400)}"
+        return response
+
+    served = path
+    if path.endswith(PRECOMPRESS_EXTENSIONS):
+        accepted = accepted_encodings(request)
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            if encoding in accepted and staticfiles_storage.exists(path + suffix):
+                served = path + suffix
+                break
+    # serve() sets Content-Type from the original extension and
+    # Content-Encoding from the .gz/.br one
+    response = serve(request, served, document_root=settings.STATIC_ROOT)
+    if path.endswith(PRECOMPRESS_EXTENSIONS):
+        patch_vary_headers(response, ['Accept-Encoding'])
+    if getattr(staticfiles_storage, 'is_hashed', None) and staticfiles_storage.is_hashed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = f"public, max-age={getattr(settings, 'STATIC_CACHE_MAX_AGE', 86400)}"
+    return response
@@ -0,0 +1,174 @@
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+# ============================
+# Background task queue
+# ============================
+# Work that does not have to finish before the response (sales rollups,
+# image variants, notifications) is stored as a Task row and run later by
+# ``manage.py run_task_worker``. There is no broker: the table is the queue.
+#
+#   @task(priority=5)
+#   def send_receipt(order_id): ...
+#
+#   enqueue(send_receipt, order_id=order.pk)
+#
+# enqueue() inserts the row in the caller's transaction, so a task is only
+# ever seen by workers if the work that queued it committed. Tasks are
+# retried with exponential backoff until max_attempts, and a task whose
+# worker dies is picked up again once its visibility timeout passes, so a
+# task can run more than once: write them to be idempotent.
+TASKS = {}
+
+
+class TaskSpec:
+    def __init__(self, func, name, priority, max_attempts, timeout):
+        self.func = func
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+
+def task(name=None, priority=0, max_attempts=5, timeout=None):
+    """
+    Register a function as a background task. ``timeout`` (seconds, default
+    TASK_VISIBILITY_TIMEOUT) is how long a worker may take before the task
+    is handed to another worker.
+    """
+    def register(func):
+        spec = TaskSpec(func, name or f'{func.__module__}.{func.__name__}', priority, max_attempts, timeout)
+        TASKS[spec.name] = spec
+        return spec
+    return register
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(spec, priority=None, delay=0, **kwargs):
+    """
+    Queue a call of ``spec`` (a @task function) with JSON-serialisable
+    ``kwargs``, to run ``delay`` seconds from now at the earliest. With
+    TASKS_EAGER it runs in-process once the current transaction commits.
+    """
+    if _setting('TASKS_EAGER', False):
+        transaction.on_commit(lambda: spec(**kwargs))
+        return None
+    return Task.objects.create(
+        name=spec.name,
+        kwargs=kwargs,
+        priority=spec.priority if priority is None else priority,
+        max_attempts=spec.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts``: doubling, with jitter."""
+    base = _setting('TASK_RETRY_BACKOFF', 10)
+    delay = min(base * 2 ** (attempts - 1), _setting('TASK_RETRY_BACKOFF_MAX', 60 * 60))
+    return delay * random.uniform(0.9, 1.1)
+
+
+def claim(worker_name):
+    """
+    Take the most urgent due task, hiding it from other workers for its
+    visibility timeout. Returns the Task or None.
+    """
+    now = timezone.now()
+    due = Task.objects.filter(status='queued', run_at__lte=now).order_by('-priority', 'run_at', 'pk')
+    # Cheap check first, so an idle worker does not take the write lock
+    if not due.exists():
+        return None
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        claimed = due.first()
+        if claimed is None:
+            return None
+        spec = TASKS.get(claimed.name)
+        timeout = (spec and spec.timeout) or _setting('TASK_VISIBILITY_TIMEOUT', 5 * 60)
+        claimed.run_at = now + timedelta(seconds=timeout)
+        claimed.locked_by = worker_name
+        Task.objects.filter(pk=claimed.pk).update(
+            run_at=claimed.run_at, locked_by=worker_name, attempts=F('attempts') + 1,
+        )
+        claimed.attempts += 1
+    return claimed
+
+
+def run(claimed):
+    """Run a claimed task; delete it on success, reschedule or fail it on error."""
+    spec = TASKS.get(claimed.name)
+    try:
+        if spec is None:
+            raise LookupError(f"No task named {claimed.name!r} is registered")
+        spec(**claimed.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception("Task %s #%s failed (attempt %s of %s)",
+                         claimed.name, claimed.pk, claimed.attempts, claimed.max_attempts)
+        if spec is None or claimed.attempts >= claimed.max_attempts:
+            changes = {'status': 'failed'}
+        else:
+            changes = {'run_at': timezone.now() + timedelta(seconds=backoff(claimed.attempts))}
+        # Only if no other worker took the task over after a timeout
+        Task.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by).update(
+            last_error=error, locked_by='', **changes,
+        )
+        return False
+    Task.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by).delete()
+    return True
+
+
+class Worker:
+    """Claims and runs tasks one at a time until stopped."""
+
+    def __init__(self, name=None, poll_interval=1.0):
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.poll_interval = poll_interval
+        self.stopping = False
+
+    def run_once(self):
+        """Run one due task. Returns None if there was none, else whether it succeeded."""
+        close_old_connections()
+        claimed = claim(self.name)
+        if claimed is None:
+            return None
+        return run(claimed)
+
+    def run(self, burst=False, max_tasks=None):
+        """Work until stop() (or, with ``burst``, until the queue is empty). Returns tasks run."""
+        done = 0
+        while not self.stopping and (max_tasks is None or done < max_tasks):
+            result = self.run_once()
+            if result is None:
+                if burst:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            done += 1
+        return done
+
+    def stop(self, *args):
+        self.stopping = True
@@ -0,0 +1,11 @@
+from django import template
+
+from greenkart.fragments import render_product_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_cards(products, style='consumer'):
+    """Render a card for each product, served from the fragment cache when possible."""
+    return render_product_cards(products, style)
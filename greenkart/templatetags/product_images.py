@@ -0,0 +1,40 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from greenkart.images import VARIANTS
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_picture(product, variant='card', sizes='160px', default='images/default_product.png'):
+    """
+    Render a lazily-loaded <picture> for ``product``: WebP variants for
+    browsers that take them, JPEG variants otherwise, and the original upload
+    while variants are still being generated.
+    """
+    alt = product.name
+    if not product.image:
+        return format_html('<img src="{}" alt="{}" loading="lazy">', static(default), alt)
+
+    variants = product.image_variants or {}
+    if variants.get('source') != product.image.name or variant not in variants:
+        return format_html('<img src="{}" alt="{}" loading="lazy" decoding="async">', product.image.url, alt)
+
+    storage = product.image.storage
+    webp, jpeg = [], []
+    for name, _, _ in VARIANTS:
+        entry = variants.get(name)
+        if entry:
+            webp.append(f"{storage.url(entry['webp'])} {entry['width']}w")
+            jpeg.append(f"{storage.url(entry['jpeg'])} {entry['width']}w")
+    chosen = variants[variant]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        ', '.join(webp), sizes,
+        storage.url(chosen['jpeg']), ', '.join(jpeg), sizes, chosen['width'], chosen['height'], alt,
+    )
@@ -1,3 +1,1058 @@
-from django.test import TestCase
+import io
+import itertools
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.utils import load_backend
+from django.http import HttpResponse
+from django.template import engines
+from django.urls import reverse
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.test import AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from promptsync.db_profiles import database_profile
+
+from . import async_views, geo
+from .analytics import rebuild_rollups, sync_order_sales
+from .benchmarks import benchmark_sample, compare_results, generate_marketplace, run_benchmarks
+from .cart import _add_pending, add_item, cart_count, flush_all_carts, price_cart, remove_item
+from .checkout import place_order
+from .exceptions import EmptyCartError, InsufficientStockError
+from .facets import count_sold_out, facet_options, parse_filters, rebuild_facets
+from .fragments import render_product_cards
+from .geo import geocode, grid_cell, nearby_page, nearest_products, places_within, products_near
+from .images import VARIANTS, variant_files
+from .imports import detect_format, import_products
+from .management.commands.audit_query_plans import Command as AuditCommand
+from .metrics import RequestSample, _current_sample, registry
+from .models import (
+    CartItem, FacetCount, FarmerSalesDaily, Order, OrderItem, Payment, Place, Product, ProductSalesDaily,
+    StockReservation, Task, User,
+)
+from .pagination import decode_cursor, keyset_paginate
+from .reservations import release, release_expired, reserve, reserve_cart
+from .routers import PIN_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware, read_from_replica, writes_to_primary
+from .search import build_match_query, ensure_search_triggers, search_page, search_product_ids
+from .storage import IMMUTABLE_CACHE_CONTROL, is_content_addressed, product_image_storage, serve_static
+from .taskqueue import Worker, claim, enqueue, run, task
+
+
+@override_settings(CART_WRITE_BEHIND=True, CART_WRITE_BEHIND_BATCH=3, CART_WRITE_BEHIND_DELAY=3600)
+class CartWriteBehindTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        farmer = User.objects.create_user(email='cart-farmer@example.com', password='x', role='farmer')
+        self.shopper = User.objects.create_user(email='cart-shopper@example.com', password='x', role='consumer')
+        self.product = Product.objects.create(farmer=farmer, name='Okra', quantity=50, price=40, location='Pune')
+
+    def stored_quantity(self):
+        return CartItem.objects.get(user=self.shopper, product=self.product).quantity
+
+    def test_adds_wait_in_the_cache_until_priced(self):
+        add_item(self.shopper, self.product.pk, max_quantity=50)
+        add_item(self.shopper, self.product.pk, max_quantity=50)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(cart_count(self.shopper), 1)
+
+        cart = price_cart(self.shopper)
+        self.assertEqual((cart.items[0].quantity, cart.total), (2, Decimal('80.00')))
+        # The third pending unit fills the batch
+        for _ in range(3):
+            add_item(self.shopper, self.product.pk, max_quantity=50)
+        self.assertEqual(self.stored_quantity(), 5)
+
+    def test_a_new_line_is_counted_after_the_snapshot_is_dropped(self):
+        add_item(self.shopper, self.product.pk, max_quantity=50)
+        cache.delete(f'greenkart:cart:{self.shopper.pk}')
+        self.assertEqual(cart_count(self.shopper), 1)
+
+        remove_item(self.shopper, self.product.pk)
+        self.assertEqual(cart_count(self.shopper), 0)
+        self.assertEqual(list(price_cart(self.shopper)), [])
+
+    def test_a_new_line_is_capped_at_the_stock(self):
+        Product.objects.filter(pk=self.product.pk).update(quantity=1)
+        add_item(self.shopper, self.product.pk, max_quantity=1)
+        add_item(self.shopper, self.product.pk, max_quantity=1)
+        self.assertEqual(flush_all_carts(), 1)
+        self.assertEqual(self.stored_quantity(), 1)
+
+    @override_settings(CART_WRITE_BEHIND_BATCH=10 ** 6)
+    def test_concurrent_adds_are_all_counted(self):
+        add_item(self.shopper, self.product.pk, max_quantity=50)
+        self.assertEqual(flush_all_carts(), 1)
+        threads = [threading.Thread(target=lambda: [_add_pending(self.shopper.pk, self.product.pk) for _ in range(10)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(flush_all_carts(), 1)
+        self.assertEqual(self.stored_quantity(), 41)
+
+        # Registered again by the next add, and flushed by the next run
+        add_item(self.shopper, self.product.pk, max_quantity=50)
+        self.assertEqual(flush_all_carts(), 1)
+        self.assertEqual(self.stored_quantity(), 42)
+        self.assertEqual(flush_all_carts(), 0)
+
+    def test_adds_are_written_through_when_the_counter_is_lost(self):
+        add_item(self.shopper, self.product.pk, max_quantity=50)
+        price_cart(self.shopper)
+        with mock.patch.object(cache, 'incr', side_effect=ValueError):
+            add_item(self.shopper, self.product.pk, max_quantity=50)
+        self.assertEqual(self.stored_quantity(), 2)
+
+    @override_settings(CART_WRITE_BEHIND=False)
+    def test_without_write_behind_every_add_is_stored(self):
+        for _ in range(3):
+            add_item(self.shopper, self.product.pk, max_quantity=2)
+        self.assertEqual(self.stored_quantity(), 2)
+
+class PaymentFailureTests(TestCase):
+    def setUp(self):
+        farmer = User.objects.create_user(email='pay-farmer@example.com', password='x', role='farmer')
+        self.shopper = User.objects.create_user(email='pay-shopper@example.com', password='x', role='consumer')
+        product = Product.objects.create(farmer=farmer, name='Figs', quantity=5, price=30, location='Pune')
+        CartItem.objects.create(user=self.shopper, product=product, quantity=1)
+        self.client.force_login(self.shopper)
+        self.card = {'card_name': 'A Shopper', 'card_number': '4111111111111111', 'expiry': '12/30', 'cvv': '123'}
+
+    def test_unexpected_error_marks_the_payment_failed(self):
+        self.client.raise_request_exception = False
+        with mock.patch('greenkart.checkout.place_order', side_effect=RuntimeError('gateway down')):
+            response = self.client.post(reverse('process_payment'), self.card)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(list(Payment.objects.values_list('status', flat=True)), ['failed'])
+        self.assertTrue(CartItem.objects.filter(user=self.shopper).exists())
+
+    def test_api_checkout_marks_the_payment_failed_when_stock_runs_out(self):
+        Product.objects.update(quantity=0)
+        response = self.client.post(reverse('api_checkout'), self.card, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(Payment.objects.values_list('status', flat=True)), ['failed'])
+
+
+class ProductCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        farmer = User.objects.create_user(email='card-farmer@example.com', password='x', role='farmer')
+        self.product = Product.objects.create(farmer=farmer, name='Okra', quantity=5, price=40, location='Pune')
+
+    def test_an_edit_moves_the_card_to_a_new_key(self):
+        # Read before the edit, as by a concurrent request or a lagging replica
+        stale = Product.objects.get(pk=self.product.pk)
+        self.assertIn('Okra', render_product_cards([stale], 'consumer'))
+
+        self.product.name = 'Bhindi'
+        self.product.save()
+        render_product_cards([stale], 'consumer')
+        html = render_product_cards(Product.objects.filter(pk=self.product.pk), 'consumer')
+        self.assertIn('Bhindi', html)
+        self.assertNotIn('Okra', html)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.farmer = User.objects.create_user(email='metrics-farmer@example.com', password='x', role='farmer')
+        self.products = [
+            Product.objects.create(farmer=self.farmer, name=name, quantity=3, price=20, location='Pune')
+            for name in ('Leeks', 'Chard')
+        ]
+
+    def test_nested_card_renders_are_not_timed_twice(self):
+        page = engines.all()[0].from_string("{% load product_cards %}{% product_cards products 'farmer' %}")
+        sample = RequestSample()
+        token = _current_sample.set(sample)
+        try:
+            # Every perf_counter() call is one second later than the last
+            with mock.patch('greenkart.metrics.time.perf_counter', side_effect=itertools.count()):
+                page.render({'products': self.products})
+        finally:
+            _current_sample.reset(token)
+        self.assertEqual(sample.render_time, 1)
+
+    def test_metrics_are_for_staff_and_allowed_scrapers(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+        self.client.force_login(User.objects.create_superuser(email='metrics-admin@example.com', password='x'))
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'greenkart_requests_total{view="metrics",status="4xx"} 1')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.farmer = User.objects.create_user(email='etag-farmer@example.com', password='x', role='farmer')
+        self.consumer = User.objects.create_user(email='etag-consumer@example.com', password='x', role='consumer')
+        self.product = Product.objects.create(farmer=self.farmer, name='Okra', quantity=5, price=40, location='Pune')
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code
+
+    def test_catalogue_changes_change_the_etag(self):
+        self.client.force_login(self.consumer)
+        url = reverse('consumer_dashboard')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response), 304)
+
+        other = Product.objects.create(farmer=self.farmer, name='Kale', quantity=1, price=90, location='Pune')
+        self.assertEqual(self.revalidate(url, response), 200)
+        response = self.client.get(url)
+        other.delete()
+        self.assertEqual(self.revalidate(url, response), 200)
+
+    def test_revalidating_the_catalogue_does_not_count_it(self):
+        self.client.force_login(self.consumer)
+        url = reverse('consumer_dashboard')
+        response = self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.revalidate(url, response), 304)
+        product_counts = [query['sql'] for query in captured.captured_queries
+                          if 'COUNT(' in query['sql'] and 'FROM "greenkart_product"' in query['sql']]
+        self.assertEqual(product_counts, [])
+
+    def test_payment_status_changes_the_orders_etag(self):
+        self.client.force_login(self.consumer)
+        payment = Payment.objects.create(buyer=self.consumer, amount=40)
+        Order.objects.create(consumer=self.consumer, payment=payment, total_amount=40)
+        url = reverse('consumer_orders')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response), 304)
+
+        payment.status = 'paid'
+        payment.save()
+        self.assertEqual(self.revalidate(url, response), 200)
+
+
+class LedgerExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(email='ledger-staff@example.com', password='x', role='consumer',
+                                              is_staff=True)
+        farmer = User.objects.create_user(email='ledger-farmer@example.com', password='x', role='farmer')
+        product = Product.objects.create(farmer=farmer, name='=HYPERLINK("http://x")', quantity=5, price=40,
+                                         location='Pune')
+        order = Order.objects.create(consumer=self.staff, total_amount=80)
+        OrderItem.objects.create(order=order, product=product, quantity=2, price=40)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('export_ledger', args=['items', 'csv']))
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        header, row = body.splitlines()
+        self.assertTrue(header.startswith('order_item_id,order_id,'))
+        # The farmer's product name is not a formula in a spreadsheet
+        self.assertIn('"\'=HYPERLINK(""http://x"")"', row)
+
+    def test_streams_under_wsgi(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_ledger', args=['orders', 'jsonl']))
+        self.assertFalse(response.is_async)
+        self.assertIn('"total_amount": "80.00"', b''.join(response.streaming_content).decode())
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(email='pages-farmer@example.com', password='x', role='farmer')
+        created_at = timezone.now()
+        # Ties on created_at are broken by id
+        self.products = [
+            Product.objects.create(farmer=self.farmer, name=f'Squash {n}', quantity=1, price=10, location='Pune',
+                                   created_at=created_at - timedelta(minutes=n // 2))
+            for n in range(5)
+        ]
+
+    def test_cursors_walk_every_row_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            page = keyset_paginate(Product.objects.all(), cursor=cursor, page_size=2)
+            seen.extend(product.pk for product in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = sorted(self.products, key=lambda product: (product.created_at, product.pk), reverse=True)
+        self.assertEqual(seen, [product.pk for product in expected])
+
+    def test_a_new_row_does_not_shift_the_next_page(self):
+        first = keyset_paginate(Product.objects.all(), page_size=2)
+        Product.objects.create(farmer=self.farmer, name='Squash new', quantity=1, price=10, location='Pune')
+        second = keyset_paginate(Product.objects.all(), cursor=first.next_cursor, page_size=2)
+        self.assertEqual([product.name for product in second], ['Squash 3', 'Squash 2'])
+
+    def test_an_invalid_cursor_starts_from_the_top(self):
+        self.assertIsNone(decode_cursor('not a cursor'))
+        page = keyset_paginate(Product.objects.all(), cursor='not a cursor', page_size=2)
+        self.assertEqual([product.name for product in page], ['Squash 1', 'Squash 0'])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(email='search-farmer@example.com', password='x', role='farmer')
+
+    def add(self, name, description='', location='Pune'):
+        return Product.objects.create(farmer=self.farmer, name=name, description=description, quantity=1,
+                                      price=10, location=location)
+
+    def test_name_matches_rank_first(self):
+        in_description = self.add('Gourd', description='Tastes a little like mango')
+        in_name = self.add('Alphonso mango')
+        self.assertEqual(search_product_ids('mang'), [in_name.pk, in_description.pk])
+
+    def test_query_syntax_is_treated_as_words(self):
+        product = self.add('Curry leaves')
+        self.assertEqual(build_match_query('curry" OR (leaves*'), '"curry"* "or"* "leaves"*')
+        self.assertEqual(search_product_ids('"curry" (leaves'), [product.pk])
+
+    def test_edits_and_deletes_reach_the_index(self):
+        product = self.add('Spinach')
+        product.name = 'Palak'
+        product.save()
+        self.assertEqual(search_product_ids('spinach'), [])
+        self.assertEqual(search_product_ids('palak'), [product.pk])
+        product.delete()
+        self.assertEqual(search_product_ids('palak'), [])
+
+    def test_a_forged_cursor_stops_at_the_search_depth(self):
+        self.add('Okra')
+        page = search_page('okra', cursor='9' * 30)
+        self.assertEqual((list(page), page.next_cursor), ([], None))
+
+        self.client.force_login(User.objects.create_user(email='search-shopper@example.com', password='x',
+                                                         role='consumer'))
+        for url in (reverse('consumer_dashboard'), reverse('api_products')):
+            self.assertEqual(self.client.get(url, {'q': 'okra', 'cursor': '9' * 30}).status_code, 200)
+
+    def test_missing_triggers_are_restored_and_the_index_rebuilt(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER greenkart_product_fts_ai')
+        product = self.add('Drumstick')
+        self.assertEqual(search_product_ids('drumstick'), [])
+
+        self.assertEqual(ensure_search_triggers(), ['greenkart_product_fts_ai'])
+        self.assertEqual(search_product_ids('drumstick'), [product.pk])
+
+
+class CartPricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        farmer = User.objects.create_user(email='pricing-farmer@example.com', password='x', role='farmer')
+        self.shopper = User.objects.create_user(email='pricing-shopper@example.com', password='x', role='consumer')
+        self.beans = Product.objects.create(farmer=farmer, name='Beans', quantity=10, price='12.50', location='Pune')
+        corn = Product.objects.create(farmer=farmer, name='Corn', quantity=3, price=20, location='Pune')
+        CartItem.objects.create(user=self.shopper, product=self.beans, quantity=2)
+        CartItem.objects.create(user=self.shopper, product=corn, quantity=3)
+
+    def test_cart_is_priced_from_current_prices(self):
+        Product.objects.filter(pk=self.beans.pk).update(price='15.00')
+        # The lines and the total, however many lines there are
+        with self.assertNumQueries(2):
+            cart = price_cart(self.shopper)
+            lines = sorted((item.product.name, item.quantity, item.line_total) for item in cart.items)
+        self.assertEqual(cart.total, Decimal('90.00'))
+        self.assertEqual(lines, [('Beans', 2, Decimal('30.00')), ('Corn', 3, Decimal('60.00'))])
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        farmer = User.objects.create_user(email='checkout-farmer@example.com', password='x', role='farmer')
+        self.shopper = User.objects.create_user(email='checkout-shopper@example.com', password='x', role='consumer')
+        self.other = User.objects.create_user(email='checkout-other@example.com', password='x', role='consumer')
+        self.beans = Product.objects.create(farmer=farmer, name='Beans', quantity=10, price='12.50', location='Pune')
+        self.corn = Product.objects.create(farmer=farmer, name='Corn', quantity=3, price=20, location='Pune')
+        CartItem.objects.create(user=self.shopper, product=self.beans, quantity=2)
+        CartItem.objects.create(user=self.shopper, product=self.corn, quantity=3)
+
+    def test_order_takes_stock_and_empties_the_cart(self):
+        payment = Payment.objects.create(buyer=self.shopper, amount=85)
+        order = place_order(self.shopper, payment=payment)
+
+        self.assertEqual(order.total_amount, Decimal('85.00'))
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 2)
+        self.assertEqual(dict(Product.objects.values_list('name', 'quantity')), {'Beans': 8, 'Corn': 0})
+        self.assertFalse(Product.objects.exclude(reserved_quantity=0).exists())
+        self.assertEqual(Payment.objects.get().status, 'paid')
+        self.assertFalse(CartItem.objects.filter(user=self.shopper).exists())
+
+    def test_a_short_line_rolls_the_whole_order_back(self):
+        reserve(self.other, self.corn.pk, 1)
+        with self.assertRaises(InsufficientStockError) as raised:
+            place_order(self.shopper)
+        self.assertEqual(raised.exception.product_ids, {self.corn.pk})
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(dict(Product.objects.values_list('name', 'reserved_quantity')), {'Beans': 0, 'Corn': 1})
+        self.assertEqual(dict(Product.objects.values_list('name', 'quantity')), {'Beans': 10, 'Corn': 3})
+        self.assertEqual(CartItem.objects.filter(user=self.shopper).count(), 2)
+
+    def test_an_empty_cart_places_nothing(self):
+        with self.assertRaises(EmptyCartError):
+            place_order(self.other)
+        self.assertFalse(Order.objects.exists())
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        farmer = User.objects.create_user(email='hold-farmer@example.com', password='x', role='farmer')
+        self.first = User.objects.create_user(email='hold-first@example.com', password='x', role='consumer')
+        self.second = User.objects.create_user(email='hold-second@example.com', password='x', role='consumer')
+        self.product = Product.objects.create(farmer=farmer, name='Mangoes', quantity=3, price=99, location='Pune')
+
+    def reserved(self):
+        return Product.objects.values_list('reserved_quantity', flat=True).get(pk=self.product.pk)
+
+    def test_the_last_units_are_promised_once(self):
+        reserve(self.first, self.product.pk, 2)
+        with self.assertRaises(InsufficientStockError):
+            reserve(self.second, self.product.pk, 2)
+        reserve(self.second, self.product.pk, 1)
+        self.assertEqual(self.reserved(), 3)
+
+        release(self.first)
+        self.assertEqual(self.reserved(), 1)
+
+    def test_a_cart_is_held_in_the_same_queries_whatever_its_size(self):
+        farmer = self.product.farmer
+        CartItem.objects.create(user=self.first, product=self.product, quantity=1)
+        with CaptureQueriesContext(connection) as one_line:
+            reserve_cart(self.first)
+        for n in range(5):
+            product = Product.objects.create(farmer=farmer, name=f'Plums {n}', quantity=5, price=10, location='Pune')
+            CartItem.objects.create(user=self.first, product=product, quantity=2)
+        StockReservation.objects.all().delete()
+        Product.objects.update(reserved_quantity=0)
+        with CaptureQueriesContext(connection) as six_lines:
+            self.assertEqual(len(reserve_cart(self.first)), 6)
+        self.assertEqual(len(six_lines), len(one_line))
+        self.assertEqual(sum(Product.objects.values_list('reserved_quantity', flat=True)), 11)
+
+    def test_a_short_line_holds_nothing(self):
+        plums = Product.objects.create(farmer=self.product.farmer, name='Plums', quantity=5, price=10, location='Pune')
+        CartItem.objects.create(user=self.first, product=plums, quantity=2)
+        CartItem.objects.create(user=self.first, product=self.product, quantity=4)
+        with self.assertRaises(InsufficientStockError) as raised:
+            reserve_cart(self.first)
+        self.assertEqual(raised.exception.product_ids, {self.product.pk})
+        self.assertEqual(sum(Product.objects.values_list('reserved_quantity', flat=True)), 0)
+
+    def test_expired_holds_go_back_to_stock(self):
+        reserve(self.first, self.product.pk, 2)
+        reserve(self.second, self.product.pk, 1)
+        StockReservation.objects.filter(user=self.first).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(self.reserved(), 1)
+        self.assertEqual(list(StockReservation.objects.values_list('user', flat=True)), [self.second.pk])
+
+    def test_a_hold_refreshed_after_expiring_is_kept(self):
+        reserve(self.first, self.product.pk, 2)
+        expired = timezone.now() - timedelta(seconds=1)
+        StockReservation.objects.update(expires_at=expired)
+        # The shopper reopens checkout before the sweep gets to the row
+        reserve(self.first, self.product.pk, 3)
+
+        self.assertEqual(release_expired(now=expired), 0)
+        self.assertEqual(self.reserved(), 3)
+
+
+def png_bytes(color, size=(1200, 900)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(IMAGE_VARIANTS_SYNC=True)
+class ProductImageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.farmer = User.objects.create_user(email='image-farmer@example.com', password='x', role='farmer')
+
+    def add(self, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(farmer=self.farmer, name=name, quantity=1, price=10, location='Pune',
+                                             image=SimpleUploadedFile(f'{name}.png', data))
+        product.refresh_from_db()
+        return product
+
+    def test_variants_are_built_for_each_size_and_format(self):
+        product = self.add('Pears', png_bytes('green'))
+        variants = product.image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        for variant, width, square in VARIANTS:
+            entry = variants[variant]
+            self.assertEqual(entry['width'], width if not square else min(width, 900))
+            for key in ('webp', 'jpeg'):
+                self.assertTrue(product_image_storage.exists(entry[key]))
+
+    def test_identical_uploads_share_one_file_until_the_last_is_deleted(self):
+        first = self.add('Apples', png_bytes('red'))
+        second = self.add('More apples', png_bytes('red'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_content_addressed(first.image.name))
+        files = {first.image.name} | variant_files(first.image_variants)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(all(product_image_storage.exists(name) for name in files))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(any(product_image_storage.exists(name) for name in files))
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        farmer = User.objects.create_user(email='async-farmer@example.com', password='x', role='farmer')
+        self.shopper = User.objects.create_user(email='async-shopper@example.com', password='x', role='consumer')
+        self.product = Product.objects.create(farmer=farmer, name='Tamarind', quantity=4, price=25,
+                                              location='Pune')
+        self.factory = AsyncRequestFactory()
+
+    def request(self, path, method='get', **extra):
+        request = getattr(self.factory, method)(path, **extra)
+        request.user = self.shopper
+
+        async def auser():
+            return self.shopper
+
+        request.auser = auser
+        return request
+
+    async def test_dashboard_lists_and_revalidates_the_catalogue(self):
+        response = await async_views.consumer_dashboard(self.request('/consumer/dashboard/'))
+        self.assertContains(response, 'Tamarind')
+
+        request = self.request('/consumer/dashboard/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual((await async_views.consumer_dashboard(request)).status_code, 304)
+
+    async def test_searching_and_adding_to_the_cart(self):
+        response = await async_views.consumer_dashboard(self.request('/consumer/dashboard/', data={'q': 'tamar'}))
+        self.assertContains(response, 'Tamarind')
+
+        response = await async_views.add_to_cart(self.request('/cart/add/', method='post'), self.product.pk)
+        self.assertEqual(response.status_code, 302)
+        response = await async_views.view_cart(self.request('/cart/'))
+        self.assertContains(response, 'Tamarind')
+        self.assertEqual(await CartItem.objects.filter(user=self.shopper).acount(), 1)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(email='sales-farmer@example.com', password='x', role='farmer')
+        shopper = User.objects.create_user(email='sales-shopper@example.com', password='x', role='consumer')
+        self.product = Product.objects.create(farmer=self.farmer, name='Jaggery', quantity=50, price=60,
+                                              location='Pune')
+        self.payment = Payment.objects.create(buyer=shopper, amount=180, status='paid')
+        self.order = Order.objects.create(consumer=shopper, payment=self.payment, total_amount=180)
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=3, price=60)
+
+    def farmer_totals(self):
+        return list(FarmerSalesDaily.objects.values_list('units_sold', 'revenue', 'order_count'))
+
+    def test_a_paid_order_is_counted_once(self):
+        self.assertTrue(sync_order_sales(self.order))
+        self.assertFalse(sync_order_sales(self.order))
+        self.assertEqual(self.farmer_totals(), [(3, Decimal('180.00'), 1)])
+        self.assertEqual(list(ProductSalesDaily.objects.values_list('product', 'units_sold')),
+                         [(self.product.pk, 3)])
+
+    def test_a_cancelled_order_leaves_the_rollups(self):
+        sync_order_sales(self.order)
+        self.order.status = 'cancelled'
+        self.assertTrue(sync_order_sales(self.order))
+        self.assertEqual(self.farmer_totals(), [])
+        self.assertFalse(ProductSalesDaily.objects.exists())
+
+    def test_rebuild_matches_the_incremental_rollups(self):
+        sync_order_sales(self.order)
+        incremental = self.farmer_totals()
+        self.assertEqual(rebuild_rollups(), (1, 1))
+        self.assertEqual(self.farmer_totals(), incremental)
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(email='import-farmer@example.com', password='x', role='farmer')
+        Product.objects.create(farmer=self.farmer, name='Garlic', quantity=1, price=5, location='Pune')
+
+    def test_csv_rows_are_upserted_by_name_and_bad_rows_reported(self):
+        data = (
+            'name,description,quantity,price,location\n'
+            'Garlic,Fresh bulbs,40,7.50,Pune\n'
+            'Ginger,,12,9,Nashik\n'
+            'Chillies,,lots,3,Pune\n'
+        ).encode()
+        result = import_products(self.farmer, io.BytesIO(data), 'csv', chunk_size=1)
+        self.assertEqual((result.rows, result.created, result.updated), (3, 1, 1))
+        self.assertEqual([(line, list(errors)) for line, errors in result.errors], [(4, ['quantity'])])
+        self.assertEqual(sorted(Product.objects.values_list('name', 'quantity', 'price')),
+                         [('Garlic', 40, Decimal('7.50')), ('Ginger', 12, Decimal('9.00'))])
+
+    def test_jsonl_rows_are_imported_and_reach_search(self):
+        data = b'{"name": "Turmeric", "quantity": 8, "price": "30", "location": "Sangli"}\nnot json\n'
+        result = import_products(self.farmer, io.BytesIO(data), detect_format('stock.jsonl'))
+        self.assertEqual((result.created, result.error_count), (1, 1))
+        self.assertEqual(result.errors[0][0], 2)
+        self.assertEqual(search_product_ids('turmeric'), list(Product.objects.filter(name='Turmeric')
+                                                              .values_list('pk', flat=True)))
+
+
+class SQLiteProfileConcurrencyTests(SimpleTestCase):
+    """
+    Hammer a file database with concurrent read-then-write transactions, the
+    shape of a checkout, through Django connections configured by the
+    default profile from promptsync.db_profiles.
+    """
+    ALIAS = 'profile_under_test'
+    WORKERS = 8
+    TRANSACTIONS = 50
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with mock.patch.dict(os.environ, {'GREENKART_SQLITE_PATH': ''}):
+            database = database_profile('sqlite', Path(directory.name))
+        self.database = connections.configure_settings({'default': database})['default']
+        self.connect()
+        self.addCleanup(self.disconnect)
+
+        with connections[self.ALIAS].cursor() as cursor:
+            cursor.execute('CREATE TABLE stock (id INTEGER PRIMARY KEY, quantity INTEGER)')
+            cursor.execute('CREATE TABLE sale (id INTEGER PRIMARY KEY, product_id INTEGER)')
+            cursor.executemany('INSERT INTO stock VALUES (%s, %s)', [(i, 1_000_000) for i in range(10)])
+
+    def connect(self):
+        # A connection of this thread's own, outside DATABASES
+        backend = load_backend(self.database['ENGINE'])
+        connections[self.ALIAS] = backend.DatabaseWrapper(self.database, self.ALIAS)
+
+    def disconnect(self):
+        connections[self.ALIAS].close()
+        del connections[self.ALIAS]
+
+    def pragma(self, name):
+        with connections[self.ALIAS].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_the_bundled_database_is_tuned(self):
+        self.assertEqual(connections[self.ALIAS].settings_dict['NAME'].name, 'db.sqlite3')
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        # NORMAL
+        self.assertEqual(self.pragma('synchronous'), 1)
+
+    def test_concurrent_transactions_all_commit(self):
+        committed, errors = [0], []
+        lock = threading.Lock()
+
+        def worker():
+            self.connect()
+            for i in range(self.TRANSACTIONS):
+                try:
+                    with transaction.atomic(using=self.ALIAS), connections[self.ALIAS].cursor() as cursor:
+                        cursor.execute('SELECT quantity FROM stock WHERE id = %s', [i % 10])
+                        quantity = cursor.fetchone()[0]
+                        cursor.execute('UPDATE stock SET quantity = %s WHERE id = %s', [quantity - 1, i % 10])
+                        cursor.execute('INSERT INTO sale (product_id) VALUES (%s)', [i % 10])
+                except OperationalError as exc:
+                    # "database is locked"
+                    with lock:
+                        errors.append(str(exc))
+                else:
+                    with lock:
+                        committed[0] += 1
+            self.disconnect()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        total = self.WORKERS * self.TRANSACTIONS
+        self.assertEqual(errors, [])
+        self.assertEqual(committed[0], total)
+        with connections[self.ALIAS].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*), (SELECT SUM(quantity) FROM stock) FROM sale')
+            # No read-then-write lost an update to a concurrent one
+            self.assertEqual(cursor.fetchone(), (total, 10 * 1_000_000 - total))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def route(self, view, request):
+        """Run ``view`` through the middleware; return (alias read from, response)."""
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            seen['alias'] = self.router.db_for_read(Product)
+            seen['user_alias'] = self.router.db_for_read(User)
+            return view(request)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        # sessions and users are never read from a replica
+        self.assertEqual(seen['user_alias'], 'default')
+        return seen['alias'], response
+
+    def test_read_only_view_reads_from_replica(self):
+        alias, response = self.route(read_from_replica(lambda request: HttpResponse()), self.factory.get('/'))
+        self.assertEqual(alias, 'replica_1')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        # outside the request reads go back to the primary
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_other_views_read_from_primary(self):
+        alias, _ = self.route(lambda request: HttpResponse(), self.factory.get('/'))
+        self.assertEqual(alias, 'default')
+
+    def test_writes_pin_the_shopper_to_the_primary(self):
+        _, response = self.route(lambda request: HttpResponse(), self.factory.post('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        _, response = self.route(writes_to_primary(lambda request: HttpResponse()), self.factory.get('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        alias, _ = self.route(read_from_replica(lambda request: HttpResponse()), request)
+        self.assertEqual(alias, 'default')
+
+    def test_writes_always_go_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_1', 'greenkart'))
+
+
+class AdminPaginatorTests(TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser(email='admin-pages@example.com', password='x')
+        Product.objects.bulk_create(
+            Product(farmer=admin_user, name=f'Pumpkin {n:02}', quantity=1, price=10, location='Pune')
+            for n in range(12)
+        )
+        self.client.force_login(admin_user)
+
+    @mock.patch('greenkart.admin.ESTIMATE_CAP', 3)
+    @mock.patch('greenkart.admin.ProductAdmin.list_per_page', 2)
+    def test_filtered_changelist_pages_past_the_count_cap(self):
+        url = reverse('admin:greenkart_product_changelist')
+        response = self.client.get(url, {'q': 'Pumpkin'})
+        # 2 rows on the page plus ESTIMATE_CAP more: three page links
+        self.assertEqual(response.context['cl'].paginator.num_pages, 3)
+
+        response = self.client.get(url, {'q': 'Pumpkin', 'p': 6})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].paginator.count, 12)
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+
+class QueryPlanAuditTests(TestCase):
+    def test_every_view_uses_indexes(self):
+        # Raises CommandError listing the offending plans
+        call_command('audit_query_plans', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(User.objects.filter(email__startswith='audit-').exists())
+
+    def test_a_whole_index_walk_needs_a_limit(self):
+        audit = AuditCommand(stdout=io.StringIO())
+        audit.verbosity = 1
+        sql = 'SELECT "id" FROM "greenkart_product" ORDER BY "created_at" DESC, "id" DESC'
+        [(label, detail, _)] = audit.check_queries('catalogue', [{'sql': sql}])
+        self.assertEqual(detail, 'SCAN greenkart_product USING COVERING INDEX product_created_id_idx')
+        self.assertEqual(audit.check_queries('catalogue', [{'sql': f'{sql} LIMIT 25'}]), [])
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_generated_marketplace_can_be_benchmarked(self):
+        counts = generate_marketplace(farmers=2, consumers=3, products_per_farmer=5, orders_per_consumer=2)
+        self.assertEqual(counts['Product'], 10)
+        self.assertEqual(counts['Order'], 6)
+
+        results = run_benchmarks(benchmark_sample(), iterations=2, warmup=0, views=['view_cart', 'consumer_orders'])
+        self.assertEqual(sorted(results), ['consumer_orders', 'view_cart'])
+        for result in results.values():
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+    def test_extra_queries_are_a_regression(self):
+        before = {'view_cart': {'status': 200, 'queries': 4, 'p95_ms': 5.0, 'peak_memory_kb': 60.0}}
+        after = {'view_cart': {'status': 200, 'queries': 5, 'p95_ms': 5.5, 'peak_memory_kb': 61.0}}
+        self.assertEqual(compare_results(before, after), ['view_cart: 4 -> 5 queries'])
+        self.assertEqual(compare_results(before, before), [])
+
+
+class NearbyProductTests(TestCase):
+    def setUp(self):
+        farmer = User.objects.create_user(email='near-farmer@example.com', password='x', role='farmer')
+        for name, location in [('Onions', 'Kothrud, Pune'), ('Grapes', 'Nasik'), ('Mangoes', 'Bombay'),
+                               ('Guavas', 'Pimpri'), ('Turnips', 'Nowhere in particular')]:
+            Product.objects.create(farmer=farmer, name=name, description='', quantity=10, price=10, location=location)
+        self.pune = Place.objects.get(name='Pune')
+
+    def test_locations_are_geocoded_from_the_gazetteer(self):
+        self.assertEqual(geocode('pune, maharashtra'), self.pune.pk)
+        self.assertEqual(Product.objects.get(name='Onions').place, self.pune)
+        self.assertEqual(Product.objects.get(name='Grapes').place.name, 'Nashik')
+        self.assertIsNone(Product.objects.get(name='Turnips').place)
+
+    def test_radius_pages_are_nearest_place_first(self):
+        nearby = [pk for distance, pk in places_within(self.pune.latitude, self.pune.longitude, 25)]
+        self.assertEqual(nearby[0], self.pune.pk)
+        self.assertNotIn(Place.objects.get(name='Mumbai').pk, nearby)
+
+        first = nearby_page(self.pune.latitude, self.pune.longitude, 200, page_size=2)
+        self.assertEqual([product.name for product in first], ['Onions', 'Guavas'])
+        rest = nearby_page(self.pune.latitude, self.pune.longitude, 200, cursor=first.next_cursor, page_size=2)
+        self.assertEqual([product.name for product in rest], ['Mangoes', 'Grapes'])
+        self.assertFalse(rest.has_next)
+        self.assertEqual(rest.items[0].distance_km, 120.2)
+
+    def test_nearest_products_widens_the_search(self):
+        names = [product.name for product in nearest_products(self.pune.latitude, self.pune.longitude, count=3)]
+        self.assertEqual(names, ['Onions', 'Guavas', 'Mangoes'])
+
+    def test_a_new_place_is_geocoded_by_every_process(self):
+        self.assertIsNone(geocode('Khandala'))
+        # The table another process built before the write
+        built = geo._place_keys
+        with self.captureOnCommitCallbacks(execute=True):
+            Place.objects.create(name='Khandala', state='Maharashtra', latitude=18.76, longitude=73.37,
+                                 cell=grid_cell(18.76, 73.37))
+        with mock.patch.object(geo, '_place_keys', built):
+            self.assertEqual(geocode('Khandala'), Place.objects.get(name='Khandala').pk)
+
+    def test_load_gazetteer_recounts_places(self):
+        turnips = Product.objects.get(name='Turnips')
+        # Written without save(), so not geocoded yet
+        Product.objects.filter(pk=turnips.pk).update(location='Pune')
+        call_command('load_gazetteer', only_missing=True, stdout=io.StringIO())
+
+        moved = Product.objects.get(pk=turnips.pk)
+        self.assertEqual(moved.place, self.pune)
+        self.assertGreater(moved.updated_at, turnips.updated_at)
+        self.assertEqual(FacetCount.objects.get(facet='place', value=self.pune.pk).count, 2)
+
+
+class CatalogueFacetTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(email='facet-farmer@example.com', password='x', role='farmer', name='Asha')
+        self.consumer = User.objects.create_user(email='facet-consumer@example.com', password='x', role='consumer')
+        self.okra = Product.objects.create(farmer=self.farmer, name='Okra', quantity=5, price=40, location='Pune')
+        self.saffron = Product.objects.create(farmer=self.farmer, name='Saffron', quantity=1, price=900, location='Srinagar')
+
+    def counts(self):
+        return set(FacetCount.objects.values_list('facet', 'value', 'count'))
+
+    def test_counts_follow_saves_deletes_and_sell_outs(self):
+        self.okra.price = 120
+        self.okra.save()
+        Product.objects.filter(pk=self.saffron.pk).update(quantity=0)
+        count_sold_out([self.saffron.pk])
+        incremental = self.counts()
+        self.assertIn(('price', 2, 1), incremental)
+        self.assertIn(('stock', 0, 1), incremental)
+
+        rebuild_facets()
+        self.assertEqual(self.counts(), incremental)
+
+        self.saffron.delete()
+        self.assertEqual(facet_options({})['in_stock'], 1)
+        self.assertEqual(facet_options({})['farmer'], [(self.farmer.pk, 'Asha', 1)])
+
+    def test_dashboard_filters(self):
+        self.client.force_login(self.consumer)
+        Product.objects.filter(pk=self.saffron.pk).update(quantity=0)
+        response = self.client.get(reverse('consumer_dashboard'), {'price': 4, 'in_stock': 1})
+        self.assertEqual(list(response.context['products']), [])
+        response = self.client.get(reverse('consumer_dashboard'), {'price': 4, 'farmer': self.farmer.pk})
+        self.assertEqual(list(response.context['products']), [self.saffron])
+        self.assertIn(('Pune, Maharashtra', 1), [(label, count) for _, label, count in response.context['facets']['place']])
+
+    def test_filtered_searches_use_the_search_index(self):
+        self.client.force_login(self.consumer)
+        # Matched on location, which a name filter would miss
+        for url, key in ((reverse('consumer_dashboard'), 'products'), (reverse('api_products'), None)):
+            response = self.client.get(url, {'q': 'srinag', 'farmer': self.farmer.pk})
+            found = response.context[key] if key else [row['name'] for row in response.json()['results']]
+            self.assertEqual([getattr(product, 'name', product) for product in found], ['Saffron'])
+        _, page = products_near('Pune', 50, query='okr')
+        self.assertEqual(list(page), [self.okra])
+
+    def test_out_of_range_filter_values_are_ignored(self):
+        self.assertEqual(parse_filters({'place': '9' * 20, 'farmer': str(-2 ** 63)}), {'farmer': -2 ** 63})
+        self.client.force_login(self.consumer)
+        for url in (reverse('consumer_dashboard'), reverse('api_products')):
+            self.assertEqual(self.client.get(url, {'place': '9' * 20, 'farmer': '9' * 20}).status_code, 200)
+
+    def test_farmer_forms_save_prices_posted_as_text(self):
+        self.client.force_login(self.farmer)
+        response = self.client.post(reverse('add_product'), {
+            'name': 'Garlic', 'description': 'Fresh', 'quantity': '3', 'price': '75.50', 'location': 'Pune',
+        })
+        self.assertRedirects(response, reverse('farmer_dashboard'), fetch_redirect_response=False)
+        garlic = Product.objects.get(name='Garlic')
+        self.assertEqual(garlic.price_band, 1)
+
+        response = self.client.post(reverse('edit_product', args=[garlic.pk]), {
+            'name': 'Garlic', 'description': 'Fresh', 'price': '300',
+        })
+        self.assertRedirects(response, reverse('farmer_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(Product.objects.get(pk=garlic.pk).price_band, 3)
+        self.assertIn(('price', 3, 1), self.counts())
+
+
+class JsonApiTests(TestCase):
+    def setUp(self):
+        farmer = User.objects.create_user(email='api-farmer@example.com', password='x', role='farmer', name='Ravi')
+        self.consumer = User.objects.create_user(email='api-consumer@example.com', password='pw', role='consumer')
+        self.products = [
+            Product.objects.create(farmer=farmer, name=f'Carrots {n}', description='Crunchy', quantity=5,
+                                   price=20, location='Nashik')
+            for n in range(3)
+        ]
+
+    def test_session_login_needs_the_csrf_cookie(self):
+        client = Client(enforce_csrf_checks=True)
+        self.assertEqual(client.get(reverse('api_products')).status_code, 401)
+        response = client.get(reverse('api_session'))
+        self.assertIsNone(response.json()['user'])
+
+        credentials = {'email': 'api-consumer@example.com', 'password': 'pw'}
+        self.assertEqual(client.post(reverse('api_session'), credentials, content_type='application/json').status_code, 403)
+        response = client.post(reverse('api_session'), credentials, content_type='application/json',
+                               HTTP_X_CSRFTOKEN=client.cookies['csrftoken'].value)
+        self.assertEqual(response.json()['user']['email'], 'api-consumer@example.com')
+
+    def test_sparse_fields_and_cursor_pages(self):
+        self.client.force_login(self.consumer)
+        first = self.client.get(reverse('api_products'), {'fields': 'id,name', 'page_size': 2}).json()
+        self.assertEqual(first['results'], [{'id': self.products[2].pk, 'name': 'Carrots 2'},
+                                            {'id': self.products[1].pk, 'name': 'Carrots 1'}])
+        rest = self.client.get(reverse('api_products'), {'fields': 'id,name', 'cursor': first['next']}).json()
+        self.assertEqual([row['id'] for row in rest['results']], [self.products[0].pk])
+        self.assertIsNone(rest['next'])
+
+        response = self.client.get(reverse('api_products'), {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('price', response.json()['fields'])
+
+    def test_cart_checkout_and_orders(self):
+        self.client.force_login(self.consumer)
+        for product in self.products[:2]:
+            cart = self.client.post(reverse('api_cart'), {'product_id': product.pk}, content_type='application/json').json()
+        self.assertEqual((cart['count'], cart['total']), (2, '40.00'))
+        cart = self.client.delete(reverse('api_cart_item', args=[self.products[1].pk])).json()
+        self.assertEqual(cart['items'], [{'product_id': self.products[0].pk, 'name': 'Carrots 0', 'price': '20.00',
+                                          'quantity': 1, 'line_total': '20.00'}])
+
+        card = {'card_name': 'A', 'card_number': '4242424242424242', 'expiry': '12/30', 'cvv': '123'}
+        response = self.client.post(reverse('api_checkout'), card, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        order_id = response.json()['order']
+        self.assertEqual(self.client.post(reverse('api_checkout'), card).json()['error'], "Cart is empty.")
+
+        orders = self.client.get(reverse('api_orders'), {'fields': 'id,total_amount,payment_status'}).json()
+        self.assertEqual(orders['results'], [{'id': order_id, 'total_amount': '20.00', 'payment_status': 'paid'}])
+        order = self.client.get(reverse('api_order', args=[order_id])).json()
+        self.assertEqual(order['items'], [{'product_id': self.products[0].pk, 'name': 'Carrots 0', 'quantity': 1,
+                                           'price': '20.00'}])
+
+
+class StaticAssetTests(SimpleTestCase):
+    def test_collected_css_is_hashed_precompressed_and_immutable(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, DEBUG=False):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            name = staticfiles_storage.stored_name('greenkart/css/consumer_dashboard.css')
+            self.assertRegex(name, r'^greenkart/css/consumer_dashboard\.[0-9a-f]{12}\.css$')
+            self.assertTrue(staticfiles_storage.exists(name + '.gz'))
+
+            factory = RequestFactory()
+            response = serve_static(factory.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate'), name)
+            self.assertEqual((response['Content-Type'], response['Content-Encoding']), ('text/css', 'gzip'))
+            self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertFalse(serve_static(factory.get('/'), name).has_header('Content-Encoding'))
+
+
+ran_tasks = []
+
+
+@task(name='greenkart.tests.remember')
+def remember(value):
+    ran_tasks.append(value)
+
+
+@task(name='greenkart.tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError("boom")
+
+
+@override_settings(TASKS_EAGER=False, TASK_RETRY_BACKOFF=0)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        ran_tasks.clear()
+
+    def test_tasks_run_by_priority_and_are_deleted(self):
+        enqueue(remember, value='low')
+        enqueue(remember, priority=10, value='high')
+        enqueue(remember, delay=60, value='later')
+
+        self.assertEqual(Worker().run(burst=True), 2)
+        self.assertEqual(ran_tasks, ['high', 'low'])
+        self.assertEqual(list(Task.objects.values_list('kwargs', flat=True)), [{'value': 'later'}])
+
+    def test_failing_task_is_retried_then_marked_failed(self):
+        enqueue(explode)
+        with self.assertLogs('greenkart.taskqueue', 'ERROR') as logs:
+            Worker().run(burst=True)
+        self.assertEqual(len(logs.records), 2)
+
+        failed = Task.objects.get()
+        self.assertEqual((failed.status, failed.attempts), ('failed', 2))
+        self.assertIn('RuntimeError: boom', failed.last_error)
+
+    def test_claimed_task_is_hidden_until_its_visibility_timeout(self):
+        enqueue(remember, value='once')
+        claimed = claim('worker-a')
+        self.assertIsNone(claim('worker-b'))
+
+        # worker-a died; its timeout passes
+        Task.objects.filter(pk=claimed.pk).update(run_at=claimed.created_at)
+        self.assertEqual(claim('worker-b').pk, claimed.pk)
+
+    def test_late_finish_leaves_a_task_taken_over_by_another_worker(self):
+        enqueue(remember, value='slow')
+        late = claim('worker-a')
+        Task.objects.filter(pk=late.pk).update(run_at=late.created_at)
+        claim('worker-b')
+
+        self.assertTrue(run(late))
+        self.assertEqual(Task.objects.get().locked_by, 'worker-b')
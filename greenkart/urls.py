@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, views
+
+# Under ASGI the busiest shopper views are served by their async versions
+shop = async_views if settings.GREENKART_ASYNC_VIEWS else views
 
 urlpatterns = [
     # Authentication
@@ -8,20 +12,33 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
 
     # Consumer routes
-    path('consumer/dashboard/', views.consumer_dashboard, name='consumer_dashboard'),
-    path('cart/', views.view_cart, name='view_cart'),
-    path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
+    path('consumer/dashboard/', shop.consumer_dashboard, name='consumer_dashboard'),
+    path('cart/', shop.view_cart, name='view_cart'),
+    path('cart/add/<int:product_id>/', shop.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('order/place/', views.place_order, name='place_order'),
 
     # Farmer routes
     path('farmer/dashboard/', views.farmer_dashboard, name='farmer_dashboard'),
+    path('farmer/analytics/', views.farmer_analytics, name='farmer_analytics'),
     path('farmer/edit_product/<int:product_id>/', views.edit_product, name='edit_product'),
     path('farmer/product/add/', views.add_product, name='add_product'),
+    path('farmer/product/import/', views.import_products_view, name='import_products'),
     path('farmer/product/delete/<int:product_id>/', views.delete_product, name='delete_product'),
 
     path('checkout/', views.checkout, name='checkout'),
     path('payment/process/', views.process_payment, name='process_payment'),
     path('payment/success/<str:txid>/', views.payment_success, name='payment_success'),
-    path('orders/', views.consumer_orders, name='consumer_orders'),
+    path('ledger/<str:kind>.<str:fmt>', views.export_ledger, name='export_ledger'),
+    path('orders/', shop.consumer_orders, name='consumer_orders'),
+
+    # JSON API for the mobile app (see greenkart.api)
+    path('api/v1/session/', api.session, name='api_session'),
+    path('api/v1/products/', api.products, name='api_products'),
+    path('api/v1/products/<int:product_id>/', api.product_detail, name='api_product'),
+    path('api/v1/cart/', api.cart, name='api_cart'),
+    path('api/v1/cart/<int:product_id>/', api.cart_item, name='api_cart_item'),
+    path('api/v1/checkout/', api.checkout, name='api_checkout'),
+    path('api/v1/orders/', api.orders, name='api_orders'),
+    path('api/v1/orders/<int:order_id>/', api.order_detail, name='api_order'),
 ]
@@ -1,8 +1,28 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import Http404, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from .forms import SignupForm
-from .models import User, Product, CartItem, Order
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from . import conditional
+from .analytics import farmer_sales
+from .cart import add_item, cart_count, price_cart, remove_item
+from .checkout import CheckoutError, pay_and_place_order, place_order as place_cart_order
+from .exceptions import InsufficientStockError
+from . import exports
+from .facets import facet_options, filter_products, parse_filters
+from .forms import LedgerExportForm, SignupForm
+from .geo import NEAR_RADII_KM, clamp_radius, products_near
+from .imports import FORMATS, detect_format, import_products
+from .models import Product, CartItem, Order, Payment
+from .pagination import clamp_page_size, keyset_paginate, page_query
+from .reservations import release, reserve_cart
+from .routers import read_from_replica, writes_to_primary
+from .search import filter_matching, search_page
 
 
 # ---------------------------
@@ -40,6 +60,7 @@ def login_view(request):
     return render(request, 'greenkart/login.html')
 
 
+@writes_to_primary
 def logout_view(request):
     logout(request)
     return redirect('login')
@@ -48,50 +69,78 @@ def logout_view(request):
 # ---------------------------
 # CONSUMER DASHBOARD
 # ---------------------------
+@read_from_replica
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=conditional.consumer_dashboard_etag)
 def consumer_dashboard(request):
-    products = Product.objects.all()
-    cart_count = CartItem.objects.filter(user=request.user).count()
+    query = request.GET.get('q', '').strip()
+    cursor = request.GET.get('cursor')
+    page_size = clamp_page_size(request.GET.get('page_size'))
+    near = request.GET.get('near', '').strip()
+    radius = clamp_radius(request.GET.get('radius'))
+    filters = parse_filters(request.GET)
+    products = filter_products(Product.objects.all(), filters)
+    place = None
+
+    if near:
+        # nearest places first; the search term only narrows them
+        place, page = products_near(near, radius, query=query, cursor=cursor, page_size=page_size, queryset=products)
+    elif query and filters:
+        # ranked search can't be combined with filters; newest first instead
+        page = keyset_paginate(filter_matching(products, query), cursor=cursor, page_size=page_size)
+    elif query:
+        page = search_page(query, cursor=cursor, page_size=page_size)
+    else:
+        page = keyset_paginate(products, cursor=cursor, page_size=page_size)
+
+    context = {
+        'page': page, 'query': query, 'near': near, 'radius': radius, 'place': place, 'filters': filters,
+        'page_query': page_query(request.GET),
+    }
+    # "Load more" requests only need the next batch of cards
+    if request.GET.get('fragment'):
+        return render(request, 'greenkart/_product_cards.html', context)
+
     return render(request, 'greenkart/consumer_dashboard.html', {
-        'products': products,
-        'cart_count': cart_count
+        **context,
+        'products': page.items,
+        'radii': NEAR_RADII_KM,
+        'facets': facet_options(filters),
+        'cart_count': cart_count(request.user)
     })
 
 
 # ---------------------------
 # CART OPERATIONS
 # ---------------------------
+@writes_to_primary
 @login_required
 def add_to_cart(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    cart_item, created = CartItem.objects.get_or_create(user=request.user, product=product)
-
-    if not created:
-        cart_item.quantity = min(cart_item.quantity + 1, product.quantity)
-    cart_item.save()
+    product = get_object_or_404(Product.objects.only('id', 'quantity'), id=product_id)
+    # cached; written back to CartItem in batches (see greenkart.cart)
+    add_item(request.user, product.id, max_quantity=product.quantity)
 
     return redirect(request.META.get('HTTP_REFERER', 'consumer_dashboard'))
 
 
+@login_required
 def view_cart(request):
-    cart_items = CartItem.objects.filter(user=request.user)
-    total = 0
-    for item in cart_items:
-        item.line_total = item.product.price * item.quantity  # add field for template
-        total += item.line_total
-
+    cart = price_cart(request.user)
     return render(request, 'greenkart/cart.html', {
-        'cart_items': cart_items,
-        'total': total
+        'cart_items': cart.items,
+        'total': cart.total
     })
 
 
 
 
+@writes_to_primary
 @login_required
 def remove_from_cart(request, item_id):
     item = get_object_or_404(CartItem, id=item_id, user=request.user)
-    item.delete()
+    remove_item(request.user, item.product_id)
+    release(request.user, product_ids=[item.product_id])
     messages.info(request, "Item removed from cart.")
     return redirect('view_cart')
 
@@ -99,28 +148,48 @@ def remove_from_cart(request, item_id):
 # ---------------------------
 # PLACE ORDER
 # ---------------------------
+@writes_to_primary
 @login_required
 def place_order(request):
-    cart_items = CartItem.objects.filter(user=request.user)
-    if not cart_items.exists():
+    try:
+        place_cart_order(request.user)
+    except CheckoutError:
         return redirect('consumer_dashboard')
-
-    for item in cart_items:
-        Order.objects.create(
-            buyer=request.user,
-            product=item.product,
-            quantity=item.quantity,
-            total_price=item.product.price * item.quantity,
-            status='pending'
-        )
-    cart_items.delete()
     return render(request, 'greenkart/order_success.html')
 
 
+# ---------------------------
+# LEDGER EXPORT (staff)
+# ---------------------------
+@read_from_replica
+@login_required
+def export_ledger(request, kind, fmt):
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    if kind not in exports.LEDGERS or fmt not in exports.FORMATS:
+        raise Http404
+
+    form = LedgerExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    # Rows are read while the response streams, after the middleware is
+    # done, so the database is chosen here
+    rows = exports.ledger_rows(kind, using=router.db_for_read(Order), **form.cleaned_data)
+    stream = exports.astream_ledger if isinstance(request, ASGIRequest) else exports.stream_ledger
+    response = StreamingHttpResponse(stream(kind, fmt, rows), content_type=exports.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="greenkart-{kind}.{fmt}"'
+    return response
+
+
 # ---------------------------
 # FARMER DASHBOARD
 # ---------------------------
+@read_from_replica
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=conditional.farmer_dashboard_etag,
+           last_modified_func=conditional.farmer_dashboard_last_modified)
 def farmer_dashboard(request):
     if request.user.role != 'farmer':
         return redirect('login')
@@ -129,6 +198,31 @@ def farmer_dashboard(request):
     return render(request, 'greenkart/farmer_dashboard.html', {'products': products})
 
 
+ANALYTICS_PERIODS = (7, 30, 90)
+
+
+@read_from_replica
+@login_required
+def farmer_analytics(request):
+    if request.user.role != 'farmer':
+        return redirect('login')
+
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in ANALYTICS_PERIODS:
+        days = 30
+
+    # Reads the daily rollups: at most one row per day plus one per product
+    sales = farmer_sales(request.user, days=days)
+    return render(request, 'greenkart/farmer_analytics.html', {
+        'sales': sales,
+        'days': days,
+        'periods': ANALYTICS_PERIODS,
+    })
+
+
 @login_required
 def add_product(request):
     if request.user.role != 'farmer':
@@ -156,14 +250,31 @@ def add_product(request):
     return render(request, 'greenkart/add_product.html')
 
 
+@login_required
+def import_products_view(request):
+    if request.user.role != 'farmer':
+        return redirect('login')
+
+    result = None
+    if request.method == 'POST' and request.FILES.get('file'):
+        upload = request.FILES['file']
+        fmt = request.POST.get('format')
+        if fmt not in FORMATS:
+            fmt = detect_format(upload.name)
+        # Uploads over FILE_UPLOAD_MAX_MEMORY_SIZE are already spooled to a
+        # temporary file, which is read from row by row
+        result = import_products(request.user, upload.file, fmt=fmt)
+
+    return render(request, 'greenkart/import_products.html', {'result': result})
+
+
+@writes_to_primary
 @login_required
 def delete_product(request, product_id):
     product = get_object_or_404(Product, id=product_id, farmer=request.user)
     product.delete()
     return redirect('farmer_dashboard')
 
-from django.shortcuts import render, get_object_or_404, redirect
-from .models import Product
 
 def edit_product(request, product_id):
     product = get_object_or_404(Product, id=product_id)
@@ -177,32 +288,26 @@ def edit_product(request, product_id):
         return redirect('farmer_dashboard')
 
     return render(request, 'greenkart/edit_product.html', {'product': product})
-from decimal import Decimal
-from django.db import transaction
-from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
-from django.urls import reverse
-from .models import CartItem, Order, Product, Payment
-import uuid
+
 
 # Show checkout page (cart review + dummy payment form)
+@writes_to_primary
 @login_required
 def checkout(request):
-    cart_items = CartItem.objects.filter(user=request.user)
-    if not cart_items.exists():
+    cart = price_cart(request.user)
+    if not cart:
         return redirect('consumer_dashboard')
 
-    # compute per-line and total
-    total = Decimal('0.00')
-    for item in cart_items:
-        item.line_total = (item.product.price * item.quantity).quantize(Decimal('0.01'))
-        total += item.line_total
-
-    total = total.quantize(Decimal('0.01'))
+    # hold the stock while the shopper fills in the payment form
+    try:
+        reserve_cart(request.user)
+    except InsufficientStockError:
+        messages.error(request, "Some items in your cart are no longer available in that quantity.")
+        return redirect('view_cart')
 
     return render(request, 'greenkart/checkout.html', {
-        'cart_items': cart_items,
-        'total': total
+        'cart_items': cart.items,
+        'total': cart.total
     })
 
 # Process (simulate) payment — POST request
@@ -221,50 +326,16 @@ def process_payment(request):
         # invalid — you can use messages framework or redirect with error
         return redirect('checkout')
 
-    cart_items = CartItem.objects.filter(user=request.user)
-    if not cart_items.exists():
+    cart = price_cart(request.user)
+    if not cart:
         return redirect('consumer_dashboard')
 
-    # compute total
-    total = Decimal('0.00')
-    for item in cart_items:
-        item.line_total = (item.product.price * item.quantity).quantize(Decimal('0.01'))
-        total += item.line_total
-    total = total.quantize(Decimal('0.01'))
-
-    # create payment record (pending -> then paid)
-    txid = uuid.uuid4().hex
-    payment = Payment.objects.create(
-        transaction_id=txid,
-        buyer=request.user,
-        amount=total,
-        status='pending',
-        method='dummy-card',
-        notes=f'Card ending {card_number[-4:]}'
-    )
-
-    # simulate processing — always success in dummy gateway
-    # wrap order creation + payment update in atomic transaction
+    # The pending payment, the order, its items, the stock updates and the
+    # paid payment are written by the checkout pipeline; a failed checkout
+    # leaves the payment marked failed.
     try:
-        with transaction.atomic():
-            payment.status = 'paid'
-            payment.save()
-
-            # create orders, one per cart item
-            for item in cart_items:
-                Order.objects.create(
-                    buyer=request.user,
-                    product=item.product,
-                    quantity=item.quantity,
-                    total_price=item.product.price * item.quantity,
-                    status='pending'
-                )
-            # clear cart
-            cart_items.delete()
-    except Exception as e:
-        payment.status = 'failed'
-        payment.save()
-        # optionally log e
+        order, payment = pay_and_place_order(request.user, cart.total, card_number)
+    except CheckoutError:
         return redirect('checkout')
 
     # success
@@ -272,17 +343,20 @@ def process_payment(request):
 
 
 # Payment success view
+@read_from_replica
 @login_required
 def payment_success(request, txid):
     payment = get_object_or_404(Payment, transaction_id=txid, buyer=request.user)
     return render(request, 'greenkart/payment_success.html', {
         'payment': payment
     })
-from django.contrib.auth.decorators import login_required
-from django.shortcuts import render
-from .models import Order
 
+
+@read_from_replica
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=conditional.consumer_orders_etag,
+           last_modified_func=conditional.consumer_orders_last_modified)
 def consumer_orders(request):
-    orders = Order.objects.filter(consumer=request.user).order_by('-created_at')
+    orders = Order.objects.filter(consumer=request.user).select_related('payment').order_by('-created_at')
     return render(request, 'greenkart/orders.html', {'orders': orders})
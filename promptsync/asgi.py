@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'promptsync.settings')
+# Serve the async versions of the shopper views (greenkart/async_views.py)
+os.environ.setdefault('GREENKART_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
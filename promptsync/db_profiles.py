@@ -0,0 +1,116 @@
+"""
+Database profiles for promptsync.settings.
+
+GREENKART_DB_PROFILE selects one:
+
+* ``sqlite`` (default): the bundled db.sqlite3 (or the file named by
+  GREENKART_SQLITE_PATH, e.g. a benchmark or production database), tuned
+  for concurrent requests. WAL lets readers run alongside the single writer
+  (synchronous=NORMAL is durable across application crashes with WAL),
+  busy_timeout makes writers queue instead of failing with "database is
+  locked", and IMMEDIATE transactions take the write lock up front so two
+  read-then-write transactions can never deadlock on a lock upgrade.
+  Connections are kept open between requests. The -wal/-shm files beside
+  the database are git-ignored; SQLite checkpoints the WAL back into the
+  database file and removes them when the last connection closes, so a
+  stopped server leaves a complete db.sqlite3 behind.
+* ``postgres``: PostgreSQL configured from PG* environment variables, with
+  psycopg's connection pool (GREENKART_DB_POOL=0 falls back to persistent
+  connections).
+
+GREENKART_DB_REPLICAS adds read replicas (see greenkart/routers.py): a
+comma-separated list of SQLite files for the sqlite profile, or of hosts
+for postgres. Locally, ``manage.py sync_replicas`` copies db.sqlite3 into
+the replica files to stand in for replication.
+"""
+import os
+
+WAL_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+)
+SQLITE_PRAGMAS = (
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-64000',
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def sqlite_database(path, replica=False):
+    if replica:
+        # Replicas are only read through Django; refuse stray writes. Their
+        # journal mode is whatever sync_replicas copied from the primary.
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': path,
+            'CONN_MAX_AGE': _env_int('GREENKART_DB_CONN_MAX_AGE', 600),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': ';'.join(SQLITE_PRAGMAS + ('PRAGMA query_only=ON',)),
+                'timeout': 5,
+            },
+            'TEST': {'MIRROR': 'default'},
+        }
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'CONN_MAX_AGE': _env_int('GREENKART_DB_CONN_MAX_AGE', 600),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(WAL_PRAGMAS + SQLITE_PRAGMAS),
+            'transaction_mode': 'IMMEDIATE',
+            # seconds; the Python driver's own wait on a locked database
+            'timeout': 5,
+        },
+    }
+
+
+def postgres_database(host=None):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('PGDATABASE', 'greenkart'),
+        'USER': os.environ.get('PGUSER', 'greenkart'),
+        'PASSWORD': os.environ.get('PGPASSWORD', ''),
+        'HOST': host or os.environ.get('PGHOST', 'localhost'),
+        'PORT': os.environ.get('PGPORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if os.environ.get('GREENKART_DB_POOL', '1') == '1':
+        # The pool owns connection lifetime, so CONN_MAX_AGE must stay 0
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': _env_int('GREENKART_DB_POOL_MIN', 2),
+            'max_size': _env_int('GREENKART_DB_POOL_MAX', 20),
+            'timeout': _env_int('GREENKART_DB_POOL_TIMEOUT', 10),
+        }
+    else:
+        database['CONN_MAX_AGE'] = _env_int('GREENKART_DB_CONN_MAX_AGE', 600)
+    return database
+
+
+def database_profile(name, base_dir):
+    if name == 'postgres':
+        return postgres_database()
+    if name == 'sqlite':
+        return sqlite_database(os.environ.get('GREENKART_SQLITE_PATH') or base_dir / 'db.sqlite3')
+    raise ValueError(f"Unknown GREENKART_DB_PROFILE {name!r}; expected 'sqlite' or 'postgres'")
+
+
+def replica_databases(name, base_dir):
+    """Return {alias: settings} for the replicas listed in GREENKART_DB_REPLICAS."""
+    locations = [value.strip() for value in os.environ.get('GREENKART_DB_REPLICAS', '').split(',') if value.strip()]
+    replicas = {}
+    for number, location in enumerate(locations, start=1):
+        if name == 'postgres':
+            database = postgres_database(host=location)
+            database['TEST'] = {'MIRROR': 'default'}
+        else:
+            database = sqlite_database(base_dir / location, replica=True)
+        replicas[f'replica_{number}'] = database
+    return replicas
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from .db_profiles import database_profile, replica_databases
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -40,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'greenkart.metrics.RequestMetricsMiddleware',
+    'greenkart.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,7 +57,8 @@ ROOT_URLCONF = 'promptsync.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Stock Django templates, with render time reported to /metrics
+        'BACKEND': 'greenkart.metrics.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -72,13 +77,53 @@ WSGI_APPLICATION = 'promptsync.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Tuned SQLite by default; GREENKART_DB_PROFILE=postgres for PostgreSQL
+# with a connection pool. GREENKART_DB_REPLICAS adds read replicas. See
+# promptsync/db_profiles.py.
+
+DB_PROFILE = os.environ.get('GREENKART_DB_PROFILE', 'sqlite')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_profile(DB_PROFILE, BASE_DIR),
+    **replica_databases(DB_PROFILE, BASE_DIR),
 }
 
+# Read-only views read from a replica; see greenkart/routers.py
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['greenkart.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Production needs a cache shared by every worker: set GREENKART_CACHE_URL
+# to a redis:// URL, or GREENKART_CACHE_DIR for a file cache on a single
+# host. The default per-process memory cache is only suitable for
+# runserver.
+
+if os.environ.get('GREENKART_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['GREENKART_CACHE_URL'],
+        }
+    }
+elif os.environ.get('GREENKART_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['GREENKART_CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'greenkart',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,8 +166,25 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / "greenkart" / "static"]
 
+# Let Django serve static files itself (with Cache-Control) when no web
+# server sits in front of the app, e.g. under uvicorn or gunicorn
+SERVE_STATIC = os.environ.get('GREENKART_SERVE_STATIC', '1' if DEBUG else '0') == '1'
+# Static files without a content hash in their name (hashed ones, written
+# by collectstatic, are served as immutable)
+STATIC_CACHE_MAX_AGE = 24 * 60 * 60
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # Fingerprinted names plus gzip/brotli copies; see greenkart.storage
+    'staticfiles': {'BACKEND': 'greenkart.storage.PrecompressedManifestStaticFilesStorage'},
+}
+# Media without a content hash in its name (content-addressed media is
+# always served as immutable)
+MEDIA_CACHE_MAX_AGE = 24 * 60 * 60
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -130,3 +192,43 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# GreenKart
+# How long (seconds) stock stays held for a shopper who opened checkout
+STOCK_RESERVATION_TTL = 15 * 60
+# Build product image variants inline after commit instead of on the
+# background pool (useful for tests and management commands)
+IMAGE_VARIANTS_SYNC = False
+
+# Cached carts: keep adds in the cache and write them back to CartItem once
+# a line has this many pending, or once the oldest pending add is this many
+# seconds old. The cache must not evict them: Redis needs
+# maxmemory-policy noeviction, and MAX_ENTRIES above leaves room for every
+# open cart. GREENKART_CART_WRITE_BEHIND=0 writes every add through.
+CART_WRITE_BEHIND = os.environ.get('GREENKART_CART_WRITE_BEHIND', '1') == '1'
+CART_WRITE_BEHIND_BATCH = 10
+CART_WRITE_BEHIND_DELAY = 30
+CART_CACHE_TIMEOUT = 24 * 60 * 60
+# Rendered product cards are cached this long (seconds); an edit to the
+# product moves its card to a new key (see greenkart/fragments.py)
+CARD_FRAGMENT_TIMEOUT = 24 * 60 * 60
+# After a write, keep the shopper's reads on the primary database for this
+# many seconds so they see their own changes while replicas catch up
+REPLICA_PIN_SECONDS = 10
+# Route the shopper views to their async versions; promptsync/asgi.py turns
+# this on, WSGI keeps the synchronous views
+GREENKART_ASYNC_VIEWS = os.environ.get('GREENKART_ASYNC_VIEWS', '0') == '1'
+# Addresses (REMOTE_ADDR) of the Prometheus scrapers allowed to read /metrics
+# without a staff login, comma-separated
+METRICS_ALLOWED_IPS = [address.strip() for address in os.environ.get('GREENKART_METRICS_ALLOWED_IPS', '').split(',')
+                       if address.strip()]
+# Background tasks (greenkart/taskqueue.py), run by manage.py run_task_worker.
+# TASKS_EAGER runs them in-process after commit instead, e.g. when no
+# worker is running in development
+TASKS_EAGER = os.environ.get('GREENKART_TASKS_EAGER', '0') == '1'
+# Seconds a worker has to finish a task before another worker may take it
+TASK_VISIBILITY_TIMEOUT = 5 * 60
+# Retry delay in seconds: doubles with every failed attempt, up to the max
+TASK_RETRY_BACKOFF = 10
+TASK_RETRY_BACKOFF_MAX = 60 * 60